@@ -0,0 +1,77 @@
+"""Проверка ответов аудио-челленджа: прежнее сравнение strip().lower() против нормализованных ключей
+с ограниченным расстоянием Левенштейна.
+
+python -m benchmarks.audio_grading [--submissions 10000]
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import benchmark_database
+
+from challenges import answer_matching
+from challenges.models import AudioChallenge, AudioQuestion
+
+ANSWERS = ['Бетховен', 'Пётр Ильич Чайковский', 'Римский-Корсаков', 'Вивальди', 'Шопен', 'Рахманинов',
+           'Лунная соната', 'Полёт шмеля', 'Времена года', 'Щелкунчик']
+
+
+def legacy_grade(questions, answers):
+    """Проверка в том виде, в каком она была во view."""
+    correct = 0
+    for question in questions:
+        if answers.get(question.id, '').strip().lower() == question.correct_answer.lower():
+            correct += 1
+    return correct
+
+
+def typo(text, rng):
+    position = rng.randrange(len(text))
+    return text[:position] + text[position + 1:]
+
+
+def make_submissions(questions, count, rng):
+    """Смесь точных ответов, ответов с ё/регистром/пунктуацией, опечаток и промахов."""
+    variants = [
+        lambda answer: answer,
+        lambda answer: f'  {answer.upper().replace("Ё", "Е")}!',
+        lambda answer: typo(answer, rng),
+        lambda answer: rng.choice(ANSWERS),
+    ]
+    return [
+        {question.id: rng.choice(variants)(question.correct_answer) for question in questions}
+        for _ in range(count)
+    ]
+
+
+def run(label, grade, questions, submissions):
+    started = time.perf_counter()
+    correct = sum(grade(questions, submission) for submission in submissions)
+    elapsed = time.perf_counter() - started
+    total = len(questions) * len(submissions)
+    print(f"{label:<40} {elapsed * 1000:9.1f} мс  {elapsed / len(submissions) * 1e6:7.1f} мкс/попытка  "
+          f"засчитано {correct / total:6.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--submissions', type=int, default=10_000)
+    parser.add_argument('--questions', type=int, default=10)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        challenge = AudioChallenge.objects.create(title='Bench')
+        for order in range(args.questions):
+            AudioQuestion.objects.create(
+                audio_challenge=challenge, correct_answer=ANSWERS[order % len(ANSWERS)], order=order
+            )
+        questions = list(challenge.questions.all())
+        submissions = make_submissions(questions, args.submissions, random.Random(0))
+        print(f"{len(submissions)} попыток по {len(questions)} вопросов")
+
+        run('strip().lower() (как было)', legacy_grade, questions, submissions)
+        run('answer_matching.grade', answer_matching.grade, questions, submissions)
+
+
+if __name__ == '__main__':
+    main()
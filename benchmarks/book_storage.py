@@ -0,0 +1,113 @@
+"""Хранение текста книг: размер в базе и память на странице со списком книг,
+несжатый TEXT (как было) против сжатого CompressedTextField с отложенной загрузкой.
+
+Сигналы подключены, как в работе: вместе с книгой пишутся страницы (BookPage.html, тоже zlib)
+и поисковый индекс (SearchEntry + FTS5: начало текста для сниппетов и словарь остального, несжатые).
+
+python -m benchmarks.book_storage [--books 50 --chars 500000]
+"""
+import argparse
+import random
+import tracemalloc
+
+from benchmarks.common import benchmark_database, measure
+
+from django.contrib.auth.models import User
+from django.db import connection
+
+from challenges import search
+from challenges.models import Book, BookPage, Challenge
+
+WORDS = ('и в не на он что с как а то она я но его все так к было её у же за они мне бы от '
+         'сказал князь теперь время глаза рука дом человек говорил жизнь день дверь молча').split()
+LEGACY_TABLE = 'bench_legacy_book'
+LEGACY_PAGES_TABLE = 'bench_legacy_bookpage'
+
+
+def make_text(chars, rng):
+    words = []
+    length = 0
+    while length < chars:
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 15))).capitalize() + '.'
+        words.append(sentence)
+        length += len(sentence) + 1
+    return ' '.join(words)
+
+
+def table_size(pattern):
+    """Размер таблиц (с их индексами), имя которых подходит под LIKE-шаблон."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT SUM(pgsize) FROM dbstat WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name LIKE %s)',
+            [pattern],
+        )
+        return cursor.fetchone()[0] or 0
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--books', type=int, default=50)
+    parser.add_argument('--chars', type=int, default=500_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        user = User.objects.create_user(username='bench')
+        challenge = Challenge.objects.create(
+            title='Bench', description='', creator=user, start_date='2025-01-01', end_date='2025-02-01'
+        )
+        rng = random.Random(0)
+        texts = [make_text(args.chars, rng) for _ in range(args.books)]
+        for i, text in enumerate(texts):
+            # save(), а не bulk_create: страницы и поисковый индекс пишут сигналы
+            Book.objects.create(title=f'Книга {i}', author='Автор', description='', full_text=text, challenge=challenge)
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE TABLE {LEGACY_TABLE} (id integer PRIMARY KEY, title text, full_text text)')
+            cursor.executemany(
+                f'INSERT INTO {LEGACY_TABLE} (title, full_text) VALUES (%s, %s)',
+                [(f'Книга {i}', text) for i, text in enumerate(texts)],
+            )
+            cursor.execute(f'CREATE TABLE {LEGACY_PAGES_TABLE} (id integer PRIMARY KEY, book_id integer, number integer, html text)')
+            cursor.executemany(
+                f'INSERT INTO {LEGACY_PAGES_TABLE} (book_id, number, html) VALUES (%s, %s, %s)',
+                BookPage.objects.values_list('book_id', 'number', 'html').iterator(),
+            )
+
+        sizes = [
+            ('Книги', table_size(LEGACY_TABLE), table_size(Book._meta.db_table)),
+            ('Страницы (BookPage.html)', table_size(LEGACY_PAGES_TABLE), table_size(BookPage._meta.db_table)),
+            ('Поиск: SearchEntry', table_size(search.ENTRY_TABLE), table_size(search.ENTRY_TABLE)),
+            ('Поиск: FTS5', table_size(f'{search.FTS_TABLE}%'), table_size(f'{search.FTS_TABLE}%')),
+        ]
+        sizes.append(('Всего', sum(row[1] for row in sizes), sum(row[2] for row in sizes)))
+        print(f"{args.books} книг по {args.chars:,} символов")
+        print(f"{'':<28} {'TEXT (как было)':>16} {'zlib':>10}")
+        for label, legacy_size, compressed_size in sizes:
+            print(f"{label:<28} {legacy_size / 2**20:13.1f} МБ {compressed_size / 2**20:7.1f} МБ"
+                  f"  ({compressed_size / legacy_size:.0%})")
+
+        def legacy_list():
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT id, title, full_text FROM {LEGACY_TABLE}')
+                return cursor.fetchall()
+
+        def book_list():
+            return list(Book.objects.filter(challenge=challenge))
+
+        print(f"{'Память списка, TEXT (как было)':<40} {peak_memory(legacy_list) / 2**20:9.1f} МБ")
+        print(f"{'Память списка, defer(full_text)':<40} {peak_memory(book_list) / 2**20:9.1f} МБ")
+        measure('Список книг, TEXT (как было)', legacy_list, args.repeat)
+        measure('Список книг, defer(full_text)', book_list, args.repeat)
+        measure('Книга с текстом, defer(None)', lambda: Book.objects.defer(None).get(title='Книга 0').full_text, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
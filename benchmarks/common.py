@@ -0,0 +1,51 @@
+"""Общая обвязка для бенчмарков: Django на отдельной тестовой базе и замер времени.
+
+Запуск из корня проекта: python -m benchmarks.<имя>
+"""
+import os
+import time
+from contextlib import contextmanager
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+
+@contextmanager
+def benchmark_database():
+    """Создаём тестовую базу (рабочая db.sqlite3 не трогается) и удаляем её после замеров."""
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def measure(label, func, repeat):
+    """Запускаем func repeat раз и печатаем среднее время и число запросов на вызов.
+
+    Запросы считаем обёрткой выполнения, а не CaptureQueriesContext: connection.queries_log
+    ограничен 9000 записями, и на длинных замерах его длина перестаёт расти.
+    """
+    executed = 0
+
+    def count(execute, sql, params, many, context):
+        nonlocal executed
+        executed += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        elapsed = time.perf_counter() - started
+    per_call = elapsed / repeat * 1000
+    print(f"{label:<40} {per_call:9.3f} мс/вызов  {executed / repeat:6.1f} запросов/вызов")
+    return elapsed
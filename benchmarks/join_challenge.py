@@ -0,0 +1,97 @@
+"""Присоединение к челленджу: get_or_create и две проверки типа против Challenge.kind и INSERT ... ON CONFLICT.
+
+Запуск новой волны: несколько потоков одновременно присоединяют разных пользователей к одному челленджу.
+База для замера — файл SQLite (а не память), чтобы у каждого потока было своё соединение.
+
+python -m benchmarks.join_challenge [--users 2000] [--threads 8]
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import benchmark_database, measure
+
+from django.contrib.auth.models import User
+from django.db import connection, connections
+
+from challenges import participation
+from challenges.models import AudioChallenge, Challenge, Participant, Quiz
+
+
+def legacy_join(user, challenge_id):
+    """join_challenge в том виде, в каком он был (без сообщений и редиректа)."""
+    challenge = Challenge.objects.get(id=challenge_id)
+    _, created = Participant.objects.get_or_create(user=user, challenge=challenge)
+    if AudioChallenge.objects.filter(challenge=challenge).exists():
+        return 'audio_challenge_list', created
+    if challenge.quizzes.exists():
+        return 'quiz_list', created
+    return 'book_selection', created
+
+
+def keyed_join(user, challenge_id):
+    challenge = Challenge.objects.only('id', 'title', 'kind').get(id=challenge_id)
+    return participation.JOIN_REDIRECTS[challenge.kind], participation.join(user.id, challenge.id)
+
+
+def launch(join, users, challenge_id, threads):
+    """Все пользователи присоединяются одновременно; возвращаем время и число ошибок."""
+    errors = []
+
+    def worker(batch):
+        try:
+            for user in batch:
+                try:
+                    join(user, challenge_id)
+                except Exception as exc:
+                    errors.append(exc)
+        finally:
+            connections.close_all()
+
+    batches = [users[i::threads] for i in range(threads)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(worker, batches))
+    return time.perf_counter() - started, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(directory, 'join_benchmark.sqlite3')
+    with benchmark_database():
+        creator = User.objects.create_user(username='bench')
+        User.objects.bulk_create([User(username=f'user{i}') for i in range(args.users)])
+        users = list(User.objects.exclude(pk=creator.pk))
+        challenges = {}
+        for name in ('legacy', 'keyed'):
+            challenge = Challenge.objects.create(
+                title=name, description='', creator=creator, start_date='2025-01-01', end_date='2025-02-01'
+            )
+            Quiz.objects.create(name='Квиз', challenge=challenge)
+            challenges[name] = challenge.id
+
+        # Повторное присоединение одного пользователя: чистая стоимость пути
+        measure('get_or_create + 2 exists (повтор)', lambda: legacy_join(creator, challenges['legacy']), args.repeat)
+        measure('kind + ON CONFLICT DO NOTHING (повтор)', lambda: keyed_join(creator, challenges['keyed']), args.repeat)
+
+        for name, join in (('legacy', legacy_join), ('keyed', keyed_join)):
+            elapsed, errors = launch(join, users, challenges[name], args.threads)
+            joined = Participant.objects.filter(challenge_id=challenges[name]).count()
+            print(
+                f"Запуск {name:<6} {args.users} пользователей, {args.threads} потоков: "
+                f"{args.users / elapsed:8.0f} присоединений/с, участников {joined}, ошибок {len(errors)}"
+            )
+            if errors:
+                print(f"    первая ошибка: {errors[0]!r}")
+
+
+if __name__ == '__main__':
+    main()
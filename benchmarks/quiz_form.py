@@ -0,0 +1,63 @@
+"""Проверка формы квиза: старая ModelMultipleChoiceField против проверки по ключу квиза.
+
+python -m benchmarks.quiz_form [--answers 100000]
+"""
+import argparse
+
+from benchmarks.common import benchmark_database, measure
+
+from django import forms
+from django.contrib.auth.models import User
+
+from challenges import quiz_keys
+from challenges.forms import QuizAnswerForm
+from challenges.models import Answer, Challenge, Question, Quiz
+
+
+class LegacyQuizAnswerForm(forms.Form):
+    """Форма в том виде, в каком она была: проверка по всей таблице Answer."""
+    answers = forms.ModelMultipleChoiceField(queryset=Answer.objects.all(), required=True)
+
+
+def seed(total_answers, answers_per_question=4):
+    user = User.objects.create_user(username='bench')
+    challenge = Challenge.objects.create(
+        title='Bench', description='', creator=user, start_date='2025-01-01', end_date='2025-02-01'
+    )
+    quizzes = Quiz.objects.bulk_create([Quiz(name=f'Квиз {i}', challenge=challenge) for i in range(total_answers // 200)])
+    questions = Question.objects.bulk_create(
+        [Question(quiz=quiz, text=f'Вопрос {i}') for quiz in quizzes for i in range(50)], batch_size=5000
+    )
+    Answer.objects.bulk_create(
+        [
+            Answer(question=question, text=f'Ответ {i}', is_correct=(i == 0))
+            for question in questions for i in range(answers_per_question)
+        ],
+        batch_size=5000,
+    )
+    return quizzes[len(quizzes) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--answers', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=500)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        quiz = seed(args.answers)
+        key = quiz_keys.compile_key(quiz.id, 0)
+        submission = {'answers': [str(answer_id) for answer_id in sorted(key.correct_ids)]}
+        print(f"Answer: {Answer.objects.count()} строк, в квизе {len(key.answer_ids)} ответов")
+
+        measure('ModelMultipleChoiceField (вся таблица)', lambda: LegacyQuizAnswerForm(submission).is_valid(), args.repeat)
+        quiz_keys.get_answer_key(quiz.id)
+        measure(
+            'QuizAnswerForm (ключ квиза, тёплый кэш)',
+            lambda: QuizAnswerForm(submission, answer_key=quiz_keys.get_answer_key(quiz.id)).is_valid(),
+            args.repeat,
+        )
+
+
+if __name__ == '__main__':
+    main()
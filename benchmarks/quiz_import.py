@@ -0,0 +1,47 @@
+"""Массовый импорт и экспорт квизов через JSONL.
+
+python -m benchmarks.quiz_import [--answers 100000]
+"""
+import argparse
+import io
+import json
+import time
+
+from benchmarks.common import benchmark_database
+
+from challenges import quiz_io
+from challenges.models import Answer, Quiz
+
+
+def generate(total_answers, quizzes=10, answers_per_question=4):
+    questions_per_quiz = total_answers // quizzes // answers_per_question
+    for quiz_number in range(quizzes):
+        yield json.dumps({
+            'name': f'Квиз {quiz_number}',
+            'questions': [
+                {
+                    'text': f'Вопрос {quiz_number}.{question_number}',
+                    'answers': [{'text': f'Ответ {i}', 'is_correct': i == 0} for i in range(answers_per_question)],
+                }
+                for question_number in range(questions_per_quiz)
+            ],
+        }, ensure_ascii=False) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--answers', type=int, default=100_000)
+    args = parser.parse_args()
+
+    source = io.StringIO(''.join(generate(args.answers)))
+    with benchmark_database():
+        stats = quiz_io.import_quizzes(source)
+        print(f"Импорт:  {stats}")
+
+        started = time.perf_counter()
+        lines = sum(1 for _ in quiz_io.export_quizzes(Quiz.objects.all()))
+        print(f"Экспорт: {lines} квизов, {Answer.objects.count()} ответов за {time.perf_counter() - started:.2f} с")
+
+
+if __name__ == '__main__':
+    main()
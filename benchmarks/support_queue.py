@@ -0,0 +1,84 @@
+"""Очередь поддержки на большой истории: OFFSET и полный COUNT(*) против курсора и COUNT с пределом.
+
+Почти все сообщения отвечены. Распределения неотвеченных: uniform — каждое N-е по всей истории,
+skewed — длинная отвеченная история и несколько последних сообщений без ответа. Замеряем
+страницу глубоко в очереди и подсчёт неотвеченных, плюс планы запросов очереди и подсчёта.
+
+python -m benchmarks.support_queue [--messages 1000000] [--distribution uniform] [--unanswered-every 50]
+python -m benchmarks.support_queue --distribution skewed [--unanswered 200]
+"""
+import argparse
+from datetime import timedelta
+
+from benchmarks.common import benchmark_database, measure
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.utils import timezone
+
+from challenges import support_queue
+from challenges.models import SupportMessage
+
+
+def offset_page(page):
+    """Как в стандартном списке админки: COUNT(*) и OFFSET."""
+    messages = SupportMessage.objects.filter(is_answered=False).order_by('created_at', 'id')
+    size = support_queue.PAGE_SIZE
+    return messages.count(), list(messages.select_related('user')[page * size:(page + 1) * size])
+
+
+def explain(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return '; '.join(row[-1] for row in cursor.fetchall())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    parser.add_argument('--distribution', choices=['uniform', 'skewed'], default='uniform')
+    parser.add_argument('--unanswered-every', type=int, default=50, help='uniform: каждое N-е без ответа')
+    parser.add_argument('--unanswered', type=int, default=200, help='skewed: столько последних без ответа')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    if args.distribution == 'uniform':
+        is_answered = lambda i: i % args.unanswered_every != 0  # noqa: E731
+    else:
+        is_answered = lambda i: i < args.messages - args.unanswered  # noqa: E731
+
+    with benchmark_database():
+        user = User.objects.create_user(username='bench')
+        start = timezone.now() - timedelta(days=365)
+        for offset in range(0, args.messages, 50_000):
+            SupportMessage.objects.bulk_create([
+                SupportMessage(
+                    user=user, message=f'Вопрос {i}', created_at=start + timedelta(seconds=i * 30),
+                    is_answered=is_answered(i),
+                )
+                for i in range(offset, min(offset + 50_000, args.messages))
+            ], batch_size=5000)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        unanswered = SupportMessage.objects.filter(is_answered=False).count()
+        deep_page = unanswered // support_queue.PAGE_SIZE * 9 // 10
+        cursor_value = support_queue.encode_cursor(
+            SupportMessage.objects.filter(is_answered=False).order_by('created_at', 'id')[deep_page * support_queue.PAGE_SIZE]
+        )
+        print(f"{args.distribution}: сообщений {args.messages}, без ответа {unanswered}, страница {deep_page}")
+
+        measure('OFFSET + COUNT(*)', lambda: offset_page(deep_page), args.repeat)
+        measure('курсор + COUNT до предела', lambda: (
+            support_queue.unanswered(after=cursor_value),
+            support_queue.estimated_count(SupportMessage.objects.filter(is_answered=False)),
+        ), args.repeat)
+
+        page = support_queue.unanswered_queryset(after=cursor_value)[:support_queue.PAGE_SIZE + 1]
+        print('План страницы:', explain(page))
+        print('План подсчёта:', explain(SupportMessage.objects.filter(is_answered=False)[:support_queue.COUNT_CAP + 1]))
+
+
+if __name__ == '__main__':
+    main()
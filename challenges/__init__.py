@@ -1 +0,0 @@
-default_app_config = 'myapp.apps.MyAppConfig' 
\ No newline at end of file
@@ -1,6 +1,24 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect, render
+from django.urls import path
+from django.utils.functional import cached_property
+from . import quiz_io, search, support_queue
+from .forms import QuizImportForm
 from .models import ChallengeTask, Participant, Challenge, Book, Quiz, Question, Answer, AudioChallenge
-from .models import CouponImage, AudioQuestion, SupportMessage, SupportResponse
+from .models import CouponImage, AudioQuestion, SupportMessage, SupportResponse, QuizAttempt, AudioAttempt
+from .models import ChallengeStats, CompletedItem, PersonalCoupon, ReadingProgress
+
+class IndexedSearchMixin:
+    """Поиск в списке по полнотекстовому индексу (challenges.search) вместо LIKE по search_fields."""
+    search_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip() or not search.is_available():
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=search.matching_ids(self.search_kind, search_term)), False
+
 
 # Инлайны для вложенной работы с зависимыми объектами
 class AnswerInline(admin.TabularInline):
@@ -25,13 +43,48 @@ class SupportResponseInline(admin.TabularInline):
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор без полного COUNT(*): считаем не дальше support_queue.COUNT_CAP строк."""
+
+    @cached_property
+    def count(self):
+        return support_queue.estimated_count(self.object_list)[0]
+
+
 @admin.register(SupportMessage)
 class SupportMessageAdmin(admin.ModelAdmin):
     list_display = ('user', 'short_message', 'created_at', 'is_answered')
     list_filter = ('is_answered', 'created_at')
+    list_select_related = ('user',)
     search_fields = ('message', 'user__username')
+    ordering = ('-created_at', '-id')  # По индексу support_created_idx
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = [SupportResponseInline]
     actions = ['mark_as_answered']
+    change_list_template = 'admin/challenges/supportmessage/change_list.html'
+
+    def get_urls(self):
+        urls = [
+            path('queue/', self.admin_site.admin_view(self.queue_view), name='challenges_supportmessage_queue'),
+        ]
+        return urls + super().get_urls()
+
+    def queue_view(self, request):
+        """Неотвеченные сообщения от самых старых, постранично по курсору."""
+        if not self.has_view_or_change_permission(request):
+            return redirect('admin:index')
+        rows, next_cursor = support_queue.unanswered(after=request.GET.get('after'))
+        count, exact = support_queue.estimated_count(SupportMessage.objects.filter(is_answered=False))
+        return render(request, 'admin/challenges/supportmessage/queue.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'rows': rows,
+            'next_cursor': next_cursor,
+            'count': count,
+            'count_exact': exact,
+            'title': 'Очередь без ответа',
+        })
 
     def short_message(self, obj):
         return obj.message[:50] + '...' if len(obj.message) > 50 else obj.message
@@ -46,11 +99,48 @@ class SupportMessageAdmin(admin.ModelAdmin):
 
 # Кастомизация админки для моделей
 @admin.register(Quiz)
-class QuizAdmin(admin.ModelAdmin):
+class QuizAdmin(IndexedSearchMixin, admin.ModelAdmin):
     inlines = [QuestionInline]
-    search_fields = ['name']  # Поиск по названию квиза
+    search_fields = ['name']  # Поиск по названию квиза и текстам вопросов (индекс)
+    search_kind = search.KIND_QUIZ
     list_display = ['name', 'created_at', 'challenge']  # Отображение ключевых данных
     list_filter = ['created_at', 'challenge']  # Фильтр по дате создания и челленджу
+    actions = ['export_as_jsonl']
+    change_list_template = 'admin/challenges/quiz/change_list.html'
+
+    def get_urls(self):
+        urls = [
+            path('import-jsonl/', self.admin_site.admin_view(self.import_jsonl), name='challenges_quiz_import_jsonl'),
+        ]
+        return urls + super().get_urls()
+
+    def import_jsonl(self, request):
+        """Массовый импорт квизов из JSONL-файла (формат как у команды import_quizzes)."""
+        if not self.has_add_permission(request):
+            return redirect('admin:challenges_quiz_changelist')
+        form = QuizImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            stats = quiz_io.ImportStats()
+            try:
+                quiz_io.import_quizzes(form.cleaned_data['file'], stats=stats)
+            except quiz_io.QuizImportError as exc:
+                self.message_user(request, f"{exc}. Уже импортировано: {stats}", messages.ERROR)
+            else:
+                self.message_user(request, str(stats), messages.SUCCESS)
+            return redirect('admin:challenges_quiz_changelist')
+        return render(request, 'admin/challenges/quiz/import_jsonl.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'form': form,
+            'title': 'Импорт квизов из JSONL',
+        })
+
+    def export_as_jsonl(self, request, queryset):
+        response = StreamingHttpResponse(quiz_io.export_quizzes(queryset), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="quizzes.jsonl"'
+        return response
+
+    export_as_jsonl.short_description = "Экспортировать в JSONL"
 
 
 @admin.register(Question)
@@ -72,12 +162,39 @@ class CouponImageInline(admin.TabularInline):
     extra = 1  # Количество пустых форм для добавления фотографий
 
 @admin.register(Challenge)
-class ChallengeAdmin(admin.ModelAdmin):
-    search_fields = ['title']  # Поиск по названию челленджа
-    list_display = ['title', 'creator', 'start_date', 'end_date']  # Основные поля в списке
-    list_filter = ['start_date', 'end_date']  # Фильтр по дате начала и окончания
+class ChallengeAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    search_fields = ['title']  # Поиск по названию и описанию челленджа (индекс)
+    search_kind = search.KIND_CHALLENGE
+    list_display = [
+        'title', 'creator', 'kind', 'start_date', 'end_date',
+        'participants', 'completions', 'completion_rate', 'quiz_pass_rate',
+    ]  # Основные поля в списке; счётчики — из ChallengeStats, без COUNT на строку
+    list_filter = ['kind', 'start_date', 'end_date']  # Фильтр по типу и датам
+    list_select_related = ['creator', 'stats']
     inlines = [CouponImageInline]  # Добавляем inline для CouponImage
 
+    def _stat(self, obj, name):
+        challenge_stats = getattr(obj, 'stats', None)
+        return getattr(challenge_stats, name) if challenge_stats else None
+
+    @admin.display(description='Участники', ordering='stats__participants')
+    def participants(self, obj):
+        return self._stat(obj, 'participants')
+
+    @admin.display(description='Завершили', ordering='stats__completions')
+    def completions(self, obj):
+        return self._stat(obj, 'completions')
+
+    @admin.display(description='Доля завершивших', ordering='stats__completion_rate')
+    def completion_rate(self, obj):
+        value = self._stat(obj, 'completion_rate')
+        return None if value is None else f"{value:.0f}%"
+
+    @admin.display(description='Квизы сдано', ordering='stats__quiz_pass_rate')
+    def quiz_pass_rate(self, obj):
+        value = self._stat(obj, 'quiz_pass_rate')
+        return None if value is None else f"{value:.0f}%"
+
 @admin.register(CouponImage)
 class CouponImageAdmin(admin.ModelAdmin):
     list_display = ('challenge', 'image', 'uploaded_at')  # Поля для отображения в списке
@@ -92,20 +209,23 @@ class ChallengeTaskAdmin(admin.ModelAdmin):
 
 @admin.register(Participant)
 class ParticipantAdmin(admin.ModelAdmin):
-    list_display = ['user', 'challenge', 'progress']  # Отображение пользователя, челленджа и прогресса
+    list_display = ['user', 'challenge', 'completed_units', 'progress']  # Отображение пользователя, челленджа и прогресса
+    readonly_fields = ['completed_units', 'progress']  # Ведутся challenges.participation
     list_filter = ['challenge']  # Фильтр по челленджу
     search_fields = ['user__username']  # Поиск по имени пользователя
 
 
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
-    list_display = ['title', 'author', 'challenge']  # Основные поля в списке
-    search_fields = ['title', 'author']  # Поиск по названию книги и автору
+class BookAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ['title', 'author', 'challenge', 'page_count']  # Основные поля в списке
+    search_fields = ['title', 'author']  # Поиск по названию, автору, описанию и тексту (индекс)
+    search_kind = search.KIND_BOOK
     list_filter = ['challenge']  # Фильтр по челленджу
 
 class AudioQuestionInline(admin.TabularInline):
     model = AudioQuestion
     extra = 1
+    readonly_fields = ('processing_status', 'duration', 'bitrate')
 
 @admin.register(AudioChallenge)
 class AudioChallengeAdmin(admin.ModelAdmin):
@@ -116,7 +236,54 @@ class AudioChallengeAdmin(admin.ModelAdmin):
 
     fieldsets = (
         (None, {
-            'fields': ('title', 'description', 'challenge')
+            'fields': ('title', 'description', 'challenge', 'image')
         }),
     )
 
+
+@admin.register(QuizAttempt)
+class QuizAttemptAdmin(admin.ModelAdmin):
+    list_display = ('user', 'quiz', 'passed', 'correct_questions', 'total_questions', 'created_at')
+    list_filter = ('passed', 'quiz')
+    list_select_related = ('user', 'quiz')
+
+
+@admin.register(AudioAttempt)
+class AudioAttemptAdmin(admin.ModelAdmin):
+    list_display = ('user', 'audio_challenge', 'passed', 'correct', 'total', 'created_at')
+    list_filter = ('passed', 'audio_challenge')
+    list_select_related = ('user', 'audio_challenge')
+
+
+@admin.register(ReadingProgress)
+class ReadingProgressAdmin(admin.ModelAdmin):
+    list_display = ('user', 'book', 'seconds', 'last_page', 'updated_at')
+    list_select_related = ('user', 'book')
+    search_fields = ('user__username',)
+
+
+@admin.register(PersonalCoupon)
+class PersonalCouponAdmin(admin.ModelAdmin):
+    list_display = ('code', 'discount', 'user', 'issued_on')
+    list_filter = ('issued_on',)
+    list_select_related = ('user',)
+    search_fields = ('code', 'user__username')
+    readonly_fields = ('issued_at', 'created_at')
+
+
+@admin.register(CompletedItem)
+class CompletedItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'challenge', 'kind', 'object_id', 'completed_at')
+    list_filter = ('kind', 'challenge')
+    list_select_related = ('user', 'challenge')
+    search_fields = ('user__username',)
+
+
+@admin.register(ChallengeStats)
+class ChallengeStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        'challenge', 'participants', 'completions', 'completion_rate', 'median_completion_seconds',
+        'quiz_attempts', 'quiz_pass_rate', 'refreshed_at',
+    )
+    list_select_related = ('challenge',)
+    readonly_fields = [field.name for field in ChallengeStats._meta.fields]
@@ -0,0 +1,83 @@
+import re
+import unicodedata
+
+# Проверка текстовых ответов аудио-челленджей. Ключи ответов нормализуются один раз при сохранении
+# вопроса (AudioQuestion.normalized_answers), при проверке нормализуется только ответ пользователя.
+# Опечатки допускаются в пределах answer_tolerance правок (расстояние Левенштейна),
+# но не больше одной на MIN_CHARS_PER_TYPO символов ключа, чтобы «да» не совпадало с «до».
+
+MIN_CHARS_PER_TYPO = 4
+_FOLD = str.maketrans({'ё': 'е'})
+_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def normalize(text):
+    """Регистр, ё/е, знаки препинания и пробелы не влияют на ответ."""
+    text = unicodedata.normalize('NFKC', text or '').casefold().translate(_FOLD)
+    return _SEPARATORS.sub(' ', text).strip()
+
+
+def answer_keys(answers):
+    """Нормализованные варианты ответа без пустых и повторов, в исходном порядке."""
+    keys = []
+    for answer in answers:
+        key = normalize(answer)
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def within_distance(first, second, limit):
+    """Расстояние Левенштейна не больше limit. Считаем только полосу шириной 2 * limit + 1
+    и выходим, как только вся строка таблицы превысила limit."""
+    if first == second:
+        return True
+    if limit <= 0 or abs(len(first) - len(second)) > limit:
+        return False
+    # Общие начало и конец на расстояние не влияют; у опечатки от строки почти ничего не остаётся
+    start = 0
+    while start < len(first) and start < len(second) and first[start] == second[start]:
+        start += 1
+    end = 0
+    while end < len(first) - start and end < len(second) - start and first[-1 - end] == second[-1 - end]:
+        end += 1
+    first, second = first[start:len(first) - end], second[start:len(second) - end]
+    if len(first) > len(second):
+        first, second = second, first
+    if not first:
+        return len(second) <= limit
+    over = limit + 1
+    previous = [min(j, over) for j in range(len(second) + 1)]
+    for i, char in enumerate(first, start=1):
+        current = [over] * (len(second) + 1)
+        current[0] = min(i, over)
+        row_min = current[0]
+        for j in range(max(1, i - limit), min(len(second), i + limit) + 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != second[j - 1]))
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return False
+        previous = current
+    return previous[-1] <= limit
+
+
+def matches(answer, keys, tolerance):
+    """Ответ пользователя (сырой текст) против нормализованных ключей вопроса."""
+    answer = normalize(answer)
+    if not answer:
+        return False
+    if answer in keys:
+        return True
+    return any(
+        within_distance(answer, key, min(tolerance, len(key) // MIN_CHARS_PER_TYPO)) for key in keys
+    )
+
+
+def grade(questions, answers):
+    """Число верных ответов за один проход по вопросам; answers — {question_id: текст}."""
+    return sum(
+        matches(answers.get(question.id, ''), question.normalized_answers, question.answer_tolerance)
+        for question in questions
+    )
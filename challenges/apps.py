@@ -1,12 +1,8 @@
 from django.apps import AppConfig
 
-class MyAppConfig(AppConfig):
+class ChallengesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'challenges'
 
     def ready(self):
-        import myapp.signals  # Импортируем сигналы
-
-class ChallengesConfig(AppConfig):
-    default_auto_field = 'django.db.models.BigAutoField'
-    name = 'challenges'
+        from . import signals  # noqa: F401  Импортируем сигналы
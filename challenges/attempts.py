@@ -0,0 +1,248 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from itertools import count
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils.dateparse import parse_datetime
+
+from . import participation, stats
+from .models import AudioAttempt, AudioChallenge, CompletedItem, Quiz, QuizAttempt
+
+logger = logging.getLogger(__name__)
+
+# Буфер попыток: запросы только кладут попытку в память и дописывают строку в журнал процесса,
+# а в базу попытки уходят одним bulk_create по размеру или возрасту буфера.
+# Журнал (append-only JSONL) нужен, чтобы ничего не потерять, если воркер умрёт до сброса:
+# команда flush_attempts догружает журналы мёртвых процессов, дубликаты отсекаются по token.
+
+ATTEMPT_FIELDS = {
+    QuizAttempt: ('token', 'user_id', 'quiz_id', 'passed', 'correct_questions', 'total_questions', 'created_at'),
+    AudioAttempt: ('token', 'user_id', 'audio_challenge_id', 'passed', 'correct', 'total', 'created_at'),
+}
+
+
+def journal_dir():
+    return str(getattr(settings, 'ATTEMPT_JOURNAL_DIR', os.path.join(settings.BASE_DIR, 'var', 'attempts')))
+
+
+def serialize(attempt):
+    fields = {name: getattr(attempt, name) for name in ATTEMPT_FIELDS[type(attempt)]}
+    fields['token'] = str(fields['token'])
+    fields['created_at'] = fields['created_at'].isoformat()
+    return json.dumps({'model': attempt._meta.label_lower, 'fields': fields}, ensure_ascii=False)
+
+
+def deserialize(line):
+    record = json.loads(line)
+    model = apps.get_model(record['model'])
+    fields = dict(record['fields'])
+    fields['token'] = uuid.UUID(fields['token'])
+    fields['created_at'] = parse_datetime(fields['created_at'])
+    return model(**fields)
+
+
+def completed_items(attempts):
+    """Выполнения (user_id, challenge_id, kind, object_id) по успешным попыткам. Два запроса на пачку."""
+    passed_quiz = {attempt.quiz_id for attempt in attempts if attempt.passed and isinstance(attempt, QuizAttempt)}
+    passed_audio = {
+        attempt.audio_challenge_id for attempt in attempts if attempt.passed and isinstance(attempt, AudioAttempt)
+    }
+    quiz_challenges = dict(Quiz.objects.filter(id__in=passed_quiz).values_list('id', 'challenge_id')) if passed_quiz else {}
+    audio_challenges = dict(
+        AudioChallenge.objects.filter(id__in=passed_audio).values_list('id', 'challenge_id')
+    ) if passed_audio else {}
+
+    items = set()
+    for attempt in attempts:
+        if not attempt.passed:
+            continue
+        if isinstance(attempt, QuizAttempt):
+            kind, object_id = CompletedItem.KIND_QUIZ, attempt.quiz_id
+            challenge_id = quiz_challenges.get(object_id)
+        else:
+            kind, object_id = CompletedItem.KIND_AUDIO, attempt.audio_challenge_id
+            challenge_id = audio_challenges.get(object_id)
+        if challenge_id:
+            items.add((attempt.user_id, challenge_id, kind, object_id))
+    return items
+
+
+def quiz_attempt_counts(attempts):
+    """{challenge_id: (попыток квизов, успешных)} для ChallengeStats. Один запрос на пачку."""
+    quiz_attempts = [attempt for attempt in attempts if isinstance(attempt, QuizAttempt)]
+    if not quiz_attempts:
+        return {}
+    quiz_challenges = dict(
+        Quiz.objects.filter(id__in={attempt.quiz_id for attempt in quiz_attempts}).values_list('id', 'challenge_id')
+    )
+    counts = {}
+    for attempt in quiz_attempts:
+        challenge_id = quiz_challenges.get(attempt.quiz_id)
+        if challenge_id:
+            total, passed = counts.get(challenge_id, (0, 0))
+            counts[challenge_id] = (total + 1, passed + attempt.passed)
+    return counts
+
+
+def save_attempts(attempts):
+    """Пишем пачку попыток и засчитываем выполненные квизы и аудиочелленджи. Повторная запись безопасна."""
+    by_model = {}
+    for attempt in attempts:
+        by_model.setdefault(type(attempt), []).append(attempt)
+
+    with transaction.atomic():
+        for model, batch in by_model.items():
+            model.objects.bulk_create(batch, batch_size=500, ignore_conflicts=True)
+        # Повторно догруженные из журнала попытки могут попасть в счётчики дважды;
+        # такой дрейф исправляет полный пересчёт refresh_challenge_stats
+        stats.quiz_attempts_recorded(quiz_attempt_counts(attempts))
+
+        # Прогресс участников; CompletedChallenge появляется, когда выполнены все части челленджа
+        participation.complete_many(completed_items(attempts))
+
+
+class AttemptBuffer:
+    """Буфер попыток процесса со сбросом по размеру (ATTEMPT_BUFFER_SIZE) или возрасту (ATTEMPT_BUFFER_MAX_AGE)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._first_added = None
+        self._timer = None
+        self._generation = count()
+        self._journal = None
+        self._journal_path = None
+        self._unsaved_journals = []  # Журналы пачек, запись которых не удалась
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'ATTEMPT_BUFFER_SIZE', 100)
+
+    @property
+    def max_age(self):
+        return getattr(settings, 'ATTEMPT_BUFFER_MAX_AGE', 5.0)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _open_journal(self):
+        if self._journal is None:
+            os.makedirs(journal_dir(), exist_ok=True)
+            self._journal_path = os.path.join(journal_dir(), f'attempts-{os.getpid()}.jsonl')
+            self._journal = open(self._journal_path, 'a', encoding='utf-8')
+        return self._journal
+
+    def add(self, attempt):
+        """Кладём попытку в буфер; сначала в журнал, потом в память."""
+        with self._lock:
+            journal = self._open_journal()
+            journal.write(serialize(attempt) + '\n')
+            journal.flush()
+            self._pending.append(attempt)
+            if self._first_added is None:
+                self._first_added = time.monotonic()
+            due = len(self._pending) >= self.max_size or time.monotonic() - self._first_added >= self.max_age
+        if due:
+            try:
+                self.flush()
+            except Exception:
+                # Пачка вернулась в буфер и уйдёт при следующем сбросе; журнал остаётся на диске
+                logger.exception("Не удалось сбросить буфер попыток")
+        else:
+            self._schedule()
+
+    def _schedule(self):
+        with self._lock:
+            if self._timer is not None or not self._pending:
+                return
+            self._timer = threading.Timer(self.max_age, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Не удалось сбросить буфер попыток")
+        finally:
+            connections.close_all()  # Соединения потока таймера
+
+    def flush(self):
+        """Сбрасываем буфер в базу. Журнал с этими попытками удаляется только после коммита.
+
+        Если запись не удалась, пачка возвращается в начало буфера, а её журнал остаётся на диске
+        до следующего успешного сброса; исключение пробрасывается.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return 0
+            batch, first_added = self._pending, self._first_added
+            self._pending, self._first_added = [], None
+            journals, self._unsaved_journals = self._unsaved_journals, []
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+                journals.append(f'{self._journal_path}.{next(self._generation)}.flushing')
+                os.replace(self._journal_path, journals[-1])
+
+        try:
+            save_attempts(batch)
+        except Exception:
+            with self._lock:
+                self._pending[:0] = batch
+                self._first_added = first_added
+                self._unsaved_journals[:0] = journals
+            self._schedule()
+            raise
+        for path in journals:
+            os.remove(path)
+        return len(batch)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def replay_journals():
+    """Догружаем журналы процессов, умерших до сброса буфера. Возвращает число попыток.
+
+    Журналы живых процессов не трогаем: они ещё сбросят их сами.
+    """
+    total = 0
+    for path in sorted(glob.glob(os.path.join(journal_dir(), 'attempts-*.jsonl*'))):
+        pid = int(os.path.basename(path).split('-')[1].split('.')[0])
+        if pid == os.getpid() or _pid_alive(pid):
+            continue
+        with open(path, encoding='utf-8') as journal:
+            attempts = [deserialize(line) for line in journal if line.strip()]
+        if attempts:
+            save_attempts(attempts)
+        os.remove(path)
+        total += len(attempts)
+    return total
+
+
+buffer = AttemptBuffer()
+atexit.register(buffer.flush)
+
+
+def record(attempt):
+    """Точка входа для views: попытка будет записана в базу пачкой."""
+    buffer.add(attempt)
@@ -0,0 +1,258 @@
+import array
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import wave
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Обработка загруженного аудио вне запроса: длительность и битрейт, облегчённая версия для
+# прослушивания и пики для волны. С ffmpeg/ffprobe работаем с любым форматом; без них —
+# чистый Python: MP3 читается по заголовкам кадров (без декодирования), WAV декодируется полностью.
+# Облегчённая версия (MP3 64 кбит/с) делается только через ffmpeg: сжимающего кодека в stdlib нет,
+# а несжатый PCM не легче оригинала — без ffmpeg слушают исходный файл.
+
+PEAKS_COUNT = 100
+STREAM_BITRATE = '64k'
+STREAM_SAMPLE_RATE = 16000
+
+# Битрейты (кбит/с) по (версия MPEG 1 или 2, слой) и частоты дискретизации по версии
+_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 25: [11025, 12000, 8000]}
+
+
+def has_ffmpeg():
+    return shutil.which('ffmpeg') is not None and shutil.which('ffprobe') is not None
+
+
+def _skip_id3(data):
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        return 10 + size
+    return 0
+
+
+def probe_mp3(path):
+    """Длительность и средний битрейт MP3 по заголовкам кадров, без декодирования."""
+    with open(path, 'rb') as source:
+        data = source.read()
+    position, end = _skip_id3(data), len(data)
+    total_samples = frames = bits = 0
+    sample_rate = None
+    while position + 4 <= end:
+        header = int.from_bytes(data[position:position + 4], 'big')
+        if header >> 21 != 0x7FF:
+            position += 1  # мусор между кадрами — ищем следующую синхронизацию
+            continue
+        version_bits = (header >> 19) & 0b11
+        layer_bits = (header >> 17) & 0b11
+        bitrate_index = (header >> 12) & 0b1111
+        rate_index = (header >> 10) & 0b11
+        padding = (header >> 9) & 1
+        if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+            position += 1
+            continue
+        version = {3: 1, 2: 2, 0: 25}[version_bits]
+        layer = 4 - layer_bits
+        bitrate = _BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+        sample_rate = _SAMPLE_RATES[version][rate_index]
+        if layer == 1:
+            length, samples = (12 * bitrate // sample_rate + padding) * 4, 384
+        elif layer == 2 or version == 1:
+            length, samples = 144 * bitrate // sample_rate + padding, 1152
+        else:
+            length, samples = 72 * bitrate // sample_rate + padding, 576
+        total_samples += samples
+        bits += length * 8
+        frames += 1
+        position += length
+    if not frames:
+        raise ValueError(f"В файле не найдено MP3-кадров: {path}")
+    duration = total_samples / sample_rate
+    return {'duration': duration, 'bitrate': round(bits / duration / 1000)}
+
+
+def _read_wav(path):
+    """Моно-сэмплы WAV (16 бит) и частота дискретизации."""
+    with wave.open(path, 'rb') as source:
+        channels, width, rate = source.getnchannels(), source.getsampwidth(), source.getframerate()
+        frames = source.readframes(source.getnframes())
+    if width != 2:
+        raise ValueError(f"Поддерживается только 16-битный WAV: {path}")
+    samples = array.array('h', frames)
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    if channels > 1:
+        samples = array.array('h', (
+            sum(samples[i:i + channels]) // channels for i in range(0, len(samples), channels)
+        ))
+    return samples, rate
+
+
+def _decode_with_ffmpeg(path):
+    """Декодируем любой формат в моно 16 бит через ffmpeg."""
+    output = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-i', path, '-ac', '1', '-ar', str(STREAM_SAMPLE_RATE), '-f', 's16le', '-'],
+        check=True, capture_output=True,
+    ).stdout
+    samples = array.array('h', output)
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    return samples, STREAM_SAMPLE_RATE
+
+
+def compute_peaks(samples, count=PEAKS_COUNT):
+    """Пики громкости в диапазоне 0..100 для count равных отрезков."""
+    if not samples:
+        return [0] * count
+    step = max(len(samples) / count, 1)
+    peaks = []
+    for i in range(count):
+        chunk = samples[int(i * step):int((i + 1) * step)] or [0]
+        peaks.append(round(max(abs(min(chunk)), abs(max(chunk))) * 100 / 32768))
+    return peaks
+
+
+def process_file(source_path, target_base):
+    """Работа воркера (без базы): метаданные, облегчённая версия и пики.
+
+    Возвращает словарь полей для AudioQuestion; stream_path — путь к созданной версии или None.
+    """
+    result = {'duration': None, 'bitrate': None, 'peaks': None, 'stream_path': None}
+    if has_ffmpeg():
+        info = json.loads(subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration,bit_rate', '-of', 'json', source_path],
+            check=True, capture_output=True,
+        ).stdout)['format']
+        result['duration'] = float(info['duration'])
+        result['bitrate'] = round(int(info.get('bit_rate') or 0) / 1000) or None
+        target = target_base + '.mp3'
+        subprocess.run(
+            ['ffmpeg', '-v', 'error', '-y', '-i', source_path, '-af', 'loudnorm', '-ac', '1',
+             '-b:a', STREAM_BITRATE, target],
+            check=True, capture_output=True,
+        )
+        result['stream_path'] = target
+        result['peaks'] = compute_peaks(_decode_with_ffmpeg(source_path)[0])
+        return result
+
+    if source_path.lower().endswith('.wav'):
+        samples, rate = _read_wav(source_path)
+        result['duration'] = len(samples) / rate
+        result['bitrate'] = round(os.path.getsize(source_path) * 8 / result['duration'] / 1000) if samples else None
+        result['peaks'] = compute_peaks(samples)
+    else:
+        # MP3 без ffmpeg не декодируем: только метаданные, слушать будут оригинал
+        result.update(probe_mp3(source_path))
+    return result
+
+
+STREAM_DIR = 'audio_questions/stream'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Пул процессов для обработки (AUDIO_PROCESSING_WORKERS, по умолчанию 2)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=getattr(settings, 'AUDIO_PROCESSING_WORKERS', 2))
+        return _executor
+
+
+def stream_target_base(question):
+    """Путь (без расширения) для облегчённой версии файла вопроса."""
+    name = os.path.splitext(os.path.basename(question.audio_file.name))[0]
+    directory = os.path.join(settings.MEDIA_ROOT, STREAM_DIR)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f'{question.pk}_{name}')
+
+
+def apply_result(question_id, audio_name, result):
+    """Сохраняем результат, если за время обработки файл вопроса не заменили."""
+    from .models import AudioQuestion
+
+    stream_name = ''
+    if result['stream_path']:
+        stream_name = os.path.relpath(result['stream_path'], settings.MEDIA_ROOT).replace(os.sep, '/')
+    AudioQuestion.objects.filter(pk=question_id, audio_file=audio_name).update(
+        duration=result['duration'],
+        bitrate=result['bitrate'],
+        peaks=result['peaks'],
+        stream_file=stream_name,
+        processing_status=AudioQuestion.STATUS_DONE,
+    )
+
+
+def delete_stream(name):
+    """Удаляем облегчённую версию, которая больше не нужна: файл вопроса заменён или вопрос удалён."""
+    from .models import AudioQuestion
+
+    if name:
+        AudioQuestion._meta.get_field('stream_file').storage.delete(name)
+
+
+def mark_failed(question_id, audio_name):
+    from .models import AudioQuestion
+
+    AudioQuestion.objects.filter(pk=question_id, audio_file=audio_name).update(
+        processing_status=AudioQuestion.STATUS_FAILED
+    )
+
+
+def _on_done(question_id, audio_name, future):
+    try:
+        result = future.result()
+    except Exception:
+        logger.exception("Не удалось обработать аудио вопроса %s", question_id)
+        mark_failed(question_id, audio_name)
+    else:
+        apply_result(question_id, audio_name, result)
+    finally:
+        connections.close_all()  # Колбэк выполняется в служебном потоке пула
+
+
+def submit(question):
+    """Отправляем файл вопроса в пул процессов; результат запишется в базу по готовности."""
+    audio_name = question.audio_file.name
+    future = get_executor().submit(process_file, question.audio_file.path, stream_target_base(question))
+    future.add_done_callback(lambda done: _on_done(question.pk, audio_name, done))
+    return future
+
+
+def process_now(question):
+    """Синхронная обработка в текущем процессе (тесты, AUDIO_PROCESSING_SYNC = True)."""
+    try:
+        result = process_file(question.audio_file.path, stream_target_base(question))
+    except Exception:
+        logger.exception("Не удалось обработать аудио вопроса %s", question.pk)
+        mark_failed(question.pk, question.audio_file.name)
+        return
+    apply_result(question.pk, question.audio_file.name, result)
+
+
+def schedule(question):
+    """Точка входа для сигнала: обработать файл вопроса вне запроса."""
+    if not question.audio_file:
+        return
+    if getattr(settings, 'AUDIO_PROCESSING_SYNC', False):
+        process_now(question)
+    else:
+        submit(question)
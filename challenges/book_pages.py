@@ -0,0 +1,111 @@
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.html import linebreaks
+
+# Книга нарезается на страницы один раз при сохранении: смещения в full_text и готовый HTML
+# каждой страницы лежат в BookPage, так что читалка отдаёт одну страницу одним запросом
+# и не прогоняет весь текст через linebreaks. Глава всегда начинается с новой страницы.
+
+PARAGRAPH_BREAK = re.compile(r'\r?\n[ \t]*\r?\n\s*')
+HEADING_RE = re.compile(r'\s*(глава|часть|пролог|эпилог|chapter|part)\b', re.IGNORECASE)
+HEADING_MAX_LENGTH = 80
+TOC_KEY = 'book_toc:{book_id}'
+TOC_TIMEOUT = 24 * 3600
+
+
+def page_size():
+    return getattr(settings, 'BOOK_PAGE_CHARS', 6000)
+
+
+def _paragraphs(text):
+    position = 0
+    for match in PARAGRAPH_BREAK.finditer(text):
+        if text[position:match.start()].strip():
+            yield position, match.start()
+        position = match.end()
+    if text[position:].strip():
+        yield position, len(text)
+
+
+def _pieces(text, start, end, size):
+    """Слишком длинный абзац режем по последнему пробелу перед границей страницы."""
+    while end - start > size:
+        cut = text.rfind(' ', start + size // 2, start + size)
+        if cut == -1:
+            cut = start + size
+        yield start, cut
+        start = cut
+    yield start, end
+
+
+def split_pages(text, size=None):
+    """Список страниц {'start', 'end', 'heading'}; границы проходят по абзацам."""
+    size = size or page_size()
+    pages = []
+    current = None
+    for start, end in _paragraphs(text):
+        heading = ''
+        if end - start <= HEADING_MAX_LENGTH and HEADING_RE.match(text, start):
+            heading = ' '.join(text[start:end].split())
+        for piece_start, piece_end in _pieces(text, start, end, size):
+            if current is None or (heading and piece_start == start) or piece_end - current['start'] > size:
+                current = {'start': piece_start, 'end': piece_end, 'heading': heading if piece_start == start else ''}
+                pages.append(current)
+            else:
+                current['end'] = piece_end
+    return pages or [{'start': 0, 'end': 0, 'heading': ''}]
+
+
+def render_page(text, page):
+    return linebreaks(text[page['start']:page['end']].strip(), autoescape=True)
+
+
+def build_pages(book_page_model, book_id, text):
+    """Объекты страниц для bulk_create; модель передаётся, чтобы работать и в миграциях."""
+    return [
+        book_page_model(
+            book_id=book_id,
+            number=number,
+            start=page['start'],
+            end=page['end'],
+            heading=page['heading'][:255],
+            html=render_page(text, page),
+        )
+        for number, page in enumerate(split_pages(text), start=1)
+    ]
+
+
+def _forget_toc(book_id):
+    cache.delete(TOC_KEY.format(book_id=book_id))
+
+
+def rebuild(book):
+    """Пересобираем страницы книги (вызывается сигналом post_save на Book)."""
+    from .models import Book, BookPage
+
+    pages = build_pages(BookPage, book.pk, book.full_text or '')
+    with transaction.atomic():
+        BookPage.objects.filter(book_id=book.pk).delete()
+        BookPage.objects.bulk_create(pages, batch_size=500)
+        Book.objects.filter(pk=book.pk).update(page_count=len(pages))
+    book.page_count = len(pages)
+    _forget_toc(book.pk)
+    transaction.on_commit(lambda: _forget_toc(book.pk))
+    return len(pages)
+
+
+def table_of_contents(book_id):
+    """[(номер страницы, заголовок)] из кэша; при промахе один запрос по заголовкам."""
+    key = TOC_KEY.format(book_id=book_id)
+    toc = cache.get(key)
+    if toc is None:
+        from .models import BookPage
+
+        toc = list(
+            BookPage.objects.filter(book_id=book_id).exclude(heading='').order_by('number').values_list('number', 'heading')
+        )
+        cache.set(key, toc, TOC_TIMEOUT)
+    return toc
@@ -0,0 +1,86 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import Q
+from django.db.models.functions import Left
+from django.utils import timezone
+
+from .models import Challenge
+
+# Список челленджей: keyset-пагинация по (start_date, id) от новых к старым и фильтры по статусу.
+# Курсор — "<start_date>.<id>" последней показанной карточки, поэтому следующая страница — это
+# поиск по индексу, а не OFFSET. Карточки кэшируются фрагментами шаблона (challenges/challenge_cards.html)
+# и сбрасываются сигналами при изменении челленджа.
+
+STATUS_ACTIVE = 'active'
+STATUS_UPCOMING = 'upcoming'
+STATUS_FINISHED = 'finished'
+STATUS_CHOICES = [
+    (STATUS_ACTIVE, 'Идут'),
+    (STATUS_UPCOMING, 'Скоро'),
+    (STATUS_FINISHED, 'Завершены'),
+]
+
+EXCERPT_CHARS = 300
+CARD_FRAGMENT = 'challenge_card'
+AVATAR_FRAGMENT = 'header_avatar'
+CARD_TIMEOUT = 24 * 3600
+# Аватар в шапке тоже кэшируется, чтобы не читать профиль на каждой странице; сбрасывается при
+# сохранении профиля, а срок короче — чтобы подхватить уменьшенные копии, сделанные в фоне
+AVATAR_TIMEOUT = 3600
+
+
+def page_size():
+    return getattr(settings, 'CHALLENGE_PAGE_SIZE', 12)
+
+
+def filter_status(queryset, status, today=None):
+    today = today or timezone.localdate()
+    if status == STATUS_ACTIVE:
+        return queryset.filter(start_date__lte=today, end_date__gte=today)
+    if status == STATUS_UPCOMING:
+        return queryset.filter(start_date__gt=today)
+    if status == STATUS_FINISHED:
+        return queryset.filter(end_date__lt=today)
+    return queryset
+
+
+def encode_cursor(challenge):
+    return f'{challenge.start_date.isoformat()}.{challenge.pk}'
+
+
+def decode_cursor(value):
+    """(start_date, id) из курсора; None для пустого или испорченного значения."""
+    try:
+        start, pk = value.split('.')
+        return date.fromisoformat(start), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def page(status=None, after=None, size=None, today=None):
+    """Страница карточек после курсора after и курсор следующей страницы (None — это последняя)."""
+    size = size or page_size()
+    queryset = filter_status(
+        Challenge.objects.only('id', 'title', 'start_date', 'end_date', 'image')
+        .annotate(excerpt=Left('description', EXCERPT_CHARS + 1))  # полный текст описания не читаем
+        .order_by('-start_date', '-id'),
+        status, today,
+    )
+    cursor = decode_cursor(after)
+    if cursor:
+        start, pk = cursor
+        queryset = queryset.filter(Q(start_date__lt=start) | Q(start_date=start, id__lt=pk))
+    challenges = list(queryset[:size + 1])
+    next_cursor = encode_cursor(challenges[size - 1]) if len(challenges) > size else None
+    return challenges[:size], next_cursor
+
+
+def invalidate_card(challenge_id):
+    cache.delete(make_template_fragment_key(CARD_FRAGMENT, [challenge_id]))
+
+
+def invalidate_avatar(user_id):
+    cache.delete(make_template_fragment_key(AVATAR_FRAGMENT, [user_id]))
@@ -0,0 +1,203 @@
+import logging
+import random
+import string
+import threading
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import Subquery
+from django.utils import timezone
+
+from .models import DailyCoupon, PersonalCoupon
+
+logger = logging.getLogger(__name__)
+
+# Ежедневный купон. Ротация — один условный UPDATE ... WHERE last_updated <= граница периода,
+# поэтому при одновременных запросах купон меняет ровно один воркер, а остальные читают его код.
+# Текущий купон держим в памяти процесса до известного момента истечения: до него страница
+# купона в базу не ходит. Срок у всех процессов общий (last_updated + период), так что
+# разъехаться они не могут.
+
+COUPON_ID = 1
+DISCOUNTS = (5.0, 10.0, 15.0, 20.0)
+
+CurrentCoupon = namedtuple('CurrentCoupon', 'code discount expires_at')
+
+
+def period():
+    return timedelta(seconds=getattr(settings, 'DAILY_COUPON_PERIOD', 24 * 3600))
+
+
+def random_code():
+    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+
+
+def random_discount():
+    return random.choice(DISCOUNTS)
+
+
+_current = None
+_lock = threading.RLock()  # post_save при создании купона вызывает forget() под этой же блокировкой
+
+
+def _load(now):
+    """Читаем купон и, если период истёк, меняем его условным UPDATE. Два-три запроса раз в период."""
+    coupon = DailyCoupon.objects.filter(pk=COUPON_ID).first()
+    if coupon is None:
+        coupon, _ = DailyCoupon.objects.get_or_create(
+            pk=COUPON_ID, defaults={'code': random_code(), 'discount': random_discount()}
+        )
+    if coupon.last_updated + period() > now:
+        return CurrentCoupon(coupon.code, coupon.discount, coupon.last_updated + period())
+
+    code, discount = random_code(), random_discount()
+    rotated = DailyCoupon.objects.filter(pk=COUPON_ID, last_updated__lte=now - period()).update(
+        code=code, discount=discount, last_updated=now
+    )
+    if rotated:
+        return CurrentCoupon(code, discount, now + period())
+    # Купон уже сменил другой воркер — берём его результат
+    coupon = DailyCoupon.objects.get(pk=COUPON_ID)
+    return CurrentCoupon(coupon.code, coupon.discount, coupon.last_updated + period())
+
+
+def current(now=None):
+    """Текущий купон; до его истечения без запросов в базу."""
+    global _current
+    now = now or timezone.now()
+    coupon = _current
+    if coupon is not None and coupon.expires_at > now:
+        return coupon
+    with _lock:
+        if _current is None or _current.expires_at <= now:
+            _current = _load(now)
+        return _current
+
+
+def forget():
+    """Сбрасываем купон процесса (после правки в админке)."""
+    global _current
+    with _lock:
+        _current = None
+
+
+def time_label(coupon, now=None):
+    seconds = max((coupon.expires_at - (now or timezone.now())).total_seconds(), 0)
+    if seconds < 3600:
+        return f"Осталось {int(seconds // 60)} минут"
+    return f"Осталось {int(seconds // 3600)} часов"
+
+
+# Личные купоны: коды заранее пачками кладутся в пул (PersonalCoupon без пользователя) командой
+# fill_coupon_pool, а выдача только забирает первый свободный код — без генерации и повторов
+# на уникальности в запросе. На PostgreSQL строка берётся через SELECT ... FOR UPDATE SKIP LOCKED,
+# на остальных базах — одним UPDATE ... WHERE id = (первый свободный) AND user IS NULL.
+# Когда свободных кодов становится меньше COUPON_POOL_LOW_WATER, пул пополняется в фоне.
+
+
+class CouponPool:
+    """Пул личных кодов: выдача одного кода на пользователя в день, пополнение и глубина пула."""
+
+    def __init__(self):
+        self._refill_lock = threading.Lock()
+        self._refilling = False
+
+    @property
+    def low_water(self):
+        return getattr(settings, 'COUPON_POOL_LOW_WATER', 200)
+
+    @property
+    def target_size(self):
+        return getattr(settings, 'COUPON_POOL_SIZE', 1000)
+
+    def free(self):
+        return PersonalCoupon.objects.filter(user__isnull=True).order_by('id')
+
+    def depth(self):
+        """Число свободных кодов (для мониторинга и команды)."""
+        return self.free().count()
+
+    def is_low(self):
+        """Свободных кодов меньше порога; смотрим не дальше порога по частичному индексу."""
+        return not self.free()[self.low_water - 1:self.low_water].exists()
+
+    def refill(self, size=None, batch_size=1000):
+        """Догоняем пул до size свободных кодов. Совпадения кодов просто пропускаются."""
+        size = self.target_size if size is None else size
+        initial = depth = self.depth()
+        while depth < size:
+            PersonalCoupon.objects.bulk_create([
+                PersonalCoupon(code=random_code(), discount=random_discount())
+                for _ in range(min(size - depth, batch_size))
+            ], ignore_conflicts=True)
+            depth = self.depth()
+        return depth - initial
+
+    def _claim_locked(self, user, today, moment):
+        """PostgreSQL: пропускаем строки, которые сейчас забирают другие транзакции."""
+        coupon = self.free().select_for_update(skip_locked=True).first()
+        if coupon is None:
+            return None
+        coupon.user, coupon.issued_on, coupon.issued_at = user, today, moment
+        coupon.save(update_fields=['user', 'issued_on', 'issued_at'])
+        return coupon
+
+    def _claim_update(self, user, today, moment):
+        """Остальные базы: один условный UPDATE; если код перехватили, берём следующий."""
+        for _ in range(3):
+            claimed = PersonalCoupon.objects.filter(
+                pk=Subquery(self.free().values('pk')[:1]), user__isnull=True
+            ).update(user=user, issued_on=today, issued_at=moment)
+            if claimed:
+                return PersonalCoupon.objects.get(user=user, issued_on=today)
+            if not self.free().exists():
+                return None
+        return None
+
+    def claim(self, user, today=None):
+        """Код пользователя на сегодня: уже выданный или первый свободный из пула. None, если пул пуст."""
+        moment = timezone.now()
+        today = today or timezone.localdate(moment)
+        coupon = PersonalCoupon.objects.filter(user=user, issued_on=today).first()
+        if coupon is not None:
+            return coupon
+        claim = self._claim_locked if connection.features.has_select_for_update_skip_locked else self._claim_update
+        try:
+            with transaction.atomic():
+                coupon = claim(user, today, moment)
+        except IntegrityError:
+            # Параллельный запрос того же пользователя успел первым
+            return PersonalCoupon.objects.get(user=user, issued_on=today)
+        if coupon is None:
+            logger.warning("Пул личных купонов пуст")
+        if coupon is None or self.is_low():
+            transaction.on_commit(self.schedule_refill)
+        return coupon
+
+    def schedule_refill(self):
+        """Пополняем пул в фоновом потоке (или сразу при COUPON_POOL_SYNC = True); одно пополнение за раз."""
+        with self._refill_lock:
+            if self._refilling:
+                return
+            self._refilling = True
+        if getattr(settings, 'COUPON_POOL_SYNC', False):
+            self._refill_in_background(close_connections=False)
+        else:
+            threading.Thread(target=self._refill_in_background, daemon=True).start()
+
+    def _refill_in_background(self, close_connections=True):
+        try:
+            created = self.refill()
+            logger.info("Пул личных купонов пополнен на %s кодов", created)
+        except Exception:
+            logger.exception("Не удалось пополнить пул личных купонов")
+        finally:
+            with self._refill_lock:
+                self._refilling = False
+            if close_connections:
+                connections.close_all()  # Соединения фонового потока
+
+
+pool = CouponPool()
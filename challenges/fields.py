@@ -0,0 +1,57 @@
+import zlib
+
+from django import forms
+from django.db import models
+
+# Поля моделей приложения
+
+
+class CompressedTextField(models.BinaryField):
+    """Текст, который хранится в базе сжатым zlib, а в Python выглядит обычной строкой.
+
+    Распаковывается при загрузке из базы, поэтому в списках поле стоит откладывать (defer),
+    тогда оно не читается и не распаковывается вовсе.
+    """
+
+    def __init__(self, *args, level=6, **kwargs):
+        self.level = level
+        kwargs.setdefault('editable', True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.level != 6:
+            kwargs['level'] = self.level
+        return name, path, args, kwargs
+
+    def _check_str_default_value(self):
+        return []  # Значение по умолчанию здесь — строка, она сожмётся при записи
+
+    def get_default(self):
+        default = super().get_default()
+        return '' if default == b'' else default
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return zlib.decompress(bytes(value)).decode('utf-8')
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return zlib.decompress(bytes(value)).decode('utf-8')
+        return value
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if isinstance(value, str):
+            value = zlib.compress(value.encode('utf-8'), self.level)
+        return super().get_db_prep_value(value, connection, prepared)
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+    def formfield(self, **kwargs):
+        return super(models.BinaryField, self).formfield(**{
+            'form_class': forms.CharField,
+            'widget': forms.Textarea,
+            **kwargs,
+        })
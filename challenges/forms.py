@@ -1,7 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
-from .models import Challenge, Book, Quiz, Answer, AudioChallenge, Profile, SupportMessage
+from .models import Challenge, Book, Quiz, AudioChallenge, Profile, SupportMessage
 
 # Форма регистрации пользователя
 class CustomUserCreationForm(UserCreationForm):
@@ -30,9 +30,31 @@ class SupportMessageForm(forms.ModelForm):
 class BookSelectionForm(forms.Form):
     book = forms.ModelChoiceField(queryset=Book.objects.all(), required=True)
 
-# Форма для прохождения квиза
+class AnswerIdsField(forms.MultipleChoiceField):
+    """Множественный выбор id ответов, проверяемый по готовому множеству id без запросов в базу."""
+
+    def __init__(self, *args, allowed_ids=frozenset(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.allowed_ids = allowed_ids
+
+    def valid_value(self, value):
+        try:
+            return int(value) in self.allowed_ids
+        except (TypeError, ValueError):
+            return False
+
+    def clean(self, value):
+        return [int(answer_id) for answer_id in super().clean(value)]
+
+
+# Форма для прохождения квиза: принимает только ответы своего квиза
 class QuizAnswerForm(forms.Form):
-    answers = forms.ModelMultipleChoiceField(queryset=Answer.objects.all(), required=True)
+    answers = AnswerIdsField(required=True)
+
+    def __init__(self, *args, answer_key=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Без ключа квиза допустимых ответов нет, и форма не пройдёт проверку
+        self.fields['answers'].allowed_ids = answer_key.answer_ids if answer_key else frozenset()
 
 
 class AudioChallengeForm(forms.Form):
@@ -48,3 +70,8 @@ class AudioChallengeForm(forms.Form):
                     widget=forms.TextInput(attrs={'placeholder': 'Введите ваш ответ'}),
                     required=True
                 )
+
+
+# Форма загрузки JSONL с квизами в админке
+class QuizImportForm(forms.Form):
+    file = forms.FileField(label='JSONL-файл', help_text='Один квиз на строку, как в команде import_quizzes')
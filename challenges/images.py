@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Производные картинок: уменьшенные копии нескольких ширин в WebP и JPEG для srcset.
+# Лежат в MEDIA_ROOT/derivatives/<исходное имя>.<ширина>.<формат>, рядом — манифест
+# <исходное имя>.json с размерами оригинала и списком ширин. Шаблонный тег responsive_image
+# читает манифест (через кэш), а пока производных нет — отдаёт оригинал.
+
+DERIVATIVES_DIR = 'derivatives'
+FORMATS = {'webp': ('WEBP', {'quality': 80, 'method': 4}), 'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True})}
+MANIFEST_KEY = 'image_manifest:{name}'
+MANIFEST_TIMEOUT = 24 * 3600
+MISSING_TIMEOUT = 60
+
+# Все ImageField приложения: модель -> поле
+IMAGE_FIELDS = {
+    'challenges.challenge': 'image',
+    'challenges.couponimage': 'image',
+    'challenges.quiz': 'image',
+    'challenges.book': 'image',
+    'challenges.audiochallenge': 'image',
+    'challenges.profile': 'avatar',
+}
+
+
+def widths():
+    return tuple(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', (320, 640, 1280)))
+
+
+def derivative_name(name, width, extension):
+    return f'{DERIVATIVES_DIR}/{name}.{width}.{extension}'
+
+
+def manifest_name(name):
+    return f'{DERIVATIVES_DIR}/{name}.json'
+
+
+def generate(media_root, name, target_widths):
+    """Работа воркера (без базы): пишем производные и манифест, возвращаем манифест."""
+    from PIL import Image, ImageOps
+
+    with Image.open(os.path.join(media_root, name)) as source:
+        image = ImageOps.exif_transpose(source)
+        image.load()
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    # Не увеличиваем: ширины больше оригинала заменяются самим оригинальным размером
+    variant_widths = sorted({min(width, image.width) for width in target_widths})
+
+    os.makedirs(os.path.dirname(os.path.join(media_root, derivative_name(name, 0, 'x'))), exist_ok=True)
+    for width in variant_widths:
+        height = max(round(image.height * width / image.width), 1)
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for extension, (pil_format, options) in FORMATS.items():
+            variant = resized
+            if pil_format == 'JPEG' and has_alpha:
+                variant = Image.new('RGB', resized.size, 'white')
+                variant.paste(resized, mask=resized.getchannel('A'))
+            variant.save(os.path.join(media_root, derivative_name(name, width, extension)), pil_format, **options)
+
+    manifest = {'width': image.width, 'height': image.height, 'widths': variant_widths}
+    with open(os.path.join(media_root, manifest_name(name)), 'w', encoding='utf-8') as output:
+        json.dump(manifest, output)
+    return manifest
+
+
+def manifest(name):
+    """Манифест производных или None, если их ещё нет. Отсутствие кэшируется ненадолго."""
+    key = MANIFEST_KEY.format(name=name)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached or None
+    try:
+        with open(os.path.join(settings.MEDIA_ROOT, manifest_name(name)), encoding='utf-8') as source:
+            data = json.load(source)
+    except (OSError, ValueError):
+        cache.set(key, {}, MISSING_TIMEOUT)
+        return None
+    cache.set(key, data, MANIFEST_TIMEOUT)
+    return data
+
+
+def has_derivatives(name):
+    return os.path.exists(os.path.join(settings.MEDIA_ROOT, manifest_name(name)))
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Пул процессов для Pillow (IMAGE_PROCESSING_WORKERS, по умолчанию 2)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=getattr(settings, 'IMAGE_PROCESSING_WORKERS', 2))
+        return _executor
+
+
+def remember(name, data):
+    cache.set(MANIFEST_KEY.format(name=name), data, MANIFEST_TIMEOUT)
+
+
+def _on_done(name, future):
+    try:
+        remember(name, future.result())
+    except Exception:
+        logger.exception("Не удалось сделать производные для %s", name)
+
+
+def submit(name):
+    future = get_executor().submit(generate, str(settings.MEDIA_ROOT), name, widths())
+    future.add_done_callback(lambda done: _on_done(name, done))
+    return future
+
+
+ORIGINAL_NAME_ATTR = '_original_image_name'
+
+
+def remember_original(instance):
+    """Запоминаем имя файла загруженного экземпляра, чтобы после сохранения понять, заменили ли его."""
+    field = IMAGE_FIELDS[instance._meta.label_lower]
+    if field not in instance.get_deferred_fields():
+        instance.__dict__[ORIGINAL_NAME_ATTR] = getattr(instance, field).name
+
+
+def changed_name(instance, update_fields=None):
+    """Имя нового файла после сохранения; None, если файл не менялся или это значение поля по умолчанию."""
+    field = IMAGE_FIELDS[instance._meta.label_lower]
+    if field in instance.get_deferred_fields() or (update_fields is not None and field not in update_fields):
+        return None
+    name = getattr(instance, field).name
+    previous = instance.__dict__.get(ORIGINAL_NAME_ATTR)
+    instance.__dict__[ORIGINAL_NAME_ATTR] = name
+    if not name or name == previous or name == instance._meta.get_field(field).get_default():
+        return None
+    return name
+
+
+def schedule(name):
+    """Точка входа для сигналов: сделать производные нового файла вне запроса."""
+    if not name or has_derivatives(name) or not os.path.exists(os.path.join(settings.MEDIA_ROOT, name)):
+        return
+    if getattr(settings, 'IMAGE_PROCESSING_SYNC', False):
+        try:
+            remember(name, generate(str(settings.MEDIA_ROOT), name, widths()))
+        except Exception:
+            logger.exception("Не удалось сделать производные для %s", name)
+    else:
+        submit(name)
+
+
+def image_names():
+    """Все имена файлов из IMAGE_FIELDS без повторов (например, общая аватарка по умолчанию)."""
+    names = set()
+    for label, field in IMAGE_FIELDS.items():
+        model = apps.get_model(label)
+        names.update(model._base_manager.exclude(**{field: ''}).values_list(field, flat=True).distinct())
+    names.discard(None)
+    return sorted(names)
@@ -0,0 +1,228 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import CompletedChallenge, LeaderboardEntry, LeaderboardBucket, LeaderboardScoreCount
+
+LEADERBOARD_SIZE = 10
+
+WINDOWS = [scope for scope, label in LeaderboardBucket.SCOPE_CHOICES]
+
+
+def period_key(scope, moment=None, challenge_id=None):
+    """Ключ окна: дата для дня, ISO-неделя для недели, id для челленджа, '' для всего времени."""
+    if scope == LeaderboardBucket.SCOPE_ALL:
+        return ''
+    if scope == LeaderboardBucket.SCOPE_CHALLENGE:
+        return str(challenge_id)
+    moment = timezone.localtime(moment or timezone.now())
+    if scope == LeaderboardBucket.SCOPE_DAY:
+        return moment.date().isoformat()
+    year, week, _ = moment.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def completion_windows(completed_at, challenge_id):
+    """Все окна, в которые попадает одно завершение челленджа."""
+    return [
+        (LeaderboardBucket.SCOPE_DAY, period_key(LeaderboardBucket.SCOPE_DAY, completed_at)),
+        (LeaderboardBucket.SCOPE_WEEK, period_key(LeaderboardBucket.SCOPE_WEEK, completed_at)),
+        (LeaderboardBucket.SCOPE_CHALLENGE, period_key(LeaderboardBucket.SCOPE_CHALLENGE, challenge_id=challenge_id)),
+    ]
+
+
+def _shift_histogram(scope, period, old_score, new_score):
+    """Переносим пользователя из столбца old_score гистограммы в new_score."""
+    if old_score > 0:
+        LeaderboardScoreCount.objects.filter(
+            scope=scope, period=period, score=old_score, users__gt=0
+        ).update(users=F('users') - 1)
+    if new_score > 0:
+        row, created = LeaderboardScoreCount.objects.get_or_create(
+            scope=scope, period=period, score=new_score, defaults={'users': 1}
+        )
+        if not created:
+            LeaderboardScoreCount.objects.filter(pk=row.pk).update(users=F('users') + 1)
+
+
+def _bump(queryset, lookup, delta, moment):
+    """Меняем счёт строки окна на delta и двигаем пользователя в гистограмме.
+
+    При delta < 0 отсутствующие строки не создаются (например, при каскадном удалении пользователя).
+    """
+    if delta > 0:
+        row, _ = queryset.select_for_update().get_or_create(**lookup)
+    else:
+        row = queryset.select_for_update().filter(**lookup).first()
+        if row is None:
+            return None
+    old_score = row.challenge_count
+    new_score = max(old_score + delta, 0)
+    if new_score != old_score:
+        changes = {'challenge_count': new_score}
+        if delta > 0 and hasattr(row, 'reached_at'):
+            changes['reached_at'] = moment
+        queryset.filter(pk=row.pk).update(**changes)
+    return old_score, new_score
+
+
+def record_completion(user_id, delta=1, completed_at=None, challenge_id=None):
+    """Инкрементально меняем счёт пользователя на delta во всех окнах (вызывается из сигналов)."""
+    moment = completed_at or timezone.now()
+    windows = [(LeaderboardBucket.SCOPE_ALL, '')]
+    if challenge_id is not None:
+        windows += completion_windows(moment, challenge_id)
+
+    with transaction.atomic():
+        for scope, period in windows:
+            if scope == LeaderboardBucket.SCOPE_ALL:
+                scores = _bump(LeaderboardEntry.objects, {'user_id': user_id}, delta, moment)
+            else:
+                scores = _bump(
+                    LeaderboardBucket.objects,
+                    {'scope': scope, 'period': period, 'user_id': user_id},
+                    delta,
+                    moment,
+                )
+            if scores is not None:
+                _shift_histogram(scope, period, *scores)
+
+
+def forget_user(user_id):
+    """Убираем пользователя из гистограмм и окон до каскадного удаления (вызывается из pre_delete).
+
+    Строки таблицы и CompletedChallenge удаляются каскадом в произвольном порядке; если строка
+    окна уйдёт раньше завершений, её счёт уже не вычесть из гистограммы — поэтому вычитаем заранее.
+    """
+    with transaction.atomic():
+        scores = [
+            (LeaderboardBucket.SCOPE_ALL, '', score)
+            for score in LeaderboardEntry.objects.filter(user_id=user_id, challenge_count__gt=0)
+            .values_list('challenge_count', flat=True)
+        ]
+        scores += LeaderboardBucket.objects.filter(user_id=user_id, challenge_count__gt=0).values_list(
+            'scope', 'period', 'challenge_count'
+        )
+        for scope, period, score in scores:
+            _shift_histogram(scope, period, score, 0)
+        LeaderboardEntry.objects.filter(user_id=user_id).delete()
+        LeaderboardBucket.objects.filter(user_id=user_id).delete()
+
+
+def with_ranks(entries):
+    """Проставляем entry.rank с учётом ничьих — то же место, что даёт user_rank по гистограмме.
+
+    Топ отсортирован по убыванию счёта, поэтому все, у кого счёт больше, уже стоят выше в списке.
+    """
+    entries = list(entries)
+    for position, entry in enumerate(entries):
+        if position == 0 or entry.challenge_count != entries[position - 1].challenge_count:
+            rank = position + 1
+        entry.rank = rank
+    return entries
+
+
+def top_entries(limit=LEADERBOARD_SIZE, scope=LeaderboardBucket.SCOPE_ALL, period=''):
+    """Топ пользователей окна одним запросом по индексу, имена уже подтянуты через JOIN."""
+    if scope == LeaderboardBucket.SCOPE_ALL:
+        return (
+            LeaderboardEntry.objects.select_related('user')
+            .filter(challenge_count__gt=0)
+            .order_by('-challenge_count', 'user_id')[:limit]
+        )
+    return (
+        LeaderboardBucket.objects.select_related('user')
+        .filter(scope=scope, period=period, challenge_count__gt=0)
+        .order_by('-challenge_count', 'reached_at', 'user_id')[:limit]
+    )
+
+
+def user_rank(user_id, scope=LeaderboardBucket.SCOPE_ALL, period=''):
+    """Место пользователя в окне: {'rank', 'challenge_count'} или None, если он ещё ничего не завершил.
+
+    Считается по гистограмме счетов, без сортировки пользователей.
+    """
+    if scope == LeaderboardBucket.SCOPE_ALL:
+        scores = LeaderboardEntry.objects.filter(user_id=user_id)
+    else:
+        scores = LeaderboardBucket.objects.filter(scope=scope, period=period, user_id=user_id)
+    score = scores.values_list('challenge_count', flat=True).first()
+    if not score:
+        return None
+    ahead = LeaderboardScoreCount.objects.filter(
+        scope=scope, period=period, score__gt=score
+    ).aggregate(total=Sum('users'))['total'] or 0
+    return {'rank': ahead + 1, 'challenge_count': score}
+
+
+def live_counts():
+    """Эталонный агрегат по CompletedChallenge: {user_id: количество}."""
+    rows = CompletedChallenge.objects.values('user').annotate(challenge_count=Count('challenge'))
+    return {row['user']: row['challenge_count'] for row in rows}
+
+
+def window_buckets(rows):
+    """Счёт и момент последнего завершения по окнам из строк (user_id, challenge_id, completed_at),
+    упорядоченных по completed_at: {(scope, period, user_id): [count, reached_at]}."""
+    buckets = {}
+    for user_id, challenge_id, completed_at in rows:
+        for scope, period in completion_windows(completed_at, challenge_id):
+            bucket = buckets.setdefault((scope, period, user_id), [0, completed_at])
+            bucket[0] += 1
+            bucket[1] = completed_at
+    return buckets
+
+
+def score_histogram(counts, buckets):
+    """Гистограмма {(scope, period, score): users} для окна «всё время» и остальных окон."""
+    histogram = Counter((LeaderboardBucket.SCOPE_ALL, '', count) for count in counts.values())
+    histogram.update((scope, period, count) for (scope, period, _), (count, _) in buckets.items())
+    return histogram
+
+
+def rebuild():
+    """Пересобираем таблицу и все окна с нуля из CompletedChallenge. Возвращает число пользователей."""
+    counts = live_counts()
+    rows = CompletedChallenge.objects.values_list('user_id', 'challenge_id', 'completed_at').order_by('completed_at')
+    buckets = window_buckets(rows.iterator(chunk_size=5000))
+    histogram = score_histogram(counts, buckets)
+
+    with transaction.atomic():
+        LeaderboardEntry.objects.all().delete()
+        LeaderboardBucket.objects.all().delete()
+        LeaderboardScoreCount.objects.all().delete()
+        LeaderboardEntry.objects.bulk_create(
+            [LeaderboardEntry(user_id=user_id, challenge_count=count) for user_id, count in counts.items()],
+            batch_size=1000,
+        )
+        LeaderboardBucket.objects.bulk_create(
+            [
+                LeaderboardBucket(scope=scope, period=period, user_id=user_id, challenge_count=count, reached_at=reached_at)
+                for (scope, period, user_id), (count, reached_at) in buckets.items()
+            ],
+            batch_size=1000,
+        )
+        LeaderboardScoreCount.objects.bulk_create(
+            [
+                LeaderboardScoreCount(scope=scope, period=period, score=score, users=users)
+                for (scope, period, score), users in histogram.items()
+            ],
+            batch_size=1000,
+        )
+    return len(counts)
+
+
+def find_mismatches():
+    """Сравниваем таблицу с живым агрегатом: {user_id: (в таблице, на самом деле)}."""
+    expected = live_counts()
+    stored = {
+        row['user_id']: row['challenge_count']
+        for row in LeaderboardEntry.objects.filter(challenge_count__gt=0).values('user_id', 'challenge_count')
+    }
+    return {
+        user_id: (stored.get(user_id, 0), expected.get(user_id, 0))
+        for user_id in set(expected) | set(stored)
+        if stored.get(user_id, 0) != expected.get(user_id, 0)
+    }
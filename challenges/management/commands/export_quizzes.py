@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from challenges import quiz_io
+from challenges.models import Quiz
+
+
+class Command(BaseCommand):
+    help = "Потоково экспортирует квизы с вопросами и ответами в JSONL (один квиз на строку)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Путь к JSONL-файлу, '-' для stdout")
+        parser.add_argument('--challenge', type=int, help="Только квизы этого челленджа")
+
+    def handle(self, *args, **options):
+        quizzes = Quiz.objects.all()
+        if options['challenge']:
+            quizzes = quizzes.filter(challenge_id=options['challenge'])
+
+        if options['path'] == '-':
+            for line in quiz_io.export_quizzes(quizzes):
+                self.stdout.write(line, ending='')
+            return
+
+        exported = 0
+        with open(options['path'], 'w', encoding='utf-8') as target:
+            for line in quiz_io.export_quizzes(quizzes):
+                target.write(line)
+                exported += 1
+        self.stdout.write(self.style.SUCCESS(f"Экспортировано квизов: {exported}"))
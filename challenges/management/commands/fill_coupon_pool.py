@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from challenges import coupons
+
+
+class Command(BaseCommand):
+    help = "Заранее генерирует личные купоны: дополняет пул свободных кодов до заданного размера."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=None, help="Сколько свободных кодов держать (COUPON_POOL_SIZE)")
+
+    def handle(self, *args, **options):
+        created = coupons.pool.refill(options['size'])
+        self.stdout.write(self.style.SUCCESS(f"Добавлено кодов: {created}, свободных в пуле: {coupons.pool.depth()}"))
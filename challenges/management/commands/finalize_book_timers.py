@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from challenges import reading
+
+
+class Command(BaseCommand):
+    help = "Закрывает все истёкшие таймеры чтения одним UPDATE."
+
+    def handle(self, *args, **options):
+        finalized = reading.finalize_expired_timers()
+        self.stdout.write(self.style.SUCCESS(f"Закрыто таймеров: {finalized}"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from challenges import attempts
+
+
+class Command(BaseCommand):
+    help = "Догружает в базу попытки из журналов воркеров, умерших до сброса буфера."
+
+    def handle(self, *args, **options):
+        replayed = attempts.replay_journals()
+        self.stdout.write(self.style.SUCCESS(f"Догружено попыток из журналов: {replayed}"))
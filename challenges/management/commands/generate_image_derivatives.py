@@ -0,0 +1,36 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from challenges import images
+
+
+class Command(BaseCommand):
+    help = "Делает уменьшенные WebP/JPEG-копии для всех картинок приложения, параллельно в нескольких процессах."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Пересоздать и уже существующие производные")
+        parser.add_argument(
+            '--workers', type=int, default=getattr(settings, 'IMAGE_PROCESSING_WORKERS', 2),
+            help="Число процессов",
+        )
+
+    def handle(self, *args, **options):
+        names = [name for name in images.image_names() if options['force'] or not images.has_derivatives(name)]
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {
+                executor.submit(images.generate, str(settings.MEDIA_ROOT), name, images.widths()): name
+                for name in names
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    images.remember(name, future.result())
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"{name}: {exc}")
+                else:
+                    done += 1
+        self.stdout.write(self.style.SUCCESS(f"Обработано картинок: {done}, с ошибками: {failed}"))
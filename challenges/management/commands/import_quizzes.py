@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from challenges import quiz_io
+
+
+class Command(BaseCommand):
+    help = "Потоково импортирует квизы с вопросами и ответами из JSONL (один квиз на строку)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Путь к JSONL-файлу")
+        parser.add_argument('--batch-size', type=int, default=quiz_io.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        stats = quiz_io.ImportStats()
+        try:
+            with open(options['path'], encoding='utf-8') as source:
+                quiz_io.import_quizzes(source, batch_size=options['batch_size'], stats=stats)
+        except OSError as exc:
+            raise CommandError(f"Не удалось открыть файл: {exc}")
+        except quiz_io.QuizImportError as exc:
+            # Каждый квиз импортируется в своей транзакции, поэтому предыдущие строки уже сохранены
+            raise CommandError(f"{exc}. Уже импортировано: {stats}")
+        self.stdout.write(self.style.SUCCESS(str(stats)))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from challenges import audio_processing
+from challenges.models import AudioQuestion
+
+
+class Command(BaseCommand):
+    help = "Обрабатывает аудио вопросов: метаданные, облегчённая версия и пики. По умолчанию только необработанные."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Переобработать все вопросы, а не только необработанные")
+
+    def handle(self, *args, **options):
+        questions = AudioQuestion.objects.exclude(audio_file='')
+        if not options['all']:
+            questions = questions.exclude(processing_status=AudioQuestion.STATUS_DONE)
+
+        executor = audio_processing.get_executor()
+        jobs = [
+            (question, executor.submit(
+                audio_processing.process_file, question.audio_file.path, audio_processing.stream_target_base(question)
+            ))
+            for question in questions
+        ]
+        done = 0
+        for question, future in jobs:
+            try:
+                result = future.result()
+            except Exception as exc:
+                audio_processing.mark_failed(question.pk, question.audio_file.name)
+                self.stderr.write(f"{question.audio_file.name}: {exc}")
+            else:
+                audio_processing.apply_result(question.pk, question.audio_file.name, result)
+                done += 1
+        self.stdout.write(self.style.SUCCESS(f"Обработано файлов: {done} из {len(jobs)}"))
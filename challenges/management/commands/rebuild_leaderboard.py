@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from challenges import leaderboard
+
+
+class Command(BaseCommand):
+    help = "Пересобирает таблицу лидеров и окна (день, неделя, челлендж) из CompletedChallenge и сверяет её с живым агрегатом."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check-only',
+            action='store_true',
+            help="Только сверить таблицу с агрегатом, ничего не перезаписывая.",
+        )
+
+    def handle(self, *args, **options):
+        if not options['check_only']:
+            rows = leaderboard.rebuild()
+            self.stdout.write(f"Таблица лидеров пересобрана: {rows} пользователей.")
+
+        mismatches = leaderboard.find_mismatches()
+        if mismatches:
+            for user_id, (stored, expected) in sorted(mismatches.items()):
+                self.stderr.write(f"user_id={user_id}: в таблице {stored}, по агрегату {expected}")
+            raise CommandError(f"Расхождений с агрегатом: {len(mismatches)}")
+        self.stdout.write(self.style.SUCCESS("Таблица лидеров совпадает с агрегатом."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from challenges import search
+
+
+class Command(BaseCommand):
+    help = "Пересобирает поисковый индекс по книгам, челленджам и квизам."
+
+    def handle(self, *args, **options):
+        entries = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Поисковый индекс пересобран: {entries} записей"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from challenges import stats
+
+
+class Command(BaseCommand):
+    help = "Полностью пересчитывает сводную статистику челленджей (запускать по расписанию, например раз в час)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('challenge_ids', nargs='*', type=int, help="Только эти челленджи")
+
+    def handle(self, *args, **options):
+        updated = stats.refresh(options['challenge_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f"Статистика пересчитана для {updated} челленджей"))
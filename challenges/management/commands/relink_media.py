@@ -0,0 +1,60 @@
+from django.apps import apps
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from challenges import images
+from challenges.storage import CAS_DIR, content_hash, content_name, content_storage
+
+
+class Command(BaseCommand):
+    help = "Переносит старые картинки в хранилище по содержимому: одинаковые файлы становятся одним."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Только посчитать, ничего не менять")
+        parser.add_argument(
+            '--delete-originals', action='store_true',
+            help="Удалить старые файлы после переноса (кроме значений полей по умолчанию)",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        relinked = {}  # старое имя -> новое
+        keep = set()
+        rows = saved_bytes = 0
+        for label, field in images.IMAGE_FIELDS.items():
+            model = apps.get_model(label)
+            default = model._meta.get_field(field).default
+            if isinstance(default, str):
+                keep.add(default)  # новые записи продолжат ссылаться на файл по умолчанию
+            names = (
+                model._base_manager.exclude(**{field: ''}).exclude(**{f'{field}__startswith': f'{CAS_DIR}/'})
+                .values_list(field, flat=True).distinct()
+            )
+            for name in names:
+                if name is None:
+                    continue
+                if name not in relinked:
+                    if not content_storage.exists(name):
+                        self.stderr.write(f"{name}: файл не найден")
+                        continue
+                    with content_storage.open(name) as source:
+                        new_name = content_name(content_hash(File(source)), name)
+                        if content_storage.exists(new_name) or new_name in relinked.values():
+                            saved_bytes += content_storage.size(name)
+                        elif not dry_run:
+                            content_storage.save(name, File(source))
+                    relinked[name] = new_name
+                matching = model._base_manager.filter(**{field: name})
+                rows += matching.count() if dry_run else matching.update(**{field: relinked[name]})
+
+        if options['delete_originals'] and not dry_run:
+            for name in set(relinked) - keep:
+                content_storage.delete(name)
+
+        unique = len(set(relinked.values()))
+        self.stdout.write(self.style.SUCCESS(
+            f"Файлов: {len(relinked)}, уникальных: {unique}, записей обновлено: {rows}, "
+            f"повторов на {saved_bytes / 1024:.0f} КБ"
+        ))
+        if relinked and not dry_run:
+            self.stdout.write("Запустите generate_image_derivatives, чтобы сделать производные для новых имён.")
@@ -0,0 +1,158 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+# Раздача медиафайлов с поддержкой Range/206 и условных GET (ETag, Last-Modified).
+# В продакшене отдачу можно переложить на nginx (X-Accel-Redirect) или apache/lighttpd (X-Sendfile)
+# настройкой MEDIA_OFFLOAD = 'x-accel-redirect' | 'x-sendfile'.
+
+# Файлы хранилища по содержимому (challenges.storage) и их производные не меняются под тем же
+# именем, поэтому кэшируем их на год с immutable
+IMMUTABLE_PREFIXES = ('cas/', 'derivatives/cas/')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+SERVED_PREFIXES = ('audio_questions/', 'audio_challenges/') + IMMUTABLE_PREFIXES
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFileWrapper:
+    """Файл, из которого читается только диапазон [start, start + length).
+
+    fileno() и tell() оставлены, чтобы wsgi.file_wrapper сервера (например, sendfile в gunicorn)
+    мог отдать диапазон без копирования в пространство пользователя.
+    """
+
+    def __init__(self, filelike, start, length):
+        self.filelike = filelike
+        self.remaining = length
+        filelike.seek(start)
+
+    def fileno(self):
+        return self.filelike.fileno()
+
+    def tell(self):
+        return self.filelike.tell()
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.filelike.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.filelike.close()
+
+
+def file_etag(stat):
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """(start, end) включительно для одного диапазона, None если заголовка нет.
+
+    ValueError, если диапазон невыполним (ответ 416). Несколько диапазонов не поддерживаем
+    и отдаём файл целиком, как разрешает RFC 9110.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-500: последние 500 байт
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _etag_matches(header, etag):
+    return header.strip() == '*' or etag in [tag.strip() for tag in header.split(',')]
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+
+def _set_common_headers(response, etag, mtime, immutable=False):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    response['Accept-Ranges'] = 'bytes'
+    if immutable:
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'MEDIA_CACHE_MAX_AGE', 7 * 24 * 3600))
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """Отдаём медиафайл из MEDIA_ROOT с поддержкой перемотки (Range) и кэширования браузером."""
+    if not path.startswith(SERVED_PREFIXES):
+        raise Http404
+    immutable = path.startswith(IMMUTABLE_PREFIXES)
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    etag = file_etag(stat)
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    if _not_modified(request, etag, stat.st_mtime):
+        return _set_common_headers(HttpResponseNotModified(), etag, stat.st_mtime, immutable)
+
+    offload = getattr(settings, 'MEDIA_OFFLOAD', None)
+    if offload:
+        # Range, ETag и sendfile обработает сам веб-сервер
+        response = HttpResponse(content_type=content_type)
+        if offload == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/') + path
+        else:
+            response['X-Sendfile'] = full_path
+        return _set_common_headers(response, etag, stat.st_mtime, immutable)
+
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is None or _etag_matches(if_range, etag):
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return _set_common_headers(response, etag, stat.st_mtime, immutable)
+
+    filelike = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(filelike, content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(RangeFileWrapper(filelike, start, length), status=206, content_type=content_type)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    return _set_common_headers(response, etag, stat.st_mtime, immutable)
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.18 on 2026-10-18 15:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def fill_entries(apps, schema_editor):
+    CompletedChallenge = apps.get_model('challenges', 'CompletedChallenge')
+    LeaderboardEntry = apps.get_model('challenges', 'LeaderboardEntry')
+    rows = CompletedChallenge.objects.values('user').annotate(challenge_count=Count('challenge')).order_by()
+    LeaderboardEntry.objects.bulk_create(
+        [LeaderboardEntry(user_id=row['user'], challenge_count=row['challenge_count']) for row in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('challenges', '0021_supportmessage_supportresponse'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('challenge_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entry', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-challenge_count', 'user'], name='leaderboard_score_idx')],
+            },
+        ),
+        migrations.RunPython(fill_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 4.2.18 on 2026-10-18 15:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+from challenges.leaderboard import score_histogram, window_buckets
+
+
+def fill_windows(apps, schema_editor):
+    CompletedChallenge = apps.get_model('challenges', 'CompletedChallenge')
+    LeaderboardEntry = apps.get_model('challenges', 'LeaderboardEntry')
+    LeaderboardBucket = apps.get_model('challenges', 'LeaderboardBucket')
+    LeaderboardScoreCount = apps.get_model('challenges', 'LeaderboardScoreCount')
+
+    counts = dict(LeaderboardEntry.objects.filter(challenge_count__gt=0).values_list('user_id', 'challenge_count'))
+    rows = CompletedChallenge.objects.values_list('user_id', 'challenge_id', 'completed_at').order_by('completed_at')
+    buckets = window_buckets(rows.iterator(chunk_size=5000))
+    LeaderboardBucket.objects.bulk_create(
+        [
+            LeaderboardBucket(scope=scope, period=period, user_id=user_id, challenge_count=count, reached_at=reached_at)
+            for (scope, period, user_id), (count, reached_at) in buckets.items()
+        ],
+        batch_size=1000,
+    )
+    LeaderboardScoreCount.objects.bulk_create(
+        [
+            LeaderboardScoreCount(scope=scope, period=period, score=score, users=users)
+            for (scope, period, score), users in score_histogram(counts, buckets).items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('challenges', '0022_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('all', 'За всё время'), ('day', 'Сегодня'), ('week', 'Эта неделя'), ('challenge', 'Челлендж')], max_length=16)),
+                ('period', models.CharField(max_length=32)),
+                ('challenge_count', models.PositiveIntegerField(default=0)),
+                ('reached_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LeaderboardScoreCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('all', 'За всё время'), ('day', 'Сегодня'), ('week', 'Эта неделя'), ('challenge', 'Челлендж')], max_length=16)),
+                ('period', models.CharField(blank=True, max_length=32)),
+                ('score', models.PositiveIntegerField()),
+                ('users', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='leaderboardscorecount',
+            constraint=models.UniqueConstraint(fields=('scope', 'period', 'score'), name='leaderboard_score_count_unique'),
+        ),
+        migrations.AddField(
+            model_name='leaderboardbucket',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_buckets', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardbucket',
+            index=models.Index(fields=['scope', 'period', '-challenge_count', 'reached_at'], name='leaderboard_bucket_top_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='leaderboardbucket',
+            constraint=models.UniqueConstraint(fields=('scope', 'period', 'user'), name='leaderboard_bucket_unique'),
+        ),
+        migrations.RunPython(fill_windows, migrations.RunPython.noop),
+    ]
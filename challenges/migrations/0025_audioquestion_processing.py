@@ -0,0 +1,38 @@
+# Generated by Django 4.2.18 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0024_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audioquestion',
+            name='bitrate',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Битрейт, кбит/с'),
+        ),
+        migrations.AddField(
+            model_name='audioquestion',
+            name='duration',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Длительность, с'),
+        ),
+        migrations.AddField(
+            model_name='audioquestion',
+            name='peaks',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='audioquestion',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'В обработке'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', editable=False, max_length=16, verbose_name='Обработка'),
+        ),
+        migrations.AddField(
+            model_name='audioquestion',
+            name='stream_file',
+            field=models.FileField(blank=True, editable=False, upload_to='audio_questions/stream/'),
+        ),
+    ]
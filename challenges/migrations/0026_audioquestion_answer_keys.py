@@ -0,0 +1,39 @@
+# Generated by Django 4.2.18 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+from challenges.answer_matching import answer_keys
+
+
+def fill_normalized_answers(apps, schema_editor):
+    AudioQuestion = apps.get_model('challenges', 'AudioQuestion')
+    questions = list(AudioQuestion.objects.only('correct_answer'))
+    for question in questions:
+        question.normalized_answers = answer_keys([question.correct_answer])
+    AudioQuestion.objects.bulk_update(questions, ['normalized_answers'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0025_audioquestion_processing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audioquestion',
+            name='alternate_answers',
+            field=models.TextField(blank=True, help_text='По одному на строку', verbose_name='Другие верные ответы'),
+        ),
+        migrations.AddField(
+            model_name='audioquestion',
+            name='answer_tolerance',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Сколько правок (букв) прощается в ответе', verbose_name='Допустимые опечатки'),
+        ),
+        migrations.AddField(
+            model_name='audioquestion',
+            name='normalized_answers',
+            field=models.JSONField(default=list, editable=False),
+        ),
+        migrations.RunPython(fill_normalized_answers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.18 on 2026-10-18 16:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from challenges.book_pages import build_pages
+
+
+def split_existing_books(apps, schema_editor):
+    Book = apps.get_model('challenges', 'Book')
+    BookPage = apps.get_model('challenges', 'BookPage')
+    for book in Book.objects.only('full_text').iterator():
+        pages = build_pages(BookPage, book.pk, book.full_text or '')
+        BookPage.objects.bulk_create(pages, batch_size=500)
+        Book.objects.filter(pk=book.pk).update(page_count=len(pages))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0026_audioquestion_answer_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='page_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='BookPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('start', models.PositiveIntegerField()),
+                ('end', models.PositiveIntegerField()),
+                ('heading', models.CharField(blank=True, max_length=255)),
+                ('html', models.TextField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='challenges.book')),
+            ],
+            options={
+                'ordering': ['book', 'number'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='bookpage',
+            constraint=models.UniqueConstraint(fields=('book', 'number'), name='unique_book_page_number'),
+        ),
+        migrations.RunPython(split_existing_books, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.18 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+from challenges import search
+
+
+def install_search_index(apps, schema_editor):
+    search.install(schema_editor)
+    search.fill(apps.get_model('challenges', 'SearchEntry'), search.collect_entries(
+        apps.get_model('challenges', 'Book'),
+        apps.get_model('challenges', 'Challenge'),
+        apps.get_model('challenges', 'Quiz'),
+        apps.get_model('challenges', 'Question'),
+    ))
+
+
+def uninstall_search_index(apps, schema_editor):
+    search.uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0027_book_pages'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('book', 'Книга'), ('challenge', 'Челлендж'), ('quiz', 'Квиз')], max_length=16)),
+                ('object_id', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchentry',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_entry'),
+        ),
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+import challenges.fields
+
+
+def compress_texts(apps, schema_editor):
+    Book = apps.get_model('challenges', 'Book')
+    for book_id, text in Book.objects.values_list('id', 'full_text').iterator():
+        Book.objects.filter(pk=book_id).update(full_text_compressed=text)
+
+
+def decompress_texts(apps, schema_editor):
+    Book = apps.get_model('challenges', 'Book')
+    for book_id, text in Book.objects.values_list('id', 'full_text_compressed').iterator():
+        Book.objects.filter(pk=book_id).update(full_text=text)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0028_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='full_text_compressed',
+            field=challenges.fields.CompressedTextField(default='Текст отсутствует'),
+        ),
+        migrations.RunPython(compress_texts, decompress_texts),
+        migrations.RemoveField(
+            model_name='book',
+            name='full_text',
+        ),
+        migrations.RenameField(
+            model_name='book',
+            old_name='full_text_compressed',
+            new_name='full_text',
+        ),
+    ]
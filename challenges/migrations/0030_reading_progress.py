@@ -0,0 +1,44 @@
+# Generated by Django 4.2.18 on 2026-10-18 16:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('challenges', '0029_book_full_text_compressed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadingProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seconds', models.PositiveIntegerField(default=0)),
+                ('last_page', models.PositiveIntegerField(default=1)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='booktimer',
+            index=models.Index(fields=['is_completed', 'end_time'], name='book_timer_expiry_idx'),
+        ),
+        migrations.AddField(
+            model_name='readingprogress',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reading_progress', to='challenges.book'),
+        ),
+        migrations.AddField(
+            model_name='readingprogress',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reading_progress', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='readingprogress',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='unique_reading_progress'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.18 on 2026-10-18 16:19
+
+import challenges.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0030_reading_progress'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=challenges.storage.ContentAddressedStorage(), upload_to='book_covers/'),
+        ),
+        migrations.AlterField(
+            model_name='challenge',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=challenges.storage.ContentAddressedStorage(), upload_to='challenge_images/'),
+        ),
+        migrations.AlterField(
+            model_name='couponimage',
+            name='image',
+            field=models.ImageField(storage=challenges.storage.ContentAddressedStorage(), upload_to='coupon_images/'),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='avatar',
+            field=models.ImageField(default='avatars/default.png', storage=challenges.storage.ContentAddressedStorage(), upload_to='avatars/'),
+        ),
+        migrations.AlterField(
+            model_name='quiz',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=challenges.storage.ContentAddressedStorage(), upload_to='quiz_images/', verbose_name='Изображение'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.18 on 2026-10-18 16:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('challenges', '0031_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonalCoupon',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=20, unique=True)),
+                ('discount', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('issued_on', models.DateField(blank=True, null=True)),
+                ('issued_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='personal_coupons', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('user__isnull', True)), fields=['id'], name='personal_coupon_free_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='personalcoupon',
+            constraint=models.UniqueConstraint(fields=('user', 'issued_on'), name='unique_personal_coupon_per_day'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.18 on 2026-10-18 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0032_personal_coupon_pool'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='challenge',
+            index=models.Index(fields=['start_date', 'id'], name='challenge_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='challenge',
+            index=models.Index(fields=['end_date'], name='challenge_end_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.18 on 2026-10-18 16:32
+
+from django.db import migrations, models
+from django.db.models import Case, Count, Exists, Max, Min, OuterRef, Value, When
+
+
+def fill_kind(apps, schema_editor):
+    Challenge = apps.get_model('challenges', 'Challenge')
+    AudioChallenge = apps.get_model('challenges', 'AudioChallenge')
+    Quiz = apps.get_model('challenges', 'Quiz')
+    Challenge.objects.update(kind=Case(
+        When(Exists(AudioChallenge.objects.filter(challenge=OuterRef('pk'))), then=Value('audio')),
+        When(Exists(Quiz.objects.filter(challenge=OuterRef('pk'))), then=Value('quiz')),
+        default=Value('book'),
+    ))
+
+
+def remove_duplicate_participants(apps, schema_editor):
+    """Перед уникальным ограничением оставляем одну запись на пару с наибольшим прогрессом."""
+    Participant = apps.get_model('challenges', 'Participant')
+    duplicates = (
+        Participant.objects.values('user', 'challenge')
+        .annotate(rows=Count('id'), keep=Min('id'), best=Max('progress'))
+        .filter(rows__gt=1)
+    )
+    for row in duplicates:
+        Participant.objects.filter(pk=row['keep']).update(progress=row['best'])
+        Participant.objects.filter(user=row['user'], challenge=row['challenge']).exclude(pk=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0033_challenge_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challenge',
+            name='kind',
+            field=models.CharField(choices=[('book', 'Книги'), ('quiz', 'Квизы'), ('audio', 'Аудио')], default='book', editable=False, max_length=8),
+        ),
+        migrations.RunPython(fill_kind, migrations.RunPython.noop),
+        migrations.RunPython(remove_duplicate_participants, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='participant',
+            constraint=models.UniqueConstraint(fields=('user', 'challenge'), name='unique_participant'),
+        ),
+    ]
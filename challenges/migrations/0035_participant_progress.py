@@ -0,0 +1,92 @@
+# Generated by Django 4.2.18 on 2026-10-18 16:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+from django.db.models import Count, FloatField, OuterRef, Subquery
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def _count(queryset, outer):
+    return Coalesce(Subquery(
+        queryset.filter(**{outer: OuterRef('pk')}).order_by().values(outer).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def fill_progress(apps, schema_editor):
+    """Число частей челленджей, выполнения по прошлым успешным попыткам и прогресс участников."""
+    Challenge = apps.get_model('challenges', 'Challenge')
+    ChallengeTask = apps.get_model('challenges', 'ChallengeTask')
+    Quiz = apps.get_model('challenges', 'Quiz')
+    AudioChallenge = apps.get_model('challenges', 'AudioChallenge')
+    QuizAttempt = apps.get_model('challenges', 'QuizAttempt')
+    AudioAttempt = apps.get_model('challenges', 'AudioAttempt')
+    CompletedItem = apps.get_model('challenges', 'CompletedItem')
+    Participant = apps.get_model('challenges', 'Participant')
+
+    Challenge.objects.update(unit_count=(
+        _count(ChallengeTask.objects.all(), 'challenge')
+        + _count(Quiz.objects.all(), 'challenge')
+        + _count(AudioChallenge.objects.all(), 'challenge')
+    ))
+    items = [
+        CompletedItem(user_id=user_id, challenge_id=challenge_id, kind='quiz', object_id=quiz_id)
+        for user_id, challenge_id, quiz_id in QuizAttempt.objects.filter(passed=True, quiz__challenge__isnull=False)
+        .values_list('user_id', 'quiz__challenge_id', 'quiz_id').distinct()
+    ] + [
+        CompletedItem(user_id=user_id, challenge_id=challenge_id, kind='audio', object_id=audio_id)
+        for user_id, challenge_id, audio_id in AudioAttempt.objects.filter(passed=True, audio_challenge__challenge__isnull=False)
+        .values_list('user_id', 'audio_challenge__challenge_id', 'audio_challenge_id').distinct()
+    ]
+    CompletedItem.objects.bulk_create(items, batch_size=500, ignore_conflicts=True)
+
+    completed = Coalesce(Subquery(
+        CompletedItem.objects.filter(challenge=OuterRef('challenge'), user=OuterRef('user'))
+        .order_by().values('user').annotate(total=Count('pk')).values('total')
+    ), 0)
+    total = Subquery(Challenge.objects.filter(pk=OuterRef('challenge')).values('unit_count'))
+    Participant.objects.update(
+        completed_units=completed,
+        progress=Coalesce(Cast(completed, FloatField()) * 100.0 / NullIf(total, 0), 0.0, output_field=FloatField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('challenges', '0034_challenge_kind_unique_participant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challenge',
+            name='unit_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='participant',
+            name='completed_units',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='CompletedItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('task', 'Задание'), ('quiz', 'Квиз'), ('audio', 'Аудиочеллендж')], max_length=8)),
+                ('object_id', models.PositiveIntegerField()),
+                ('completed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('challenge', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completed_items', to='challenges.challenge')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completed_items', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['challenge', 'user'], name='completed_item_challenge_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='completeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'kind', 'object_id'), name='unique_completed_item'),
+        ),
+        migrations.RunPython(fill_progress, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.18 on 2026-10-18 16:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+from django.db.models import Count, F, FloatField, OuterRef, Subquery
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def _count(queryset, field='challenge'):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def _rate(numerator, denominator):
+    return Coalesce(Cast(numerator, FloatField()) * 100.0 / NullIf(denominator, 0), 0.0, output_field=FloatField())
+
+
+def fill_stats(apps, schema_editor):
+    """Счётчики для существующих челленджей; медиану посчитает refresh_challenge_stats."""
+    Challenge = apps.get_model('challenges', 'Challenge')
+    ChallengeStats = apps.get_model('challenges', 'ChallengeStats')
+    Participant = apps.get_model('challenges', 'Participant')
+    CompletedChallenge = apps.get_model('challenges', 'CompletedChallenge')
+    QuizAttempt = apps.get_model('challenges', 'QuizAttempt')
+
+    ChallengeStats.objects.bulk_create(
+        [ChallengeStats(challenge_id=challenge_id) for challenge_id in Challenge.objects.values_list('id', flat=True)],
+        batch_size=500,
+    )
+    ChallengeStats.objects.update(
+        participants=_count(Participant.objects.all()),
+        completions=_count(CompletedChallenge.objects.all()),
+        quiz_attempts=_count(QuizAttempt.objects.all(), 'quiz__challenge'),
+        quiz_passes=_count(QuizAttempt.objects.filter(passed=True), 'quiz__challenge'),
+    )
+    ChallengeStats.objects.update(
+        completion_rate=_rate(F('completions'), F('participants')),
+        quiz_pass_rate=_rate(F('quiz_passes'), F('quiz_attempts')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0035_participant_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChallengeStats',
+            fields=[
+                ('challenge', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='challenges.challenge')),
+                ('participants', models.PositiveIntegerField(default=0)),
+                ('completions', models.PositiveIntegerField(default=0)),
+                ('completion_rate', models.FloatField(default=0.0)),
+                ('median_completion_seconds', models.PositiveIntegerField(blank=True, null=True)),
+                ('quiz_attempts', models.PositiveIntegerField(default=0)),
+                ('quiz_passes', models.PositiveIntegerField(default=0)),
+                ('quiz_pass_rate', models.FloatField(default=0.0)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        # Время присоединения старых участников неизвестно: колонку добавляем без значения,
+        # а значение по умолчанию (now) задаём уже для новых записей
+        migrations.AddField(
+            model_name='participant',
+            name='joined_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='participant',
+            name='joined_at',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True),
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
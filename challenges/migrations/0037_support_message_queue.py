@@ -0,0 +1,31 @@
+# Generated by Django 4.2.18 on 2026-10-18 16:44
+
+from django.db import migrations, models
+
+
+def mark_answered(apps, schema_editor):
+    # Ответы из инлайна раньше не отмечали сообщение отвеченным
+    SupportMessage = apps.get_model('challenges', 'SupportMessage')
+    SupportResponse = apps.get_model('challenges', 'SupportResponse')
+    SupportMessage.objects.filter(
+        is_answered=False, pk__in=SupportResponse.objects.values('message_id')
+    ).update(is_answered=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0036_challenge_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='supportmessage',
+            index=models.Index(fields=['is_answered', 'created_at', 'id'], name='support_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supportmessage',
+            index=models.Index(fields=['created_at', 'id'], name='support_created_idx'),
+        ),
+        migrations.RunPython(mark_answered, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+import challenges.fields
+
+
+def compress_pages(apps, schema_editor):
+    BookPage = apps.get_model('challenges', 'BookPage')
+    for page_id, html in BookPage.objects.values_list('id', 'html').iterator(chunk_size=500):
+        BookPage.objects.filter(pk=page_id).update(html_compressed=html)
+
+
+def decompress_pages(apps, schema_editor):
+    BookPage = apps.get_model('challenges', 'BookPage')
+    for page_id, html in BookPage.objects.values_list('id', 'html_compressed').iterator(chunk_size=500):
+        BookPage.objects.filter(pk=page_id).update(html=html)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0037_support_message_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookpage',
+            name='html_compressed',
+            field=challenges.fields.CompressedTextField(default=''),
+            preserve_default=False,
+        ),
+        migrations.RunPython(compress_pages, decompress_pages),
+        migrations.RemoveField(
+            model_name='bookpage',
+            name='html',
+        ),
+        migrations.RenameField(
+            model_name='bookpage',
+            old_name='html_compressed',
+            new_name='html',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.18 on 2026-10-18 17:23
+
+import challenges.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0038_bookpage_html_compressed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audiochallenge',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=challenges.storage.ContentAddressedStorage(), upload_to='audio_challenge_images/', verbose_name='Изображение'),
+        ),
+    ]
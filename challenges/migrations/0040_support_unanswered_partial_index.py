@@ -0,0 +1,21 @@
+# Generated by Django 4.2.18 on 2026-10-18 17:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0039_audiochallenge_image'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='supportmessage',
+            name='support_queue_idx',
+        ),
+        migrations.AddIndex(
+            model_name='supportmessage',
+            index=models.Index(condition=models.Q(('is_answered', False)), fields=['created_at', 'id'], name='support_unanswered_idx'),
+        ),
+    ]
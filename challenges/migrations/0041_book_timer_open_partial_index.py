@@ -0,0 +1,21 @@
+# Generated by Django 4.2.18 on 2026-10-18 17:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0040_support_unanswered_partial_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='booktimer',
+            name='book_timer_expiry_idx',
+        ),
+        migrations.AddIndex(
+            model_name='booktimer',
+            index=models.Index(condition=models.Q(('is_completed', False)), fields=['end_time'], name='book_timer_open_idx'),
+        ),
+    ]
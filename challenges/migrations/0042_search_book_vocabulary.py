@@ -0,0 +1,25 @@
+from django.db import migrations
+
+from challenges import search
+
+
+def reindex_books(apps, schema_editor):
+    """Записи книг пересобираются по новому документу: начало текста и словарь остального."""
+    Book = apps.get_model('challenges', 'Book')
+    SearchEntry = apps.get_model('challenges', 'SearchEntry')
+    for book in Book.objects.iterator(chunk_size=100):
+        title, body = search.book_document(book)
+        SearchEntry.objects.filter(kind=search.KIND_BOOK, object_id=book.pk).update(
+            title=search.fold(title), body=search.fold(body)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0041_book_timer_open_partial_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(reindex_books, migrations.RunPython.noop),
+    ]
@@ -4,6 +4,12 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 import random
 import string
+import uuid
+from datetime import datetime, time
+
+from . import answer_matching, search
+from .fields import CompressedTextField
+from .storage import content_storage
 
 def get_default_end_time():
     """Возвращает текущее время + 5 минут."""
@@ -11,13 +17,33 @@ def get_default_end_time():
 
 class Challenge(models.Model):
     """Модель для описания челленджа."""
+    KIND_BOOK = 'book'
+    KIND_QUIZ = 'quiz'
+    KIND_AUDIO = 'audio'
+    KIND_CHOICES = [
+        (KIND_BOOK, 'Книги'),
+        (KIND_QUIZ, 'Квизы'),
+        (KIND_AUDIO, 'Аудио'),
+    ]
+
     title = models.CharField(max_length=200)
     description = models.TextField()
     creator = models.ForeignKey(User, on_delete=models.CASCADE)
     start_date = models.DateField()
     end_date = models.DateField()
 
-    image = models.ImageField(upload_to='challenge_images/', null=True, blank=True)  # Поле для изображения
+    image = models.ImageField(upload_to='challenge_images/', storage=content_storage, null=True, blank=True)  # Поле для изображения
+    # Тип по содержимому (аудио > квизы > книги); ведётся сигналами, см. challenges.participation
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES, default=KIND_BOOK, editable=False)
+    # Число заданий, квизов и аудиочелленджей — знаменатель прогресса участников
+    unit_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        # Keyset-пагинация списка по (start_date, id) и фильтры по статусу (challenges.catalog)
+        indexes = [
+            models.Index(fields=['start_date', 'id'], name='challenge_start_idx'),
+            models.Index(fields=['end_date'], name='challenge_end_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -25,7 +51,7 @@ class Challenge(models.Model):
 class CouponImage(models.Model):
     """Модель для изображения купона, привязанного к челленджу."""
     challenge = models.ForeignKey(Challenge, on_delete=models.CASCADE, related_name='coupon_images')
-    image = models.ImageField(upload_to='coupon_images/')
+    image = models.ImageField(upload_to='coupon_images/', storage=content_storage)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -37,6 +63,17 @@ class SupportMessage(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     is_answered = models.BooleanField(default=False)
 
+    class Meta:
+        # Очередь неотвеченных по (created_at, id) и список в админке (challenges.support_queue).
+        # Индекс очереди частичный: Django пишет фильтр как NOT "is_answered", и составной индекс
+        # с is_answered в начале SQLite для такого условия не берёт, а частичный — берёт
+        indexes = [
+            models.Index(
+                fields=['created_at', 'id'], condition=models.Q(is_answered=False), name='support_unanswered_idx'
+            ),
+            models.Index(fields=['created_at', 'id'], name='support_created_idx'),
+        ]
+
     def __str__(self):
         return f"Сообщение от {self.user.username} ({self.created_at})"
 
@@ -51,7 +88,7 @@ class SupportResponse(models.Model):
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    avatar = models.ImageField(upload_to='avatars/', default='avatars/default.png')
+    avatar = models.ImageField(upload_to='avatars/', storage=content_storage, default='avatars/default.png')
 
     def __str__(self):
         return self.user.username
@@ -75,14 +112,57 @@ class DailyCoupon(models.Model):
         return timezone.now() - self.last_updated >= timedelta(days=1)
 
     def save(self, *args, **kwargs):
-        """Переопределяем метод save для генерации нового купона, если прошло 24 часа."""
-        if self.is_new_day() or not self.pk:
+        """Код генерируем только для нового купона; ротацией занимается challenges.coupons."""
+        if not self.code:
             self.generate_coupon()
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Coupon {self.code} - {self.discount}%"
 
+class PersonalCoupon(models.Model):
+    """Код из заранее сгенерированного пула; выдаётся пользователю на один день (challenges.coupons)."""
+    code = models.CharField(max_length=20, unique=True)
+    discount = models.DecimalField(max_digits=5, decimal_places=2)
+    created_at = models.DateTimeField(default=now)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='personal_coupons')
+    issued_on = models.DateField(null=True, blank=True)
+    issued_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'issued_on'], name='unique_personal_coupon_per_day'),
+        ]
+        # Свободные коды по порядку: выдача берёт первый из частичного индекса
+        indexes = [models.Index(fields=['id'], condition=models.Q(user__isnull=True), name='personal_coupon_free_idx')]
+
+    @property
+    def expires_at(self):
+        """Код действует до конца дня выдачи (по местному времени)."""
+        return timezone.make_aware(datetime.combine(self.issued_on + timedelta(days=1), time.min))
+
+    def __str__(self):
+        return f"{self.code} - {self.discount}%"
+
+class ChallengeStats(models.Model):
+    """Сводка по челленджу для админки и страницы статистики (challenges.stats).
+
+    Счётчики обновляются сигналами и сбросом попыток, медиана — только полным пересчётом
+    командой refresh_challenge_stats.
+    """
+    challenge = models.OneToOneField(Challenge, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    participants = models.PositiveIntegerField(default=0)
+    completions = models.PositiveIntegerField(default=0)
+    completion_rate = models.FloatField(default=0.0)
+    median_completion_seconds = models.PositiveIntegerField(null=True, blank=True)
+    quiz_attempts = models.PositiveIntegerField(default=0)
+    quiz_passes = models.PositiveIntegerField(default=0)
+    quiz_pass_rate = models.FloatField(default=0.0)
+    refreshed_at = models.DateTimeField(null=True, blank=True)  # Последний полный пересчёт
+
+    def __str__(self):
+        return f"Статистика: {self.challenge_id}"
+
 class CompletedChallenge(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     challenge = models.ForeignKey(Challenge, on_delete=models.CASCADE)
@@ -95,38 +175,165 @@ class CompletedChallenge(models.Model):
     def __str__(self):
         return f"{self.user.username} завершил {self.challenge.title}"
 
+class LeaderboardEntry(models.Model):
+    """Денормализованный счёт пользователя для таблицы лидеров.
+
+    Поддерживается сигналами на CompletedChallenge, пересобирается командой rebuild_leaderboard.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='leaderboard_entry')
+    challenge_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-challenge_count', 'user'], name='leaderboard_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.challenge_count}"
+
+class LeaderboardBucket(models.Model):
+    """Счётчик завершений пользователя в окне: день, ISO-неделя или конкретный челлендж."""
+    SCOPE_ALL = 'all'
+    SCOPE_DAY = 'day'
+    SCOPE_WEEK = 'week'
+    SCOPE_CHALLENGE = 'challenge'
+    SCOPE_CHOICES = [
+        (SCOPE_ALL, 'За всё время'),
+        (SCOPE_DAY, 'Сегодня'),
+        (SCOPE_WEEK, 'Эта неделя'),
+        (SCOPE_CHALLENGE, 'Челлендж'),
+    ]
+
+    scope = models.CharField(max_length=16, choices=SCOPE_CHOICES)
+    period = models.CharField(max_length=32)  # '2025-01-28', '2025-W05' или id челленджа
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='leaderboard_buckets')
+    challenge_count = models.PositiveIntegerField(default=0)
+    reached_at = models.DateTimeField(default=timezone.now)  # Когда достигнут текущий счёт, для равных мест
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'period', 'user'], name='leaderboard_bucket_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['scope', 'period', '-challenge_count', 'reached_at'], name='leaderboard_bucket_top_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.period} {self.user.username}: {self.challenge_count}"
+
+class LeaderboardScoreCount(models.Model):
+    """Гистограмма окна: сколько пользователей имеют ровно score завершений.
+
+    Место пользователя = 1 + число пользователей с большим счётом, поэтому запрос ранга
+    читает только строки гистограммы (их не больше, чем различных счетов), а не всех пользователей.
+    """
+    scope = models.CharField(max_length=16, choices=LeaderboardBucket.SCOPE_CHOICES)
+    period = models.CharField(max_length=32, blank=True)
+    score = models.PositiveIntegerField()
+    users = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'period', 'score'], name='leaderboard_score_count_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.period} score={self.score}: {self.users}"
 
 
 class ChallengeTask(models.Model):
     """Задачи, входящие в челлендж."""
     challenge = models.ForeignKey(Challenge, on_delete=models.CASCADE, related_name='tasks')
     title = models.CharField(max_length=200)
-    is_completed = models.BooleanField(default=False)
+    is_completed = models.BooleanField(default=False)  # Общий флаг; выполнение по пользователям — CompletedItem
 
     def __str__(self):
         return self.title
 
+class BookManager(models.Manager):
+    """Списки книг не читают полный текст: он загрузится при первом обращении к book.full_text."""
+
+    def get_queryset(self):
+        return super().get_queryset().defer('full_text')
+
+
 class Book(models.Model):
     title = models.CharField(max_length=255)  # Название книги
     author = models.CharField(max_length=255)  # Автор
     description = models.TextField()  # Краткое описание
-    image = models.ImageField(upload_to='book_covers/', null=True, blank=True)  # Обложка книги
-    full_text = models.TextField(default="Текст отсутствует")
+    image = models.ImageField(upload_to='book_covers/', storage=content_storage, null=True, blank=True)  # Обложка книги
+    full_text = CompressedTextField(default="Текст отсутствует")  # Хранится сжатым zlib
     challenge = models.ForeignKey('Challenge', on_delete=models.CASCADE)  # Привязка к челленджу
+    page_count = models.PositiveIntegerField(default=0, editable=False)  # Число страниц в BookPage
+
+    objects = BookManager()
 
     def __str__(self):
         return self.title
 
 
+class BookPage(models.Model):
+    """Страница книги с готовым HTML; нарезается из full_text при сохранении книги (challenges.book_pages)."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='pages')
+    number = models.PositiveIntegerField()  # С единицы
+    start = models.PositiveIntegerField()  # Смещения страницы в full_text
+    end = models.PositiveIntegerField()
+    heading = models.CharField(max_length=255, blank=True)  # Заголовок главы, если страница с него начинается
+    html = CompressedTextField()  # Хранится сжатым zlib, как и full_text
+
+    class Meta:
+        ordering = ['book', 'number']
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'number'], name='unique_book_page_number'),
+        ]
+
+    def __str__(self):
+        return f"{self.book} — стр. {self.number}"
+
+
 class Participant(models.Model):
     """Модель участника челленджа."""
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     challenge = models.ForeignKey(Challenge, on_delete=models.CASCADE, related_name='participants')
-    progress = models.FloatField(default=0.0)
+    progress = models.FloatField(default=0.0)  # Процент выполненного, ведётся challenges.participation
+    completed_units = models.PositiveIntegerField(default=0)
+    joined_at = models.DateTimeField(default=now, null=True, blank=True)  # None у записей, созданных до учёта
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'challenge'], name='unique_participant'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.challenge.title}"
 
+class CompletedItem(models.Model):
+    """Выполненная пользователем часть челленджа: задание, квиз или аудиочеллендж (по одной строке)."""
+    KIND_TASK = 'task'
+    KIND_QUIZ = 'quiz'
+    KIND_AUDIO = 'audio'
+    KIND_CHOICES = [
+        (KIND_TASK, 'Задание'),
+        (KIND_QUIZ, 'Квиз'),
+        (KIND_AUDIO, 'Аудиочеллендж'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='completed_items')
+    challenge = models.ForeignKey(Challenge, on_delete=models.CASCADE, related_name='completed_items')
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    completed_at = models.DateTimeField(default=now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind', 'object_id'], name='unique_completed_item'),
+        ]
+        indexes = [models.Index(fields=['challenge', 'user'], name='completed_item_challenge_idx')]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.get_kind_display()} {self.object_id}"
+
 class BookTimer(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
@@ -134,15 +341,41 @@ class BookTimer(models.Model):
     end_time = models.DateTimeField(default=get_default_end_time)
     is_completed = models.BooleanField(default=False)
 
+    class Meta:
+        # Частичный индекс: условие is_completed=False Django пишет как NOT "is_completed",
+        # и только частичный индекс с тем же условием SQLite использует для finalize_expired_timers
+        indexes = [
+            models.Index(fields=['end_time'], condition=models.Q(is_completed=False), name='book_timer_open_idx'),
+        ]
+
     def check_timer(self):
-        """Проверить, завершился ли таймер."""
+        """Проверить, завершился ли таймер. Строка пишется только при первом завершении,
+        истёкшие таймеры закрывает пачкой challenges.reading.finalize_expired_timers."""
         if now() >= self.end_time:
-            self.is_completed = True
-            self.save()
+            if not self.is_completed:
+                BookTimer.objects.filter(pk=self.pk, is_completed=False).update(is_completed=True)
+                self.is_completed = True
             return True
         return False #Тут тоже остаток, таймер понадобился лишь в 1 челлендже профитнее сделать его на js
 
 
+class ReadingProgress(models.Model):
+    """Суммарное время чтения книги пользователем; пополняется пачками из challenges.reading."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reading_progress')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reading_progress')
+    seconds = models.PositiveIntegerField(default=0)
+    last_page = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(default=now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='unique_reading_progress'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.book.title} ({self.seconds} с)"
+
+
 class Quiz(models.Model):
     name = models.CharField(max_length=255, default="Default Quiz Name", verbose_name="Название")
     created_at = models.DateTimeField(auto_now_add=True, null=True, verbose_name="Дата создания") 
@@ -154,7 +387,7 @@ class Quiz(models.Model):
         null=True, 
         blank=True 
     )
-    image = models.ImageField(upload_to='quiz_images/', null=True, blank=True, verbose_name="Изображение") 
+    image = models.ImageField(upload_to='quiz_images/', storage=content_storage, null=True, blank=True, verbose_name="Изображение") 
 
     def __str__(self):
         return self.name
@@ -186,23 +419,109 @@ class AudioChallenge(models.Model):
         related_name="audio_challenges",
         verbose_name="Челлендж"
     )
+    image = models.ImageField(
+        upload_to='audio_challenge_images/', storage=content_storage, null=True, blank=True, verbose_name="Изображение"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.title
 
 class AudioQuestion(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В обработке'),
+        (STATUS_DONE, 'Готово'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
     audio_challenge = models.ForeignKey(AudioChallenge, on_delete=models.CASCADE, related_name='questions')
     audio_file = models.FileField(upload_to='audio_questions/')
     correct_answer = models.CharField(max_length=255)
+    alternate_answers = models.TextField(blank=True, verbose_name="Другие верные ответы", help_text="По одному на строку")
+    answer_tolerance = models.PositiveSmallIntegerField(
+        default=1, verbose_name="Допустимые опечатки", help_text="Сколько правок (букв) прощается в ответе"
+    )
+    normalized_answers = models.JSONField(default=list, editable=False)  # Ключи для проверки, см. answer_matching
     order = models.PositiveIntegerField(default=0)  # Для порядка вопросов
 
+    # Заполняются фоновой обработкой (challenges.audio_processing)
+    stream_file = models.FileField(upload_to='audio_questions/stream/', blank=True, editable=False)
+    duration = models.FloatField(null=True, blank=True, editable=False, verbose_name="Длительность, с")
+    bitrate = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name="Битрейт, кбит/с")
+    peaks = models.JSONField(null=True, blank=True, editable=False)  # Пики громкости 0..100 для волны
+    processing_status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING, editable=False, verbose_name="Обработка"
+    )
+
     class Meta:
         ordering = ['order']
 
     def __str__(self):
         return f"Вопрос {self.order} для {self.audio_challenge.title}"
 
+    def answer_variants(self):
+        return [self.correct_answer, *self.alternate_answers.splitlines()]
+
+    def save(self, *args, **kwargs):
+        """Нормализуем ключи ответа при сохранении, а не при каждой проверке."""
+        self.normalized_answers = answer_matching.answer_keys(self.answer_variants())
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'normalized_answers'}
+        super().save(*args, **kwargs)
+
+    @property
+    def playback_file(self):
+        """Файл для плеера: облегчённая версия, если она уже готова."""
+        return self.stream_file or self.audio_file
+
+class QuizAttempt(models.Model):
+    """Попытка прохождения квиза. Пишется пачками через challenges.attempts."""
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)  # Для идемпотентной догрузки из журнала
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='quiz_attempts')
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='attempts')
+    passed = models.BooleanField(default=False)
+    correct_questions = models.PositiveIntegerField(default=0)
+    total_questions = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [models.Index(fields=['user', 'quiz'], name='quiz_attempt_user_idx')]
 
+    def __str__(self):
+        return f"{self.user.username}: {self.quiz.name} ({self.correct_questions}/{self.total_questions})"
+
+class AudioAttempt(models.Model):
+    """Попытка прохождения аудиочелленджа. Пишется пачками через challenges.attempts."""
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='audio_attempts')
+    audio_challenge = models.ForeignKey(AudioChallenge, on_delete=models.CASCADE, related_name='attempts')
+    passed = models.BooleanField(default=False)
+    correct = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [models.Index(fields=['user', 'audio_challenge'], name='audio_attempt_user_idx')]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.audio_challenge.title} ({self.correct}/{self.total})"
+
+
+class SearchEntry(models.Model):
+    """Текст объекта для полнотекстового поиска; индекс над таблицей создаёт миграция (challenges.search)."""
+    kind = models.CharField(max_length=16, choices=search.KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_entry'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.title}"
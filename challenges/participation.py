@@ -0,0 +1,182 @@
+from django.db import connection, transaction
+from django.db.models import Case, Count, Exists, F, FloatField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
+
+from . import stats
+from .models import AudioChallenge, Challenge, ChallengeTask, CompletedChallenge, CompletedItem, Participant, Quiz
+
+# Присоединение к челленджу. Тип челленджа (куда вести после присоединения) хранится в
+# Challenge.kind и пересчитывается сигналами при создании и удалении аудиочелленджей и квизов,
+# а сама запись участника — один INSERT ... ON CONFLICT DO NOTHING по ограничению unique_participant.
+#
+# Прогресс участника: Challenge.unit_count — сколько в челлендже заданий, квизов и аудиочелленджей,
+# CompletedItem — что из этого пользователь выполнил. Новое выполнение прибавляет единицу к
+# Participant.completed_units и пересчитывает progress одним UPDATE; когда меняется состав
+# челленджа, прогресс всех участников пересчитывается одним агрегирующим UPDATE (recompute).
+# Там же, где обновляется прогресс, участники, дошедшие до 100%, получают CompletedChallenge.
+
+JOIN_REDIRECTS = {
+    Challenge.KIND_AUDIO: 'audio_challenge_list',
+    Challenge.KIND_QUIZ: 'quiz_list',
+    Challenge.KIND_BOOK: 'book_selection',
+}
+
+# Модель части челленджа -> тип выполнения
+ITEM_KINDS = {
+    ChallengeTask: CompletedItem.KIND_TASK,
+    Quiz: CompletedItem.KIND_QUIZ,
+    AudioChallenge: CompletedItem.KIND_AUDIO,
+}
+
+COMPLETE_SQL = (
+    f"INSERT INTO {CompletedItem._meta.db_table} (user_id, challenge_id, kind, object_id, completed_at) "
+    "VALUES (%s, %s, %s, %s, %s) ON CONFLICT (user_id, kind, object_id) DO NOTHING"
+)
+
+JOIN_SQL = (
+    f"INSERT INTO {Participant._meta.db_table} (user_id, challenge_id, progress, completed_units, joined_at) VALUES (%s, %s, 0, 0, %s) "
+    "ON CONFLICT (user_id, challenge_id) DO NOTHING"
+)
+
+
+def kind_expression(audio_challenges, quizzes):
+    """Тип челленджа по содержимому: аудио важнее квизов, книги — по умолчанию."""
+    return Case(
+        When(Exists(audio_challenges.filter(challenge=OuterRef('pk'))), then=Value(Challenge.KIND_AUDIO)),
+        When(Exists(quizzes.filter(challenge=OuterRef('pk'))), then=Value(Challenge.KIND_QUIZ)),
+        default=Value(Challenge.KIND_BOOK),
+    )
+
+
+def _count(queryset):
+    """Подзапрос с числом строк queryset для каждого челленджа (OuterRef('pk'))."""
+    return Coalesce(Subquery(
+        queryset.filter(challenge=OuterRef('pk')).order_by().values('challenge').annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def refresh_kind(challenge_id):
+    """Пересчитываем тип и число частей одним UPDATE: значения вычисляет база, так что гонок между сигналами нет."""
+    if challenge_id is None:
+        return
+    Challenge.objects.filter(pk=challenge_id).update(
+        kind=kind_expression(AudioChallenge.objects.all(), Quiz.objects.all()),
+        unit_count=_count(ChallengeTask.objects.all()) + _count(Quiz.objects.all()) + _count(AudioChallenge.objects.all()),
+    )
+
+
+def progress_expression(completed, total):
+    """Процент выполненного; для челленджа без частей — 0."""
+    return Coalesce(Cast(completed, FloatField()) * 100.0 / NullIf(total, 0), 0.0, output_field=FloatField())
+
+
+def _unit_count():
+    return Subquery(Challenge.objects.filter(pk=OuterRef('challenge')).values('unit_count'))
+
+
+def recompute(challenge_id, user_ids=None):
+    """Прогресс всех (или указанных) участников челленджа одним агрегирующим UPDATE."""
+    completed = Coalesce(Subquery(
+        CompletedItem.objects.filter(challenge=OuterRef('challenge'), user=OuterRef('user'))
+        .order_by().values('user').annotate(total=Count('pk')).values('total')
+    ), 0)
+    participants = Participant.objects.filter(challenge_id=challenge_id)
+    if user_ids is not None:
+        participants = participants.filter(user_id__in=user_ids)
+    updated = participants.update(completed_units=completed, progress=progress_expression(completed, _unit_count()))
+    mark_completed(challenge_id, user_ids)
+    return updated
+
+
+def mark_completed(challenge_id, user_ids=None):
+    """CompletedChallenge для участников, выполнивших все части челленджа. Один запрос, если новых нет.
+
+    Завершений мало (одно на пользователя и челлендж), поэтому пишем их через get_or_create:
+    так срабатывают сигналы, которые ведут таблицу лидеров и ChallengeStats.
+    """
+    finished = Participant.objects.filter(
+        challenge_id=challenge_id,
+        challenge__unit_count__gt=0,
+        completed_units__gte=F('challenge__unit_count'),
+    ).exclude(
+        Exists(CompletedChallenge.objects.filter(user=OuterRef('user'), challenge=OuterRef('challenge')))
+    )
+    if user_ids is not None:
+        finished = finished.filter(user_id__in=user_ids)
+    for user_id in finished.values_list('user_id', flat=True):
+        CompletedChallenge.objects.get_or_create(user_id=user_id, challenge_id=challenge_id)
+
+
+def refresh_challenge(challenge_id):
+    """Состав челленджа изменился: тип, число частей и прогресс участников."""
+    if challenge_id is None:
+        return
+    refresh_kind(challenge_id)
+    recompute(challenge_id)
+
+
+def forget_item(kind, object_id):
+    """Часть челленджа удалена — её выполнения больше не считаются."""
+    CompletedItem.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def complete(user_id, challenge_id, kind, object_id):
+    """Отмечаем выполнение части челленджа; True, если оно новое. Пять запросов, пока челлендж не завершён.
+
+    Выполнение засчитывает участие в челлендже, поэтому участник добавляется, если его ещё нет.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(COMPLETE_SQL, [user_id, challenge_id, kind, object_id, timezone.now()])
+            if cursor.rowcount != 1:
+                return False
+        join(user_id, challenge_id)
+        Participant.objects.filter(user_id=user_id, challenge_id=challenge_id).update(
+            completed_units=F('completed_units') + 1,
+            progress=progress_expression(F('completed_units') + 1, _unit_count()),
+        )
+        mark_completed(challenge_id, [user_id])
+    return True
+
+
+def complete_many(items):
+    """Пачка выполнений [(user_id, challenge_id, kind, object_id)] (сброс буфера попыток).
+
+    Запросов — несколько на челлендж, а не на выполнение: вставляем пропуская повторы
+    и пересчитываем прогресс затронутых участников агрегирующим UPDATE.
+    """
+    if not items:
+        return
+    moment = timezone.now()
+    by_challenge = {}
+    for user_id, challenge_id, _, _ in items:
+        by_challenge.setdefault(challenge_id, set()).add(user_id)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(COMPLETE_SQL, [(*item, moment) for item in set(items)])
+        for challenge_id, user_ids in by_challenge.items():
+            cursor.executemany(JOIN_SQL, [(user_id, challenge_id, moment) for user_id in user_ids])
+            stats.participants_joined(challenge_id, cursor.rowcount)
+            recompute(challenge_id, user_ids)
+
+
+def join(user_id, challenge_id):
+    """Добавляем участника; True, если он присоединился только что.
+
+    Один запрос, если пользователь уже участвует, и два для нового участника (счётчик в ChallengeStats).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(JOIN_SQL, [user_id, challenge_id, timezone.now()])
+        joined = cursor.rowcount == 1
+    if joined:
+        stats.participants_joined(challenge_id)
+    return joined
+
+
+def progress_by_challenge(user, challenge_ids):
+    """{challenge_id: progress} пользователя для страницы списка — один запрос на все карточки."""
+    if not user.is_authenticated or not challenge_ids:
+        return {}
+    return dict(
+        Participant.objects.filter(user=user, challenge_id__in=challenge_ids).values_list('challenge_id', 'progress')
+    )
@@ -0,0 +1,30 @@
+import time
+
+from django.db import DEFAULT_DB_ALIAS
+
+# Профили для пользователей, у которых их нет (созданных до появления Profile или в обход сигнала).
+# Выполняется после migrate: один анти-джойн и вставка пачками, без запроса на пользователя.
+
+BATCH_SIZE = 5000
+
+
+def backfill(apps, using=DEFAULT_DB_ALIAS, batch_size=BATCH_SIZE):
+    """Создаём недостающие профили; возвращает (создано, секунд).
+
+    apps — реестр моделей (исторический из post_migrate или django.apps). Если модели Profile
+    в нём нет (миграции откатили), ничего не делаем.
+    """
+    started = time.perf_counter()
+    try:
+        User = apps.get_model('auth', 'User')
+        Profile = apps.get_model('challenges', 'Profile')
+    except LookupError:
+        return 0, 0.0
+    # id читаем целиком до вставок: 200 тысяч чисел — несколько мегабайт, а курсор по таблице,
+    # в которую тут же пишем, в SQLite не изолирован от этих вставок
+    missing = list(User.objects.using(using).filter(profile__isnull=True).values_list('pk', flat=True))
+    # ignore_conflicts: профиль мог появиться параллельно через сигнал регистрации
+    Profile.objects.using(using).bulk_create(
+        [Profile(user_id=user_id) for user_id in missing], batch_size=batch_size, ignore_conflicts=True
+    )
+    return len(missing), time.perf_counter() - started
@@ -0,0 +1,142 @@
+import json
+import time
+
+from django.db import IntegrityError, connection, transaction
+
+from . import search
+from .models import Answer, Question, Quiz
+
+# Импорт и экспорт квизов в JSONL: одна строка — один квиз со всеми вопросами и ответами.
+# {"name": "...", "challenge": 1, "image": "quiz_images/x.png",
+#  "questions": [{"text": "...", "answers": [{"text": "...", "is_correct": true}]}]}
+
+BATCH_SIZE = 2000
+
+
+class QuizImportError(ValueError):
+    """Строка JSONL не похожа на квиз."""
+
+    def __init__(self, line_number, message):
+        super().__init__(f"Строка {line_number}: {message}")
+        self.line_number = line_number
+
+
+class ImportStats:
+    """Счётчики импорта и скорость, для вывода в команде и в админке."""
+
+    def __init__(self):
+        self.quizzes = self.questions = self.answers = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def __str__(self):
+        elapsed = max(self.elapsed, 1e-9)
+        return (
+            f"Квизов: {self.quizzes}, вопросов: {self.questions}, ответов: {self.answers} "
+            f"за {self.elapsed:.2f} с ({(self.questions + self.answers) / elapsed:,.0f} строк/с)"
+        )
+
+
+def _parse(line_number, line):
+    try:
+        data = json.loads(line)
+    except json.JSONDecodeError as exc:
+        raise QuizImportError(line_number, f"некорректный JSON ({exc.msg})") from exc
+    if not isinstance(data, dict) or not isinstance(data.get('questions', []), list):
+        raise QuizImportError(line_number, "ожидается объект с полем questions")
+    challenge = data.get('challenge')
+    if challenge is not None and (isinstance(challenge, bool) or not isinstance(challenge, int)):
+        raise QuizImportError(line_number, "challenge должен быть целым id или null")
+    for key in ('name', 'image'):
+        if not isinstance(data.get(key) or '', str):
+            raise QuizImportError(line_number, f"{key} должен быть строкой")
+    for question_number, question in enumerate(data.get('questions', []), start=1):
+        _check_question(line_number, question_number, question)
+    return data
+
+
+def _check_question(line_number, question_number, question):
+    where = f"вопрос {question_number}"
+    if not isinstance(question, dict):
+        raise QuizImportError(line_number, f"{where}: ожидается объект")
+    if not isinstance(question.get('text') or '', str):
+        raise QuizImportError(line_number, f"{where}: text должен быть строкой")
+    if not isinstance(question.get('answers', []), list):
+        raise QuizImportError(line_number, f"{where}: answers должен быть списком")
+    max_length = Answer._meta.get_field('text').max_length
+    for answer_number, answer in enumerate(question.get('answers', []), start=1):
+        where = f"вопрос {question_number}, ответ {answer_number}"
+        if not isinstance(answer, dict) or 'text' not in answer:
+            raise QuizImportError(line_number, f"{where}: ожидается объект с полем text")
+        if not isinstance(answer['text'], str) or len(answer['text']) > max_length:
+            raise QuizImportError(line_number, f"{where}: text должен быть строкой до {max_length} символов")
+        if not isinstance(answer.get('is_correct', False), bool):
+            raise QuizImportError(line_number, f"{where}: is_correct должен быть true или false")
+
+
+def import_quiz(data, batch_size=BATCH_SIZE):
+    """Создаём один квиз в одной транзакции: вопросы и ответы пачками bulk_create."""
+    with transaction.atomic():
+        quiz = Quiz.objects.create(
+            name=data.get('name') or Quiz._meta.get_field('name').default,
+            challenge_id=data.get('challenge'),
+            image=data.get('image') or None,
+        )
+        questions_data = data.get('questions', [])
+        questions = Question.objects.bulk_create(
+            [Question(quiz=quiz, text=question.get('text')) for question in questions_data],
+            batch_size=batch_size,
+        )
+        if not connection.features.can_return_rows_from_bulk_insert:
+            # База не вернула id — сопоставляем по порядку вставки
+            questions = list(Question.objects.filter(quiz=quiz).order_by('id'))
+
+        answers = [
+            Answer(question=question, text=answer['text'], is_correct=bool(answer.get('is_correct')))
+            for question, question_data in zip(questions, questions_data)
+            for answer in question_data.get('answers', [])
+        ]
+        Answer.objects.bulk_create(answers, batch_size=batch_size)
+        search.index_quiz(quiz.id)  # bulk_create не шлёт сигналы, вопросы индексируем сами
+    return quiz, len(questions), len(answers)
+
+
+def import_quizzes(lines, batch_size=BATCH_SIZE, stats=None):
+    """Потоковый импорт: строки читаются по одной, в памяти держится только текущий квиз."""
+    stats = stats or ImportStats()
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            _, questions, answers = import_quiz(_parse(line_number, line), batch_size=batch_size)
+        except IntegrityError as exc:
+            raise QuizImportError(line_number, f"ошибка целостности ({exc})") from exc
+        stats.quizzes += 1
+        stats.questions += questions
+        stats.answers += answers
+    return stats
+
+
+def export_quizzes(queryset):
+    """Генератор строк JSONL; на квиз два запроса, в памяти держится только текущий квиз."""
+    for quiz in queryset.order_by('id').iterator(chunk_size=100):
+        answers = {}
+        for question_id, text, is_correct in (
+            Answer.objects.filter(question__quiz=quiz).order_by('id').values_list('question_id', 'text', 'is_correct')
+        ):
+            answers.setdefault(question_id, []).append({'text': text, 'is_correct': is_correct})
+        questions = [
+            {'text': text, 'answers': answers.get(question_id, [])}
+            for question_id, text in quiz.questions.order_by('id').values_list('id', 'text')
+        ]
+        yield json.dumps({
+            'name': quiz.name,
+            'challenge': quiz.challenge_id,
+            'image': quiz.image.name or None,
+            'questions': questions,
+        }, ensure_ascii=False) + '\n'
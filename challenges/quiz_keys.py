@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Answer
+
+# Ключи проверки квизов: локальный LRU процесса + общий кэш Django за ним.
+# Версия ключа хранится в общем кэше и меняется сигналами при любом изменении квиза,
+# поэтому локальная копия в другом процессе устаревает сама, без рассылки уведомлений.
+# Это работает только с кэшем, общим для всех процессов (CACHES в settings): с LocMemCache
+# версия у каждого воркера своя, и остальные проверяли бы ответы по старому ключу.
+
+VERSION_KEY = 'quiz_answer_key_version:{quiz_id}'
+ANSWER_KEY = 'quiz_answer_key:{quiz_id}:{version}'
+SHARED_TIMEOUT = 24 * 3600
+
+
+class AnswerKey:
+    """Скомпилированный ключ квиза: множество правильных id и разбивка по вопросам."""
+    __slots__ = ('quiz_id', 'version', 'rows', 'answer_ids', 'correct_ids', 'by_question', '_question_of')
+
+    def __init__(self, quiz_id, version, rows):
+        self.quiz_id = quiz_id
+        self.version = version
+        self.rows = tuple(rows)  # (question_id, answer_id, is_correct)
+        by_question = {}
+        self._question_of = {}
+        for question_id, answer_id, is_correct in self.rows:
+            correct = by_question.setdefault(question_id, set())
+            if is_correct:
+                correct.add(answer_id)
+            self._question_of[answer_id] = question_id
+        self.by_question = {question_id: frozenset(ids) for question_id, ids in by_question.items()}
+        self.answer_ids = frozenset(self._question_of)  # все ответы квиза, для проверки формы
+        self.correct_ids = frozenset(answer_id for _, answer_id, is_correct in self.rows if is_correct)
+
+    def __reduce__(self):
+        return (AnswerKey, (self.quiz_id, self.version, self.rows))
+
+    def is_correct(self, answer_ids):
+        """Квиз пройден, если выбраны ровно все правильные ответы."""
+        return frozenset(int(answer_id) for answer_id in answer_ids) == self.correct_ids
+
+    def question_results(self, answer_ids):
+        """{question_id: правильно ли отвечен вопрос}."""
+        chosen = {question_id: set() for question_id in self.by_question}
+        for answer_id in answer_ids:
+            question_id = self._question_of.get(int(answer_id))
+            if question_id is not None:
+                chosen[question_id].add(int(answer_id))
+        return {question_id: chosen[question_id] == correct for question_id, correct in self.by_question.items()}
+
+
+class _LocalLRU:
+    """Потокобезопасный LRU на OrderedDict: quiz_id -> AnswerKey."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, quiz_id, version):
+        with self._lock:
+            key = self._data.get(quiz_id)
+            if key is None or key.version != version:
+                return None
+            self._data.move_to_end(quiz_id)
+            return key
+
+    def put(self, key):
+        with self._lock:
+            self._data[key.quiz_id] = key
+            self._data.move_to_end(key.quiz_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, quiz_id):
+        with self._lock:
+            self._data.pop(quiz_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_keys = _LocalLRU(getattr(settings, 'QUIZ_ANSWER_KEY_CACHE_SIZE', 256))
+
+
+def current_version(quiz_id):
+    """Текущая версия содержимого квиза; при потере в кэше заводим новую, а не начинаем с 1.
+
+    Используется и как ключ кэша фрагмента с вопросами в quiz/quiz.html.
+    """
+    version_key = VERSION_KEY.format(quiz_id=quiz_id)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, time.time_ns(), None)
+        version = cache.get(version_key)
+    return version
+
+
+def _bump_version(quiz_id):
+    cache.set(VERSION_KEY.format(quiz_id=quiz_id), time.time_ns(), None)
+    local_keys.discard(quiz_id)
+
+
+def invalidate(quiz_id):
+    """Меняем версию ключа квиза (вызывается сигналами на Quiz, Question, Answer).
+
+    Повторно меняем версию после коммита: иначе ключ, собранный параллельным запросом
+    до коммита, остался бы под новой версией со старыми данными.
+    """
+    if quiz_id is None:
+        return
+    _bump_version(quiz_id)
+    transaction.on_commit(lambda: _bump_version(quiz_id))
+
+
+def compile_key(quiz_id, version):
+    """Собираем ключ из базы одним запросом."""
+    rows = Answer.objects.filter(question__quiz_id=quiz_id).values_list('question_id', 'id', 'is_correct')
+    return AnswerKey(quiz_id, version, rows)
+
+
+def get_answer_key(quiz_id):
+    """Ключ квиза: локальный LRU -> общий кэш -> база."""
+    version = current_version(quiz_id)
+    key = local_keys.get(quiz_id, version)
+    if key is not None:
+        return key
+
+    shared_key = ANSWER_KEY.format(quiz_id=quiz_id, version=version)
+    key = cache.get(shared_key)
+    if key is None:
+        key = compile_key(quiz_id, version)
+        cache.set(shared_key, key, SHARED_TIMEOUT)
+    local_keys.put(key)
+    return key
+
+
+def grade(quiz_id, answer_ids):
+    """Проверяем ответы пользователя; на тёплом кэше не делает запросов в базу."""
+    return get_answer_key(quiz_id).is_correct(answer_ids)
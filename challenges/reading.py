@@ -0,0 +1,117 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from .models import Book, BookTimer, ReadingProgress
+
+logger = logging.getLogger(__name__)
+
+# Учёт времени чтения: страница книги раз в HEARTBEAT_INTERVAL секунд шлёт пульс с числом
+# прочитанных секунд. Пульсы копятся в памяти процесса по (user, book) и раз в
+# READING_FLUSH_INTERVAL секунд уходят в ReadingProgress одним upsert'ом с прибавлением.
+# При падении процесса теряются только секунды с последнего сброса.
+
+HEARTBEAT_INTERVAL = 30
+
+UPSERT_SQL = (
+    f"INSERT INTO {ReadingProgress._meta.db_table} (user_id, book_id, seconds, last_page, updated_at) "
+    "VALUES (%s, %s, %s, %s, %s) "
+    "ON CONFLICT (user_id, book_id) DO UPDATE SET "
+    "seconds = {table}.seconds + excluded.seconds, "
+    "last_page = excluded.last_page, updated_at = excluded.updated_at"
+).format(table=ReadingProgress._meta.db_table)
+
+
+def max_heartbeat_seconds():
+    """Больше этого один пульс не засчитывает, как бы клиент ни считал."""
+    return getattr(settings, 'READING_HEARTBEAT_MAX_SECONDS', 2 * HEARTBEAT_INTERVAL)
+
+
+def save_progress(deltas, when=None):
+    """Прибавляем секунды к ReadingProgress; deltas — {(user_id, book_id): (seconds, last_page)}."""
+    if not deltas:
+        return
+    when = when or timezone.now()
+    # id книги приходит из URL пульса; несуществующие отбрасываем, чтобы не уронить всю пачку
+    books = set(Book._base_manager.filter(id__in={book_id for _, book_id in deltas}).values_list('id', flat=True))
+    rows = [
+        (user_id, book_id, seconds, last_page, when)
+        for (user_id, book_id), (seconds, last_page) in deltas.items()
+        if book_id in books and seconds
+    ]
+    if not rows:
+        return
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(UPSERT_SQL, rows)
+
+
+def finalize_expired_timers(moment=None):
+    """Закрываем все истёкшие BookTimer одним UPDATE. Возвращает число закрытых."""
+    return BookTimer.objects.filter(is_completed=False, end_time__lte=moment or timezone.now()).update(
+        is_completed=True
+    )
+
+
+class HeartbeatBuffer:
+    """Суммы пульсов процесса со сбросом по таймеру (READING_FLUSH_INTERVAL)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._deltas = {}
+        self._timer = None
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'READING_FLUSH_INTERVAL', 30.0)
+
+    def __len__(self):
+        return len(self._deltas)
+
+    def add(self, user_id, book_id, seconds, page=1):
+        seconds = max(0, min(int(seconds), max_heartbeat_seconds()))
+        with self._lock:
+            total, _ = self._deltas.get((user_id, book_id), (0, page))
+            self._deltas[(user_id, book_id)] = (total + seconds, page)
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+            finalize_expired_timers()
+        except Exception:
+            logger.exception("Не удалось сбросить время чтения")
+        finally:
+            connections.close_all()  # Соединения потока таймера
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            deltas, self._deltas = self._deltas, {}
+        try:
+            save_progress(deltas)
+        except Exception:
+            # Возвращаем суммы в буфер, чтобы не потерять их до следующего сброса
+            with self._lock:
+                for key, (seconds, page) in deltas.items():
+                    newer = self._deltas.get(key)
+                    self._deltas[key] = (seconds + newer[0], newer[1]) if newer else (seconds, page)
+            raise
+        return len(deltas)
+
+
+buffer = HeartbeatBuffer()
+atexit.register(buffer.flush)
+
+
+def heartbeat(user_id, book_id, seconds, page=1):
+    """Точка входа для view: пульс копится в памяти, в базу уходит пачкой."""
+    buffer.add(user_id, book_id, seconds, page)
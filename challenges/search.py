@@ -0,0 +1,306 @@
+import re
+import threading
+
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+# Полнотекстовый поиск по книгам, челленджам и квизам (с текстами вопросов).
+# Индексируемый текст лежит в SearchEntry и обновляется сигналами; над ним на SQLite —
+# виртуальная таблица FTS5 с триггерами, на PostgreSQL — GIN-индекс по to_tsvector.
+# Токенайзер FTS5 не сводит «ё» к «е», поэтому текст и запросы сворачиваем сами.
+# Полный текст книги в индекс не копируется: начало (для сниппетов) и словарь остального текста —
+# каждое слово один раз. Запросы — набор слов-префиксов, поэтому находится то же самое; теряются
+# только частоты слов в bm25 и сниппеты из середины книги.
+
+KIND_BOOK = 'book'
+KIND_CHALLENGE = 'challenge'
+KIND_QUIZ = 'quiz'
+KIND_CHOICES = [(KIND_BOOK, 'Книга'), (KIND_CHALLENGE, 'Челлендж'), (KIND_QUIZ, 'Квиз')]
+KIND_URLS = {KIND_BOOK: 'book_detail', KIND_CHALLENGE: 'challenge_detail', KIND_QUIZ: 'quiz_view'}
+
+ENTRY_TABLE = 'challenges_searchentry'
+FTS_TABLE = 'challenges_search_fts'
+PG_CONFIG = 'russian'
+PG_DOCUMENT = f"to_tsvector('{PG_CONFIG}', title || ' ' || body)"
+
+SQLITE_INSTALL = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    f"title, body, content='{ENTRY_TABLE}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {ENTRY_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+    f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {ENTRY_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); END",
+    f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {ENTRY_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+]
+SQLITE_UNINSTALL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+POSTGRES_INSTALL = [f"CREATE INDEX challenges_searchentry_tsv ON {ENTRY_TABLE} USING GIN ({PG_DOCUMENT})"]
+POSTGRES_UNINSTALL = ["DROP INDEX IF EXISTS challenges_searchentry_tsv"]
+
+_WORD = re.compile(r'\w+')
+_FOLD = str.maketrans({'ё': 'е', 'Ё': 'Е'})
+_MARK_START, _MARK_END = '\x02', '\x03'
+_pending = threading.local()
+
+
+def fold(text):
+    return (text or '').translate(_FOLD)
+
+
+def is_available(using=connection):
+    return using.vendor in ('sqlite', 'postgresql')
+
+
+def install(schema_editor):
+    """Создаём индекс под базу миграции; на других базах поиск работает через LIKE."""
+    vendor = schema_editor.connection.vendor
+    for sql in {'sqlite': SQLITE_INSTALL, 'postgresql': POSTGRES_INSTALL}.get(vendor, []):
+        schema_editor.execute(sql)
+
+
+def uninstall(schema_editor):
+    vendor = schema_editor.connection.vendor
+    for sql in {'sqlite': SQLITE_UNINSTALL, 'postgresql': POSTGRES_UNINSTALL}.get(vendor, []):
+        schema_editor.execute(sql)
+
+
+BOOK_EXCERPT_CHARS = 2000
+
+
+def vocabulary(text):
+    """Слова текста без повторов (регистр не важен) в порядке первого появления."""
+    return ' '.join(dict.fromkeys(word.lower() for word in _WORD.findall(fold(text))))
+
+
+def book_document(book):
+    excerpt, rest = book.full_text or '', ''
+    if len(excerpt) > BOOK_EXCERPT_CHARS:
+        # Режем по пробелу, чтобы слово на границе целиком попало в словарь остатка
+        cut = max(excerpt.rfind(' ', 0, BOOK_EXCERPT_CHARS), excerpt.rfind('\n', 0, BOOK_EXCERPT_CHARS))
+        cut = cut + 1 if cut > 0 else BOOK_EXCERPT_CHARS
+        excerpt, rest = excerpt[:cut], excerpt[cut:]
+    return book.title, '\n'.join(filter(None, [book.author, book.description, excerpt, vocabulary(rest)]))
+
+
+def challenge_document(challenge):
+    return challenge.title, challenge.description or ''
+
+
+def quiz_document(quiz, question_texts):
+    return quiz.name, '\n'.join(question_texts)
+
+
+def collect_entries(book_model, challenge_model, quiz_model, question_model):
+    """(kind, object_id, title, body) для всех объектов; модели передаются, чтобы работать и в миграциях."""
+    for book in book_model.objects.iterator(chunk_size=100):
+        yield (KIND_BOOK, book.pk, *book_document(book))
+    for challenge in challenge_model.objects.iterator():
+        yield (KIND_CHALLENGE, challenge.pk, *challenge_document(challenge))
+    texts = {}
+    for quiz_id, text in question_model.objects.order_by('id').values_list('quiz_id', 'text').iterator():
+        texts.setdefault(quiz_id, []).append(text)
+    for quiz in quiz_model.objects.iterator():
+        yield (KIND_QUIZ, quiz.pk, *quiz_document(quiz, texts.get(quiz.pk, [])))
+
+
+def fill(entry_model, entries, batch_size=200):
+    batch = []
+    for kind, object_id, title, body in entries:
+        batch.append(entry_model(kind=kind, object_id=object_id, title=fold(title), body=fold(body)))
+        if len(batch) >= batch_size:
+            entry_model.objects.bulk_create(batch)
+            batch = []
+    entry_model.objects.bulk_create(batch)
+
+
+def rebuild():
+    """Пересобираем индекс целиком (команда rebuild_search_index). Возвращает число записей."""
+    from .models import Book, Challenge, Question, Quiz, SearchEntry
+
+    SearchEntry.objects.all().delete()
+    fill(SearchEntry, collect_entries(Book, Challenge, Quiz, Question))
+    return SearchEntry.objects.count()
+
+
+def _store(kind, object_id, title, body):
+    from .models import SearchEntry
+
+    SearchEntry.objects.update_or_create(
+        kind=kind, object_id=object_id, defaults={'title': fold(title), 'body': fold(body)}
+    )
+
+
+def remove(kind, object_id):
+    from .models import SearchEntry
+
+    SearchEntry.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def index_book(book):
+    _store(KIND_BOOK, book.pk, *book_document(book))
+
+
+def index_challenge(challenge):
+    _store(KIND_CHALLENGE, challenge.pk, *challenge_document(challenge))
+
+
+def index_quiz(quiz_id):
+    """Квиз индексируется вместе с текстами вопросов, поэтому его пересобирают и сигналы на Question."""
+    from .models import Question, Quiz
+
+    quiz = Quiz.objects.filter(pk=quiz_id).only('name').first()
+    if quiz is None:
+        remove(KIND_QUIZ, quiz_id)
+        return
+    texts = Question.objects.filter(quiz_id=quiz_id).order_by('id').values_list('text', flat=True)
+    _store(KIND_QUIZ, quiz_id, *quiz_document(quiz, texts))
+
+
+class _QuizBatch:
+    """Квизы, которые нужно переиндексировать после коммита текущей транзакции."""
+
+    def __init__(self):
+        self.quiz_ids = set()
+
+    def __call__(self):
+        if getattr(_pending, 'batch', None) is self:
+            _pending.batch = None
+        for quiz_id in sorted(self.quiz_ids):
+            index_quiz(quiz_id)
+
+
+def schedule_quiz(quiz_id):
+    """Переиндексация квиза после коммита, один раз на транзакцию (сигналы на Question).
+
+    Инлайн-админка сохраняет все N вопросов квиза в одной транзакции; без отложенной пачки
+    каждый вопрос пересобирал бы документ из всех N вопросов.
+    """
+    if quiz_id is None:
+        return
+    if not connection.in_atomic_block:
+        index_quiz(quiz_id)
+        return
+    batch = getattr(_pending, 'batch', None)
+    # Пачка из откаченной транзакции (или уже выполненная) в run_on_commit не лежит — заводим новую
+    if batch is None or not any(entry[1] is batch for entry in connection.run_on_commit):
+        batch = _pending.batch = _QuizBatch()
+        transaction.on_commit(batch)
+    batch.quiz_ids.add(quiz_id)
+
+
+class SearchHit:
+    def __init__(self, kind, object_id, title, snippet):
+        self.kind = kind
+        self.object_id = object_id
+        self.title = title
+        # Сниппет приходит с маркерами совпадений; экранируем текст и только потом ставим <mark>
+        self.snippet = mark_safe(
+            escape(snippet or '').replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+        )
+
+    @property
+    def kind_label(self):
+        return dict(KIND_CHOICES)[self.kind]
+
+    @property
+    def url(self):
+        return reverse(KIND_URLS[self.kind], args=[self.object_id])
+
+
+def fts_query(text):
+    """Запрос FTS5 из пользовательского ввода: все слова, каждое как префикс; синтаксис FTS5 не пропускаем."""
+    return ' '.join(f'"{word}"*' for word in _WORD.findall(fold(text)))
+
+
+def _kinds_sql(kinds, column):
+    if not kinds:
+        return '', []
+    return f" AND {column} IN ({', '.join(['%s'] * len(kinds))})", list(kinds)
+
+
+def _search_sqlite(text, kinds, limit):
+    query = fts_query(text)
+    if not query:
+        return []
+    kinds_sql, kinds_params = _kinds_sql(kinds, 'e.kind')
+    sql = (
+        f"SELECT e.kind, e.object_id, e.title, "
+        f"snippet({FTS_TABLE}, 1, char(2), char(3), '…', 24) "
+        f"FROM {FTS_TABLE} JOIN {ENTRY_TABLE} e ON e.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s{kinds_sql} "
+        f"ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [query, *kinds_params, limit])
+        return cursor.fetchall()
+
+
+def _search_postgres(text, kinds, limit):
+    if not _WORD.search(text):
+        return []
+    kinds_sql, kinds_params = _kinds_sql(kinds, 'kind')
+    options = f'StartSel={_MARK_START}, StopSel={_MARK_END}, MaxFragments=1, MaxWords=30, MinWords=10'
+    sql = (
+        f"SELECT kind, object_id, title, ts_headline('{PG_CONFIG}', body, query, %s) "
+        f"FROM {ENTRY_TABLE}, websearch_to_tsquery('{PG_CONFIG}', %s) query "
+        f"WHERE {PG_DOCUMENT} @@ query{kinds_sql} "
+        f"ORDER BY ts_rank({PG_DOCUMENT}, query) DESC LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [options, fold(text), *kinds_params, limit])
+        return cursor.fetchall()
+
+
+def _search_like(text, kinds, limit):
+    from django.db.models import Q
+
+    from .models import SearchEntry
+
+    entries = SearchEntry.objects.all()
+    for word in _WORD.findall(fold(text)):
+        entries = entries.filter(Q(title__icontains=word) | Q(body__icontains=word))
+    if kinds:
+        entries = entries.filter(kind__in=kinds)
+    return [(entry.kind, entry.object_id, entry.title, entry.body[:200]) for entry in entries[:limit]]
+
+
+def search(text, kinds=None, limit=20):
+    """Найденные объекты по убыванию релевантности, с подсвеченными фрагментами."""
+    backend = {'sqlite': _search_sqlite, 'postgresql': _search_postgres}.get(connection.vendor, _search_like)
+    return [SearchHit(*row) for row in backend(text, kinds, limit)]
+
+
+def matching_ids(kind, text):
+    """Подзапрос с id всех объектов одного типа, подходящих под запрос (для поиска в админке).
+
+    В отличие от search() без лимита, ранжирования и сниппетов: админка фильтрует и пагинирует сама.
+    """
+    from .models import SearchEntry
+
+    entries = SearchEntry.objects.filter(kind=kind)
+    if connection.vendor == 'sqlite':
+        query = fts_query(text)
+        if not query:
+            return entries.none().values('object_id')
+        entries = entries.filter(id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [query]))
+    elif connection.vendor == 'postgresql':
+        if not _WORD.search(text):
+            return entries.none().values('object_id')
+        entries = entries.filter(id__in=RawSQL(
+            f"SELECT id FROM {ENTRY_TABLE} WHERE {PG_DOCUMENT} @@ websearch_to_tsquery('{PG_CONFIG}', %s)", [fold(text)]
+        ))
+    else:
+        from django.db.models import Q
+
+        for word in _WORD.findall(fold(text)):
+            entries = entries.filter(Q(title__icontains=word) | Q(body__icontains=word))
+    return entries.values('object_id')
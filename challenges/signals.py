@@ -1,7 +1,11 @@
-from django.db.models.signals import post_save, post_migrate
+from django.apps import apps as global_apps
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_init, post_save, post_delete, post_migrate, pre_delete, pre_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Profile
+from .models import Profile, Challenge, CompletedChallenge, Quiz, Question, Answer, AudioQuestion, Book, CouponImage
+from .models import AudioChallenge, ChallengeTask, DailyCoupon, Participant, SupportResponse
+from . import audio_processing, book_pages, catalog, coupons, participation, profiles, stats, images, leaderboard, quiz_keys, search, support_events, support_queue
 
 # Сигнал для создания профиля для нового пользователя
 @receiver(post_save, sender=User)
@@ -9,9 +13,193 @@ def create_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
 
-# Сигнал для создания профилей для уже существующих пользователей после миграций
+# Профили для уже существующих пользователей после миграций: post_migrate приходит от каждого
+# приложения, а досоздаём профили один раз — на сигнале самого challenges
 @receiver(post_migrate)
-def create_profiles_for_existing_users(sender, **kwargs):
-    for user in User.objects.all():
-        Profile.objects.get_or_create(user=user)
-    print("Профили созданы для всех существующих пользователей.")
+def create_profiles_for_existing_users(sender, apps=None, using=DEFAULT_DB_ALIAS, verbosity=1, **kwargs):
+    if sender.label != 'challenges':
+        return
+    created, elapsed = profiles.backfill(apps or global_apps, using)
+    if created and verbosity >= 1:
+        print(f"Создано профилей: {created} за {elapsed:.2f} с")
+
+# Таблица лидеров обновляется инкрементально при завершении челленджа
+@receiver(post_save, sender=CompletedChallenge)
+def increment_leaderboard(sender, instance, created, **kwargs):
+    if created:
+        leaderboard.record_completion(instance.user_id, 1, instance.completed_at, instance.challenge_id)
+
+@receiver(post_delete, sender=CompletedChallenge)
+def decrement_leaderboard(sender, instance, **kwargs):
+    leaderboard.record_completion(instance.user_id, -1, instance.completed_at, instance.challenge_id)
+
+@receiver(pre_delete, sender=User)
+def forget_leaderboard_user(sender, instance, **kwargs):
+    leaderboard.forget_user(instance.pk)
+
+# Любое изменение квиза, вопроса или ответа делает закэшированный ключ проверки устаревшим
+@receiver([post_save, post_delete], sender=Quiz)
+def invalidate_quiz_key(sender, instance, **kwargs):
+    quiz_keys.invalidate(instance.pk)
+
+@receiver([post_save, post_delete], sender=Question)
+def invalidate_question_quiz_key(sender, instance, **kwargs):
+    quiz_keys.invalidate(instance.quiz_id)
+
+@receiver([post_save, post_delete], sender=Answer)
+def invalidate_answer_quiz_key(sender, instance, **kwargs):
+    quiz_id = Question.objects.filter(pk=instance.question_id).values_list('quiz_id', flat=True).first()
+    quiz_keys.invalidate(quiz_id)
+
+# Новый или заменённый аудиофайл вопроса обрабатывается в фоне после коммита
+@receiver(pre_save, sender=AudioQuestion)
+def mark_audio_pending(sender, instance, **kwargs):
+    if instance.pk is None:
+        instance.processing_status = AudioQuestion.STATUS_PENDING
+        return
+    previous_audio, previous_stream = AudioQuestion.objects.filter(pk=instance.pk).values_list(
+        'audio_file', 'stream_file'
+    ).first() or (None, '')
+    if previous_audio != instance.audio_file.name:
+        # Старая облегчённая версия удаляется до новой обработки: её колбэк зарегистрирован раньше
+        if previous_stream:
+            transaction.on_commit(lambda: audio_processing.delete_stream(previous_stream))
+        instance.processing_status = AudioQuestion.STATUS_PENDING
+        instance.stream_file = ''
+        instance.duration = instance.bitrate = instance.peaks = None
+
+@receiver(post_save, sender=AudioQuestion)
+def schedule_audio_processing(sender, instance, **kwargs):
+    if instance.processing_status == AudioQuestion.STATUS_PENDING:
+        transaction.on_commit(lambda: audio_processing.schedule(instance))
+
+@receiver(post_delete, sender=AudioQuestion)
+def delete_audio_stream(sender, instance, **kwargs):
+    if instance.stream_file:
+        name = instance.stream_file.name
+        transaction.on_commit(lambda: audio_processing.delete_stream(name))
+
+# Страницы книги нарезаются заново при изменении текста
+@receiver(post_save, sender=Book)
+def split_book_pages(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'full_text' in update_fields:
+        book_pages.rebuild(instance)
+
+# Поисковый индекс: книги, челленджи и квизы вместе с текстами вопросов
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, **kwargs):
+    search.index_book(instance)
+
+@receiver(post_save, sender=Challenge)
+def index_challenge(sender, instance, **kwargs):
+    search.index_challenge(instance)
+
+@receiver(post_save, sender=Quiz)
+def index_quiz(sender, instance, **kwargs):
+    search.index_quiz(instance.pk)
+
+@receiver([post_save, post_delete], sender=Question)
+def index_question_quiz(sender, instance, **kwargs):
+    search.schedule_quiz(instance.quiz_id)
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    search.remove(search.KIND_BOOK, instance.pk)
+
+@receiver(post_delete, sender=Challenge)
+def unindex_challenge(sender, instance, **kwargs):
+    search.remove(search.KIND_CHALLENGE, instance.pk)
+
+@receiver(post_delete, sender=Quiz)
+def unindex_quiz(sender, instance, **kwargs):
+    search.remove(search.KIND_QUIZ, instance.pk)
+
+# Уменьшенные копии картинок для srcset делаются в фоне после коммита — только для нового файла:
+# сохранение без замены картинки и значение по умолчанию (общий аватар) их не запускают
+@receiver(post_init, sender=Challenge)
+@receiver(post_init, sender=CouponImage)
+@receiver(post_init, sender=Quiz)
+@receiver(post_init, sender=Book)
+@receiver(post_init, sender=AudioChallenge)
+@receiver(post_init, sender=Profile)
+def remember_image_name(sender, instance, **kwargs):
+    images.remember_original(instance)
+
+@receiver(post_save, sender=Challenge)
+@receiver(post_save, sender=CouponImage)
+@receiver(post_save, sender=Quiz)
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=AudioChallenge)
+@receiver(post_save, sender=Profile)
+def schedule_image_derivatives(sender, instance, update_fields=None, **kwargs):
+    name = images.changed_name(instance, update_fields)
+    if name:
+        transaction.on_commit(lambda: images.schedule(name))
+
+# Купон, изменённый вручную, перечитываем из базы (в других процессах — по истечении срока)
+@receiver([post_save, post_delete], sender=DailyCoupon)
+def forget_daily_coupon(sender, **kwargs):
+    coupons.forget()
+
+# Кэшированные фрагменты списка челленджей: карточка челленджа и аватар в шапке
+@receiver([post_save, post_delete], sender=Challenge)
+def invalidate_challenge_card(sender, instance, **kwargs):
+    catalog.invalidate_card(instance.pk)
+
+@receiver([post_save, post_delete], sender=Profile)
+def invalidate_header_avatar(sender, instance, **kwargs):
+    catalog.invalidate_avatar(instance.user_id)
+
+# Состав челленджа: тип для join_challenge (книги — тип по умолчанию), число частей и прогресс участников
+@receiver(post_save, sender=AudioChallenge)
+@receiver(post_save, sender=Quiz)
+@receiver(post_save, sender=ChallengeTask)
+def refresh_challenge_content(sender, instance, created, **kwargs):
+    if created:
+        participation.refresh_challenge(instance.challenge_id)
+    else:
+        participation.refresh_kind(instance.challenge_id)
+
+@receiver(post_delete, sender=AudioChallenge)
+@receiver(post_delete, sender=Quiz)
+@receiver(post_delete, sender=ChallengeTask)
+def forget_challenge_part(sender, instance, **kwargs):
+    participation.forget_item(participation.ITEM_KINDS[sender], instance.pk)
+    participation.refresh_challenge(instance.challenge_id)
+
+# Сводная статистика челленджей: строка заводится вместе с челленджем, счётчики — по событиям.
+# Присоединение через participation.join идёт сырым INSERT и обновляет счётчик само
+@receiver(post_save, sender=Challenge)
+def create_challenge_stats(sender, instance, created, **kwargs):
+    if created:
+        stats.ensure([instance.pk])
+
+@receiver(post_save, sender=Participant)
+def count_participant(sender, instance, created, **kwargs):
+    if created:
+        stats.participants_joined(instance.challenge_id)
+
+@receiver(post_delete, sender=Participant)
+def uncount_participant(sender, instance, **kwargs):
+    stats.participants_joined(instance.challenge_id, -1)
+
+@receiver(post_save, sender=CompletedChallenge)
+def count_completion(sender, instance, created, **kwargs):
+    if created:
+        stats.challenge_completed(instance.challenge_id)
+
+@receiver(post_delete, sender=CompletedChallenge)
+def uncount_completion(sender, instance, **kwargs):
+    stats.challenge_completed(instance.challenge_id, -1)
+
+# Ответ поддержки сразу уходит в открытые чаты пользователя (SSE)
+@receiver(post_save, sender=SupportResponse)
+def push_support_response(sender, instance, created, **kwargs):
+    if created:
+        support_events.response_saved(instance)
+
+# Сообщение с ответом уходит из очереди неотвеченных
+@receiver(post_save, sender=SupportResponse)
+def mark_support_message_answered(sender, instance, created, **kwargs):
+    if created:
+        support_queue.mark_answered(instance.message_id)
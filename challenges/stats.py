@@ -0,0 +1,97 @@
+import statistics
+
+from django.db.models import Count, F, FloatField, OuterRef, Subquery
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
+
+from .models import Challenge, ChallengeStats, CompletedChallenge, Participant, QuizAttempt
+
+# Сводная статистика челленджей (ChallengeStats): админка и страница статистики читают готовую
+# строку, а не считают COUNT на каждый челлендж. Счётчики обновляются по событиям одним UPDATE
+# с F(): присоединение, завершение, пачка попыток квизов. Медиана времени прохождения
+# инкрементально не считается и обновляется вместе с полным пересчётом (refresh), который
+# по расписанию запускает команда refresh_challenge_stats — он же исправляет возможный дрейф счётчиков.
+
+
+def rate(numerator, denominator):
+    """Процент numerator от denominator; 0, если знаменатель 0."""
+    return Coalesce(Cast(numerator, FloatField()) * 100.0 / NullIf(denominator, 0), 0.0, output_field=FloatField())
+
+
+def ensure(challenge_ids):
+    """Создаём пустые строки статистики, которых ещё нет."""
+    ChallengeStats.objects.bulk_create(
+        [ChallengeStats(challenge_id=challenge_id) for challenge_id in challenge_ids], ignore_conflicts=True
+    )
+
+
+def participants_joined(challenge_id, count=1):
+    if not count:
+        return
+    participants = F('participants') + count
+    ChallengeStats.objects.filter(pk=challenge_id).update(
+        participants=participants, completion_rate=rate(F('completions'), participants)
+    )
+
+
+def challenge_completed(challenge_id, count=1):
+    completions = F('completions') + count
+    ChallengeStats.objects.filter(pk=challenge_id).update(
+        completions=completions, completion_rate=rate(completions, F('participants'))
+    )
+
+
+def quiz_attempts_recorded(counts):
+    """counts — {challenge_id: (попыток, успешных)} из пачки попыток; один UPDATE на челлендж."""
+    for challenge_id, (attempts, passes) in counts.items():
+        total, passed = F('quiz_attempts') + attempts, F('quiz_passes') + passes
+        ChallengeStats.objects.filter(pk=challenge_id).update(
+            quiz_attempts=total, quiz_passes=passed, quiz_pass_rate=rate(passed, total)
+        )
+
+
+def _count(queryset, field='challenge'):
+    """Подзапрос: число строк queryset для челленджа строки статистики (её pk — id челленджа)."""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def median_completion_seconds(challenge_ids):
+    """{challenge_id: медиана секунд от присоединения до завершения}; один запрос на все челленджи."""
+    durations = {}
+    completions = CompletedChallenge.objects.all()
+    if challenge_ids is not None:
+        completions = completions.filter(challenge_id__in=challenge_ids)
+    rows = completions.order_by().annotate(
+        joined_at=Subquery(
+            Participant.objects.filter(user=OuterRef('user'), challenge=OuterRef('challenge')).values('joined_at')[:1]
+        )
+    ).filter(joined_at__isnull=False).values_list('challenge_id', 'joined_at', 'completed_at')
+    for challenge_id, joined_at, completed_at in rows.iterator(chunk_size=2000):
+        durations.setdefault(challenge_id, []).append(max((completed_at - joined_at).total_seconds(), 0))
+    return {challenge_id: round(statistics.median(values)) for challenge_id, values in durations.items()}
+
+
+def refresh(challenge_ids=None):
+    """Полный пересчёт статистики (всех или указанных челленджей). Возвращает число строк."""
+    ensure(Challenge.objects.values_list('id', flat=True) if challenge_ids is None else challenge_ids)
+    rows = ChallengeStats.objects.all() if challenge_ids is None else ChallengeStats.objects.filter(pk__in=challenge_ids)
+    updated = rows.update(
+        participants=_count(Participant.objects.all()),
+        completions=_count(CompletedChallenge.objects.all()),
+        quiz_attempts=_count(QuizAttempt.objects.all(), 'quiz__challenge'),
+        quiz_passes=_count(QuizAttempt.objects.filter(passed=True), 'quiz__challenge'),
+        refreshed_at=timezone.now(),
+    )
+    # В SET видны старые значения строки, поэтому доли — вторым UPDATE
+    rows.update(
+        completion_rate=rate(F('completions'), F('participants')),
+        quiz_pass_rate=rate(F('quiz_passes'), F('quiz_attempts')),
+    )
+    medians = median_completion_seconds(challenge_ids)
+    rows = list(rows.only('pk'))
+    for row in rows:
+        row.median_completion_seconds = medians.get(row.pk)
+    ChallengeStats.objects.bulk_update(rows, ['median_completion_seconds'], batch_size=500)
+    return updated
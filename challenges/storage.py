@@ -0,0 +1,58 @@
+import hashlib
+import os
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# Хранилище картинок по содержимому: имя файла — sha256 содержимого, поэтому одинаковые
+# загрузки (в том числе в разные модели) делят один файл, а URL меняется вместе с содержимым
+# и его можно кэшировать навсегда (Cache-Control: immutable, см. challenges.media).
+# Один файл может использоваться несколькими записями, поэтому вместе с записью он не удаляется.
+
+CAS_DIR = 'cas'
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def content_name(digest, original_name):
+    """cas/ab/abcdef....png: расширение сохраняем, чтобы сервер отдавал правильный Content-Type."""
+    extension = os.path.splitext(original_name)[1].lower()
+    return f'{CAS_DIR}/{digest[:2]}/{digest}{extension}'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage в MEDIA_ROOT, который раскладывает файлы по хэшу содержимого."""
+
+    def get_available_name(self, name, max_length=None):
+        return name  # Имя определяется содержимым в _save, суффиксы не нужны
+
+    def _save(self, name, content):
+        name = content_name(content_hash(content), name)
+        if self.exists(name):
+            return name
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # Пишем во временный файл и переименовываем: параллельная загрузка того же содержимого
+        # просто заменит файл идентичным
+        temporary_path = f'{full_path}.{uuid.uuid4().hex}.tmp'
+        with open(temporary_path, 'wb') as output:
+            for chunk in content.chunks():
+                output.write(chunk)
+        if self.file_permissions_mode is not None:
+            os.chmod(temporary_path, self.file_permissions_mode)
+        os.replace(temporary_path, full_path)
+        return name
+
+
+content_storage = ContentAddressedStorage()
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import SupportResponse
+
+logger = logging.getLogger(__name__)
+
+# Живой чат поддержки: ответы админов приходят пользователю по SSE (support_stream) без перезагрузки.
+# Соединение под ASGI — это корутина, ждущая на asyncio.Queue, а не поток, поэтому воркер держит
+# тысячи простаивающих подключений. Брокер только будит подписчиков, сами ответы читаются из базы
+# по id > последнего отправленного, так что потерянное уведомление догоняется при следующем.
+# Брокер задаётся SUPPORT_EVENTS_BACKEND: LocalBroker работает в пределах процесса (один воркер,
+# тесты), RedisBroker разносит события между процессами через Redis pub/sub.
+
+HEARTBEAT = 20  # секунд между комментариями keepalive, чтобы прокси не рвали соединение
+MAX_AGE = 600  # после этого закрываем поток, EventSource переподключится с Last-Event-ID
+RETRY_MS = 3000
+
+
+def channel(user_id):
+    return f'support:{user_id}'
+
+
+class Subscription:
+    """Очередь событий одного подключения; живёт в цикле событий, где создана."""
+
+    def __init__(self, broker, channel_name):
+        self.broker = broker
+        self.channel = channel_name
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    def deliver(self, event):
+        """Можно вызывать из любого потока: событие ставится в очередь через цикл подписчика."""
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+        except RuntimeError:
+            pass  # цикл уже закрыт, подписчик отключился
+
+    async def get(self, timeout):
+        """Следующее событие (накопившиеся повторы схлопываются) или None по таймауту."""
+        try:
+            event = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        while not self.queue.empty():
+            event = self.queue.get_nowait()
+        return event
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """Pub/sub внутри процесса."""
+
+    def __init__(self):
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    async def subscribe(self, channel_name):
+        subscription = Subscription(self, channel_name)
+        with self._lock:
+            self._channels.setdefault(channel_name, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def subscriber_count(self, channel_name=None):
+        with self._lock:
+            if channel_name is not None:
+                return len(self._channels.get(channel_name, ()))
+            return sum(len(subscribers) for subscribers in self._channels.values())
+
+    def deliver(self, channel_name, event):
+        with self._lock:
+            subscribers = list(self._channels.get(channel_name, ()))
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+    def publish(self, channel_name, event):
+        self.deliver(channel_name, event)
+
+
+class RedisBroker(LocalBroker):
+    """Pub/sub между процессами через Redis (SUPPORT_EVENTS_REDIS_URL).
+
+    На процесс одно соединение-слушатель: оно получает события всех каналов support:*
+    и раздаёт их локальным подписчикам, а publish только отправляет событие в Redis.
+    """
+
+    PATTERN = 'support:*'
+
+    def __init__(self):
+        super().__init__()
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError as exc:
+            raise ImproperlyConfigured("Для RedisBroker нужен пакет redis") from exc
+        self.url = getattr(settings, 'SUPPORT_EVENTS_REDIS_URL', 'redis://localhost:6379/0')
+        self._client = redis.Redis.from_url(self.url)
+        self._async_redis = redis.asyncio
+        self._listener = None
+
+    async def subscribe(self, channel_name):
+        subscription = await super().subscribe(channel_name)
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        return subscription
+
+    async def _listen(self):
+        client = self._async_redis.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.psubscribe(self.PATTERN)
+            async for message in pubsub.listen():
+                if message['type'] == 'pmessage':
+                    self.deliver(message['channel'].decode(), json.loads(message['data']))
+        except Exception:
+            logger.exception("Слушатель событий поддержки в Redis остановился")
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+    def publish(self, channel_name, event):
+        self._client.publish(channel_name, json.dumps(event, cls=DjangoJSONEncoder))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            backend = getattr(settings, 'SUPPORT_EVENTS_BACKEND', 'challenges.support_events.LocalBroker')
+            _broker = import_string(backend)()
+        return _broker
+
+
+def response_saved(response):
+    """Точка входа для сигнала: будим подключения владельца сообщения после коммита."""
+    user_id = response.message.user_id
+    transaction.on_commit(lambda: get_broker().publish(channel(user_id), {'response': response.pk}))
+
+
+def format_event(data, event=None, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event:
+        lines.append(f'event: {event}')
+    lines.extend(f'data: {line}' for line in json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False).splitlines())
+    return '\n'.join(lines) + '\n\n'
+
+
+async def responses_after(user_id, after):
+    rows = SupportResponse.objects.filter(message__user_id=user_id, id__gt=after).order_by('id').values(
+        'id', 'message_id', 'response', 'created_at'
+    )
+    return [row async for row in rows]
+
+
+async def last_response_id(user_id):
+    row = await SupportResponse.objects.filter(message__user_id=user_id).order_by('-id').values('id').afirst()
+    return row['id'] if row else 0
+
+
+async def stream(user_id, after):
+    """Поток SSE: ответы с id > after, затем новые по мере появления, между ними keepalive.
+
+    Запрос в базу — только при подключении и по уведомлению брокера, не по таймеру.
+    """
+    heartbeat = getattr(settings, 'SUPPORT_STREAM_HEARTBEAT', HEARTBEAT)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + getattr(settings, 'SUPPORT_STREAM_MAX_AGE', MAX_AGE)
+    subscription = await get_broker().subscribe(channel(user_id))
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        woken = True
+        while True:
+            if woken:
+                for row in await responses_after(user_id, after):
+                    after = row['id']
+                    yield format_event(row, event='response', event_id=row['id'])
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            woken = await subscription.get(min(heartbeat, remaining)) is not None
+            if not woken:
+                yield ': keepalive\n\n'
+    finally:
+        subscription.close()
@@ -0,0 +1,56 @@
+from datetime import datetime
+
+from django.conf import settings
+
+from .models import SupportMessage
+
+# Очередь поддержки для админки: неотвеченные сообщения от самых старых, постранично по курсору
+# (created_at, id) вместо OFFSET — по частичному индексу support_unanswered_idx любая страница стоит одинаково.
+# Вместо точного COUNT(*) по всей таблице считаем не дальше COUNT_CAP строк.
+
+PAGE_SIZE = 50
+COUNT_CAP = 1000
+
+
+def mark_answered(message_id):
+    """Отмечаем сообщение отвеченным одним условным UPDATE; True, если оно было без ответа."""
+    return bool(SupportMessage.objects.filter(pk=message_id, is_answered=False).update(is_answered=True))
+
+
+def encode_cursor(message):
+    return f'{message.created_at.isoformat()}_{message.pk}'
+
+
+def decode_cursor(value):
+    """(created_at, id) из курсора; None для пустого или испорченного значения."""
+    try:
+        created_at, pk = value.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def unanswered_queryset(after=None):
+    """Неотвеченные после курсора от самых старых, без LIMIT."""
+    messages = SupportMessage.objects.filter(is_answered=False)
+    cursor = decode_cursor(after)
+    if cursor:
+        created_at, pk = cursor
+        # >= по created_at даёт поиск по индексу, а не OR по двум условиям со сканированием
+        messages = messages.filter(created_at__gte=created_at).exclude(created_at=created_at, pk__lte=pk)
+    return messages.select_related('user').order_by('created_at', 'pk')
+
+
+def unanswered(after=None, size=None):
+    """Страница очереди и курсор следующей (None на последней). Один запрос."""
+    size = size or getattr(settings, 'SUPPORT_QUEUE_PAGE_SIZE', PAGE_SIZE)
+    rows = list(unanswered_queryset(after)[:size + 1])
+    if len(rows) > size:
+        return rows[:size], encode_cursor(rows[size - 1])
+    return rows, None
+
+
+def estimated_count(queryset, cap=COUNT_CAP):
+    """(число строк, но не больше cap; точное ли оно). COUNT по подзапросу с LIMIT."""
+    count = queryset.order_by()[:cap + 1].count()
+    return min(count, cap), count <= cap
@@ -0,0 +1,38 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from challenges import images
+
+register = template.Library()
+
+
+def _srcset(name, manifest, extension):
+    return ', '.join(
+        f'{default_storage.url(images.derivative_name(name, width, extension))} {width}w'
+        for width in manifest['widths']
+    )
+
+
+@register.simple_tag
+def responsive_image(image, alt='', sizes='100vw', **attrs):
+    """<picture> с WebP и JPEG нескольких ширин; пока производных нет — обычный <img> с оригиналом.
+
+    {% responsive_image challenge.image alt=challenge.title sizes="(max-width: 768px) 100vw, 33vw" class="img-fluid" %}
+    """
+    if not image:
+        return ''
+    attrs = {'loading': 'lazy', 'decoding': 'async', **attrs}
+    manifest = images.manifest(image.name)
+    if manifest is None:
+        return format_html('<img src="{}" alt="{}"{}>', image.url, alt, flatatt(attrs))
+    largest = manifest['widths'][-1]
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}"{}></picture>',
+        _srcset(image.name, manifest, 'webp'), sizes,
+        default_storage.url(images.derivative_name(image.name, largest, 'jpg')),
+        _srcset(image.name, manifest, 'jpg'), sizes,
+        manifest['width'], manifest['height'], alt, flatatt(attrs),
+    )
@@ -1,7 +1,44 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import math
+import zlib
+import os
+import struct
+import tempfile
+import wave
+from contextlib import redirect_stdout
+from io import StringIO
+from asgiref.sync import sync_to_async
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth.models import User
-from .models import Challenge, Book, CompletedChallenge, Participant
+from django.apps import apps as django_apps
+from django.core.management import call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.core.management.base import CommandError
+from django.core.cache import cache
+from django.template import Context, Template
+from .models import Challenge, Book, CompletedChallenge, Participant, LeaderboardEntry, LeaderboardBucket, LeaderboardScoreCount
+from .models import Quiz, Question, Answer, QuizAttempt, AudioAttempt, AudioChallenge, AudioQuestion, BookPage, SearchEntry
+from .models import Profile, SupportMessage, SupportResponse
+from .models import BookTimer, ChallengeStats, ChallengeTask, CompletedItem, CouponImage, DailyCoupon, PersonalCoupon, ReadingProgress
+from .forms import QuizAnswerForm
+from . import answer_matching, attempts, audio_processing, book_pages, catalog, coupons, participation, profiles, images, leaderboard, quiz_io, quiz_keys, reading, search, stats, support_events, support_queue
+
+def query_plan(queryset):
+    """EXPLAIN QUERY PLAN запроса одной строкой (SQLite)."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return '; '.join(row[-1] for row in cursor.fetchall())
+
 
 class ChallengeViewsTest(TestCase):
     def setUp(self):
@@ -69,3 +106,1552 @@ class ChallengeViewsTest(TestCase):
         response = self.client.get(reverse('quiz_list', args=[self.challenge.id]))
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'Квиз')
+
+
+class LeaderboardTest(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'user{i}', password='pass') for i in range(3)]
+        self.challenges = [
+            Challenge.objects.create(
+                title=f'Challenge {i}', description='', creator=self.users[0],
+                start_date='2025-01-01', end_date='2025-02-01'
+            )
+            for i in range(3)
+        ]
+
+    def complete(self, user, challenges):
+        for challenge in challenges:
+            CompletedChallenge.objects.create(user=user, challenge=challenge)
+
+    def test_signals_keep_scores_in_sync(self):
+        self.complete(self.users[0], self.challenges)
+        self.complete(self.users[1], self.challenges[:1])
+        self.assertEqual(LeaderboardEntry.objects.get(user=self.users[0]).challenge_count, 3)
+        self.assertEqual(LeaderboardEntry.objects.get(user=self.users[1]).challenge_count, 1)
+
+        CompletedChallenge.objects.filter(user=self.users[0], challenge=self.challenges[0]).delete()
+        self.assertEqual(LeaderboardEntry.objects.get(user=self.users[0]).challenge_count, 2)
+
+    def test_leaderboard_view_is_single_query(self):
+        self.complete(self.users[0], self.challenges[:1])
+        self.complete(self.users[1], self.challenges)
+        self.complete(self.users[2], self.challenges[:2])
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('leaderboard'))
+        rows = [(entry.user.username, entry.challenge_count) for entry in response.context['leaderboard']]
+        self.assertEqual(rows, [('user1', 3), ('user2', 2), ('user0', 1)])
+
+    def test_windows_and_rank(self):
+        self.complete(self.users[0], self.challenges)
+        self.complete(self.users[1], self.challenges[:2])
+        self.complete(self.users[2], self.challenges[:2])
+        CompletedChallenge.objects.filter(user=self.users[0]).update(
+            completed_at=timezone.now() - timedelta(days=30)
+        )
+        leaderboard.rebuild()
+
+        today = leaderboard.period_key(LeaderboardBucket.SCOPE_DAY)
+        rows = [entry.user.username for entry in leaderboard.top_entries(scope=LeaderboardBucket.SCOPE_DAY, period=today)]
+        self.assertEqual(rows, ['user1', 'user2'])
+        self.assertIsNone(leaderboard.user_rank(self.users[0].id, LeaderboardBucket.SCOPE_DAY, today))
+        self.assertEqual(leaderboard.user_rank(self.users[0].id), {'rank': 1, 'challenge_count': 3})
+        self.assertEqual(leaderboard.user_rank(self.users[2].id)['rank'], 2)
+
+        challenge_period = str(self.challenges[2].id)
+        self.assertEqual(
+            leaderboard.user_rank(self.users[0].id, LeaderboardBucket.SCOPE_CHALLENGE, challenge_period),
+            {'rank': 1, 'challenge_count': 1},
+        )
+
+    def test_incremental_windows_match_rebuild(self):
+        self.complete(self.users[0], self.challenges)
+        self.complete(self.users[1], self.challenges[:1])
+        CompletedChallenge.objects.filter(user=self.users[0], challenge=self.challenges[1]).delete()
+        incremental = set(LeaderboardBucket.objects.filter(challenge_count__gt=0).values_list(
+            'scope', 'period', 'user_id', 'challenge_count'))
+        ranks = [leaderboard.user_rank(user.id, LeaderboardBucket.SCOPE_WEEK, leaderboard.period_key(LeaderboardBucket.SCOPE_WEEK))
+                 for user in self.users]
+
+        leaderboard.rebuild()
+        rebuilt = set(LeaderboardBucket.objects.values_list('scope', 'period', 'user_id', 'challenge_count'))
+        self.assertEqual(incremental, rebuilt)
+        self.assertEqual(ranks, [{'rank': 1, 'challenge_count': 2}, {'rank': 2, 'challenge_count': 1}, None])
+
+    def test_leaderboard_view_window(self):
+        self.complete(self.users[1], self.challenges[:1])
+        self.client.login(username='user1', password='pass')
+        response = self.client.get(reverse('leaderboard'), {'window': 'challenge', 'challenge': self.challenges[0].id})
+        self.assertEqual(response.context['window'], 'challenge')
+        self.assertEqual(response.context['my_rank'], {'rank': 1, 'challenge_count': 1})
+        response = self.client.get(reverse('leaderboard'), {'window': 'bogus'})
+        self.assertEqual(response.context['window'], 'all')
+
+    def test_view_shows_tie_aware_rank(self):
+        self.complete(self.users[0], self.challenges)
+        self.complete(self.users[1], self.challenges[:1])
+        self.complete(self.users[2], self.challenges[:1])
+        response = self.client.get(reverse('leaderboard'))
+        ranks = [(entry.user.username, entry.rank) for entry in response.context['leaderboard']]
+        self.assertEqual(ranks, [('user0', 1), ('user1', 2), ('user2', 2)])
+        for entry in response.context['leaderboard']:
+            self.assertEqual(entry.rank, leaderboard.user_rank(entry.user_id)['rank'])
+
+    def test_deleted_user_leaves_histogram(self):
+        self.complete(self.users[1], self.challenges)
+        self.complete(self.users[2], self.challenges[:1])
+        self.users[1].delete()
+        self.assertEqual(leaderboard.user_rank(self.users[2].id), {'rank': 1, 'challenge_count': 1})
+        stored = set(LeaderboardScoreCount.objects.filter(users__gt=0).values_list('scope', 'period', 'score', 'users'))
+        leaderboard.rebuild()
+        self.assertEqual(stored, set(LeaderboardScoreCount.objects.values_list('scope', 'period', 'score', 'users')))
+
+    def test_rebuild_command_restores_table(self):
+        self.complete(self.users[0], self.challenges)
+        LeaderboardEntry.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_leaderboard', '--check-only', stdout=StringIO(), stderr=StringIO())
+
+        out = StringIO()
+        call_command('rebuild_leaderboard', stdout=out)
+        self.assertIn('совпадает', out.getvalue())
+        self.assertEqual(LeaderboardEntry.objects.get(user=self.users[0]).challenge_count, 3)
+
+
+# Попытки из views пишутся сразу (буфер на одну запись) и журналируются во временный каталог
+@override_settings(ATTEMPT_BUFFER_SIZE=1, ATTEMPT_JOURNAL_DIR=os.path.join(tempfile.gettempdir(), 'challenges-test-attempts'))
+class QuizAnswerKeyTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='quizzer', password='pass')
+        self.challenge = Challenge.objects.create(
+            title='Quiz Challenge', description='', creator=self.user,
+            start_date='2025-01-01', end_date='2025-02-01'
+        )
+        self.quiz = Quiz.objects.create(name='Квиз', challenge=self.challenge)
+        self.q1 = Question.objects.create(quiz=self.quiz, text='2 + 2?')
+        self.q2 = Question.objects.create(quiz=self.quiz, text='Столица Беларуси?')
+        self.right1 = Answer.objects.create(question=self.q1, text='4', is_correct=True)
+        self.wrong1 = Answer.objects.create(question=self.q1, text='5')
+        self.right2 = Answer.objects.create(question=self.q2, text='Минск', is_correct=True)
+        self.wrong2 = Answer.objects.create(question=self.q2, text='Гродно')
+
+    def test_grade_uses_cache_when_warm(self):
+        self.assertTrue(quiz_keys.grade(self.quiz.id, [self.right1.id, self.right2.id]))
+        with self.assertNumQueries(0):
+            self.assertFalse(quiz_keys.grade(self.quiz.id, [self.right1.id, self.wrong2.id]))
+            results = quiz_keys.get_answer_key(self.quiz.id).question_results([self.right1.id, self.wrong2.id])
+        self.assertEqual(results, {self.q1.id: True, self.q2.id: False})
+
+    def test_answer_change_invalidates_key(self):
+        self.assertTrue(quiz_keys.grade(self.quiz.id, [self.right1.id, self.right2.id]))
+        self.wrong2.is_correct = True
+        self.wrong2.save()
+        self.assertFalse(quiz_keys.grade(self.quiz.id, [self.right1.id, self.right2.id]))
+        self.assertTrue(quiz_keys.grade(self.quiz.id, [self.right1.id, self.right2.id, self.wrong2.id]))
+
+        self.q2.delete()
+        self.assertTrue(quiz_keys.grade(self.quiz.id, [self.right1.id]))
+
+    def test_shared_tier_survives_local_eviction(self):
+        quiz_keys.get_answer_key(self.quiz.id)
+        quiz_keys.local_keys.clear()
+        with self.assertNumQueries(0):
+            self.assertTrue(quiz_keys.grade(self.quiz.id, [self.right1.id, self.right2.id]))
+
+    def test_version_lives_in_cross_process_cache(self):
+        # Версию ключа другие воркеры видят только через общий кэш, не через LocMemCache процесса
+        self.assertNotIn('locmem', settings.CACHES['default']['BACKEND'])
+        version = quiz_keys.current_version(self.quiz.id)
+        self.assertEqual(cache.get(quiz_keys.VERSION_KEY.format(quiz_id=self.quiz.id)), version)
+
+    def test_quiz_view_grades_submission(self):
+        self.client.login(username='quizzer', password='pass')
+        response = self.client.post(reverse('quiz_view', args=[self.quiz.id]), {'answers': [self.right1.id, self.right2.id]})
+        self.assertTrue(response.context['success'])
+        response = self.client.post(reverse('quiz_view', args=[self.quiz.id]), {'answers': [self.wrong1.id]})
+        self.assertFalse(response.context['success'])
+        self.assertEqual(
+            list(QuizAttempt.objects.order_by('id').values_list('passed', 'correct_questions', 'total_questions')),
+            [(True, 2, 2), (False, 0, 2)],
+        )
+        self.assertTrue(CompletedChallenge.objects.filter(user=self.user, challenge=self.challenge).exists())
+
+    def test_book_selection_records_attempt(self):
+        self.client.login(username='quizzer', password='pass')
+        response = self.client.post(reverse('book_selection', args=[self.challenge.id]), {
+            'submit_quiz': '1', 'quiz_id': self.quiz.id, 'answers': [self.right1.id, self.right2.id],
+        })
+        self.assertTrue(response.context['success'])
+        self.assertEqual(
+            list(QuizAttempt.objects.values_list('user_id', 'quiz_id', 'passed', 'correct_questions', 'total_questions')),
+            [(self.user.id, self.quiz.id, True, 2, 2)],
+        )
+        self.assertTrue(CompletedChallenge.objects.filter(user=self.user, challenge=self.challenge).exists())
+
+    def test_quiz_page_query_count_is_fixed(self):
+        for i in range(50):
+            question = Question.objects.create(quiz=self.quiz, text=f'Вопрос {i}')
+            Answer.objects.create(question=question, text='Да', is_correct=True)
+            Answer.objects.create(question=question, text='Нет')
+        self.client.login(username='quizzer', password='pass')
+        url = reverse('quiz_view', args=[self.quiz.id])
+
+        # 2 запроса на сессию и пользователя + квиз, вопросы, ответы
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertContains(response, 'Вопрос 49')
+        # На тёплом кэше остаётся только строка квиза
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertContains(response, 'Вопрос 49')
+
+        Answer.objects.filter(question__quiz=self.quiz, text='Нет').first().delete()
+        with self.assertNumQueries(5):
+            self.client.get(url)
+
+    def test_form_accepts_only_answers_of_its_quiz(self):
+        other_quiz = Quiz.objects.create(name='Другой квиз', challenge=self.challenge)
+        other_answer = Answer.objects.create(
+            question=Question.objects.create(quiz=other_quiz, text='?'), text='!', is_correct=True
+        )
+        key = quiz_keys.get_answer_key(self.quiz.id)
+        with self.assertNumQueries(0):
+            form = QuizAnswerForm({'answers': [self.right1.id, self.right2.id]}, answer_key=key)
+            self.assertTrue(form.is_valid())
+            self.assertEqual(sorted(form.cleaned_data['answers']), sorted([self.right1.id, self.right2.id]))
+            self.assertFalse(QuizAnswerForm({'answers': [self.right1.id, other_answer.id]}, answer_key=key).is_valid())
+            self.assertFalse(QuizAnswerForm({'answers': ['abc']}, answer_key=key).is_valid())
+            self.assertFalse(QuizAnswerForm({'answers': [self.right1.id]}).is_valid())
+
+
+class AttemptBufferTest(TestCase):
+    def setUp(self):
+        journal_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(journal_dir.cleanup)
+        self.settings_override = override_settings(
+            ATTEMPT_JOURNAL_DIR=journal_dir.name, ATTEMPT_BUFFER_SIZE=3, ATTEMPT_BUFFER_MAX_AGE=60
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.journal_dir = journal_dir.name
+
+        self.user = User.objects.create_user(username='attempter', password='pass')
+        self.challenge = Challenge.objects.create(
+            title='Attempts', description='', creator=self.user,
+            start_date='2025-01-01', end_date='2025-02-01'
+        )
+        self.quiz = Quiz.objects.create(name='Квиз', challenge=self.challenge)
+        self.buffer = attempts.AttemptBuffer()
+        self.addCleanup(self.buffer.flush)
+
+    def attempt(self, passed=False):
+        return QuizAttempt(user_id=self.user.id, quiz_id=self.quiz.id, passed=passed, correct_questions=0, total_questions=1)
+
+    def test_flushes_by_size_and_feeds_completions(self):
+        self.buffer.add(self.attempt())
+        self.buffer.add(self.attempt())
+        self.assertEqual(QuizAttempt.objects.count(), 0)
+        self.assertEqual(len(os.listdir(self.journal_dir)), 1)
+
+        self.buffer.add(self.attempt(passed=True))
+        self.assertEqual(QuizAttempt.objects.count(), 3)
+        self.assertEqual(os.listdir(self.journal_dir), [])
+        self.assertTrue(CompletedChallenge.objects.filter(user=self.user, challenge=self.challenge).exists())
+        self.assertEqual(LeaderboardEntry.objects.get(user=self.user).challenge_count, 1)
+
+    def test_failed_write_keeps_batch(self):
+        def fail_attempt_inserts(execute, sql, params, many, context):
+            if sql.startswith('INSERT') and '"challenges_quizattempt"' in sql:
+                raise OperationalError('database is locked')
+            return execute(sql, params, many, context)
+
+        self.buffer.add(self.attempt())
+        self.buffer.add(self.attempt())
+        with connection.execute_wrapper(fail_attempt_inserts), self.assertLogs('challenges.attempts', 'ERROR'):
+            self.buffer.add(self.attempt(passed=True))
+        self.assertEqual(QuizAttempt.objects.count(), 0)
+        self.assertEqual(len(self.buffer), 3)
+        self.assertEqual(len(os.listdir(self.journal_dir)), 1)
+
+        # Следующий сброс пишет и вернувшуюся пачку, и новую попытку, и удаляет оба журнала
+        self.buffer.add(self.attempt())
+        self.assertEqual(QuizAttempt.objects.count(), 4)
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(os.listdir(self.journal_dir), [])
+        self.assertTrue(CompletedChallenge.objects.filter(user=self.user, challenge=self.challenge).exists())
+
+    def test_replays_journal_of_dead_worker(self):
+        dead_journal = os.path.join(self.journal_dir, 'attempts-999999999.jsonl')
+        lines = [attempts.serialize(self.attempt(passed=True)) for _ in range(2)]
+        with open(dead_journal, 'w', encoding='utf-8') as journal:
+            journal.write('\n'.join(lines) + '\n')
+
+        out = StringIO()
+        call_command('flush_attempts', stdout=out)
+        self.assertIn('2', out.getvalue())
+        self.assertEqual(QuizAttempt.objects.count(), 2)
+        self.assertFalse(os.path.exists(dead_journal))
+        self.assertEqual(CompletedChallenge.objects.filter(user=self.user).count(), 1)
+
+        # Повторная догрузка того же журнала не создаёт дублей
+        with open(dead_journal, 'w', encoding='utf-8') as journal:
+            journal.write('\n'.join(lines) + '\n')
+        attempts.replay_journals()
+        self.assertEqual(QuizAttempt.objects.count(), 2)
+
+
+class QuizImportExportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='pass')
+        self.challenge = Challenge.objects.create(
+            title='Import', description='', creator=self.user,
+            start_date='2025-01-01', end_date='2025-02-01'
+        )
+
+    def jsonl(self, *quizzes):
+        return ''.join(json.dumps(quiz, ensure_ascii=False) + '\n' for quiz in quizzes)
+
+    def test_import_export_round_trip(self):
+        source = self.jsonl({
+            'name': 'Столицы',
+            'challenge': self.challenge.id,
+            'questions': [
+                {'text': 'Беларусь', 'answers': [{'text': 'Минск', 'is_correct': True}, {'text': 'Брест'}]},
+                {'text': 'Литва', 'answers': [{'text': 'Вильнюс', 'is_correct': True}]},
+            ],
+        })
+        stats = quiz_io.import_quizzes(StringIO(source))
+        self.assertEqual((stats.quizzes, stats.questions, stats.answers), (1, 2, 3))
+
+        quiz = Quiz.objects.get(name='Столицы')
+        self.assertEqual(quiz.challenge, self.challenge)
+        self.assertEqual(
+            list(Answer.objects.filter(question__quiz=quiz, is_correct=True).values_list('question__text', 'text')),
+            [('Беларусь', 'Минск'), ('Литва', 'Вильнюс')],
+        )
+        exported = json.loads(next(quiz_io.export_quizzes(Quiz.objects.filter(id=quiz.id))))
+        self.assertEqual(exported['questions'], [
+            {'text': 'Беларусь', 'answers': [{'text': 'Минск', 'is_correct': True}, {'text': 'Брест', 'is_correct': False}]},
+            {'text': 'Литва', 'answers': [{'text': 'Вильнюс', 'is_correct': True}]},
+        ])
+
+    def test_admin_import_and_export(self):
+        admin_user = User.objects.create_superuser(username='admin', password='pass')
+        self.client.force_login(admin_user)
+        upload = SimpleUploadedFile('quizzes.jsonl', self.jsonl(
+            {'name': 'Из админки', 'questions': [{'text': '?', 'answers': [{'text': '!', 'is_correct': True}]}]}
+        ).encode('utf-8'))
+        response = self.client.post(reverse('admin:challenges_quiz_import_jsonl'), {'file': upload})
+        self.assertRedirects(response, reverse('admin:challenges_quiz_changelist'))
+        quiz = Quiz.objects.get(name='Из админки')
+
+        response = self.client.post(reverse('admin:challenges_quiz_changelist'), {
+            'action': 'export_as_jsonl', '_selected_action': [quiz.id],
+        })
+        line = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(json.loads(line)['questions'][0]['answers'], [{'text': '!', 'is_correct': True}])
+
+    def test_import_command_reports_bad_line(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False, encoding='utf-8') as source:
+            source.write(self.jsonl({'name': 'Первый', 'questions': []}) + '{broken\n')
+        self.addCleanup(os.remove, source.name)
+
+        with self.assertRaisesMessage(CommandError, 'Строка 2'):
+            call_command('import_quizzes', source.name, stdout=StringIO())
+        # Первый квиз уже закоммичен в своей транзакции
+        self.assertTrue(Quiz.objects.filter(name='Первый').exists())
+
+    def test_malformed_nested_items_rejected(self):
+        cases = [
+            ({'questions': ['oops']}, 'вопрос 1: ожидается объект'),
+            ({'questions': [{'text': '?', 'answers': 'нет'}]}, 'вопрос 1: answers'),
+            ({'questions': [{'text': '?'}, {'text': '?', 'answers': [1]}]}, 'вопрос 2, ответ 1'),
+            ({'questions': [{'text': '?', 'answers': [{'is_correct': True}]}]}, 'вопрос 1, ответ 1'),
+            ({'questions': [{'text': '?', 'answers': [{'text': '!', 'is_correct': 'да'}]}]}, 'is_correct'),
+            ({'challenge': 'x', 'questions': []}, 'challenge'),
+        ]
+        for quiz, message in cases:
+            with self.subTest(message=message), self.assertRaisesMessage(quiz_io.QuizImportError, message):
+                quiz_io.import_quizzes(StringIO(self.jsonl({'name': 'Первый', 'questions': []}, quiz)))
+        self.assertFalse(Quiz.objects.exclude(name='Первый').exists())
+
+    def test_admin_reports_malformed_upload(self):
+        self.client.force_login(User.objects.create_superuser(username='admin', password='pass'))
+        upload = SimpleUploadedFile('quizzes.jsonl', self.jsonl({'questions': ['oops']}).encode('utf-8'))
+        response = self.client.post(reverse('admin:challenges_quiz_import_jsonl'), {'file': upload}, follow=True)
+        self.assertContains(response, 'Строка 1: вопрос 1')
+        self.assertFalse(Quiz.objects.exists())
+
+
+class MediaServingTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(media_root.name, 'audio_questions'))
+        self.content = bytes(range(256)) * 40
+        with open(os.path.join(media_root.name, 'audio_questions', 'clip.mp3'), 'wb') as clip:
+            clip.write(self.content)
+        self.url = reverse('serve_media', args=['audio_questions/clip.mp3'])
+
+    def test_full_and_range_requests(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'audio/mpeg')
+        self.assertIn('max-age', response['Cache-Control'])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-10:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_conditional_requests(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # If-Range со старым ETag: отдаём файл целиком
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_rejects_other_paths_and_offloads(self):
+        self.assertEqual(self.client.get('/media/audio_questions/../../settings.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/audio_questions/missing.mp3').status_code, 404)
+        with self.settings(MEDIA_OFFLOAD='x-accel-redirect'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/audio_questions/clip.mp3')
+
+
+class AudioProcessingTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name, AUDIO_PROCESSING_SYNC=True)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.challenge = AudioChallenge.objects.create(title='Угадай звук')
+        self.user = User.objects.create_user(username='listener', password='pass')
+
+    def wav_upload(self, seconds=2, rate=44100, name='tone.wav'):
+        """Стерео-синус 440 Гц, 16 бит."""
+        frames = b''.join(
+            struct.pack('<hh', value, value)
+            for value in (int(8000 * math.sin(2 * math.pi * 440 * i / rate)) for i in range(int(seconds * rate)))
+        )
+        buffer = tempfile.SpooledTemporaryFile()
+        with wave.open(buffer, 'wb') as output:
+            output.setnchannels(2)
+            output.setsampwidth(2)
+            output.setframerate(rate)
+            output.writeframes(frames)
+        buffer.seek(0)
+        return SimpleUploadedFile(name, buffer.read(), content_type='audio/wav')
+
+    def test_upload_is_processed_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            question = AudioQuestion.objects.create(
+                audio_challenge=self.challenge, audio_file=self.wav_upload(), correct_answer='ля'
+            )
+        question.refresh_from_db()
+        self.assertEqual(question.processing_status, AudioQuestion.STATUS_DONE)
+        self.assertAlmostEqual(question.duration, 2, places=2)
+        self.assertEqual(len(question.peaks), audio_processing.PEAKS_COUNT)
+        self.assertTrue(all(20 <= peak <= 30 for peak in question.peaks))
+        if audio_processing.has_ffmpeg():
+            self.assertTrue(question.stream_file.name.startswith('audio_questions/stream/'))
+            self.assertEqual(question.playback_file, question.stream_file)
+        else:
+            # Без ffmpeg сжать нечем: несжатая копия не легче оригинала, поэтому её нет
+            self.assertFalse(question.stream_file)
+            self.assertEqual(question.playback_file, question.audio_file)
+
+        self.client.login(username='listener', password='pass')
+        response = self.client.get(reverse('audio_challenge_detail', args=[self.challenge.id]))
+        self.assertContains(response, question.playback_file.url)
+        self.assertContains(response, 'preload="none"')
+        self.assertContains(response, 'class="waveform"')
+        self.assertContains(response, f'height: {question.peaks[0]}%')
+
+    def test_replaced_file_is_reprocessed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            question = AudioQuestion.objects.create(
+                audio_challenge=self.challenge, audio_file=self.wav_upload(), correct_answer='ля'
+            )
+        question.refresh_from_db()
+        question.correct_answer = 'нота ля'
+        with self.captureOnCommitCallbacks() as callbacks:
+            question.save()
+        self.assertEqual(callbacks, [])  # файл не менялся
+
+        question.audio_file = self.wav_upload(seconds=1, name='short.wav')
+        with self.captureOnCommitCallbacks(execute=True):
+            question.save()
+        question.refresh_from_db()
+        self.assertEqual(question.processing_status, AudioQuestion.STATUS_DONE)
+        self.assertAlmostEqual(question.duration, 1, places=2)
+
+    def test_old_stream_removed_on_replace_and_delete(self):
+        def fake_stream(question, name):
+            path = os.path.join(settings.MEDIA_ROOT, audio_processing.STREAM_DIR, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as stream:
+                stream.write(b'mp3')
+            AudioQuestion.objects.filter(pk=question.pk).update(stream_file=f'{audio_processing.STREAM_DIR}/{name}')
+            question.refresh_from_db()
+            return path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            question = AudioQuestion.objects.create(
+                audio_challenge=self.challenge, audio_file=self.wav_upload(), correct_answer='ля'
+            )
+        old_stream = fake_stream(question, 'old.mp3')
+        question.correct_answer = 'нота ля'
+        with self.captureOnCommitCallbacks(execute=True):
+            question.save()
+        self.assertTrue(os.path.exists(old_stream))  # файл не менялся
+
+        question.audio_file = self.wav_upload(seconds=1, name='short.wav')
+        with self.captureOnCommitCallbacks(execute=True):
+            question.save()
+        self.assertFalse(os.path.exists(old_stream))
+
+        new_stream = fake_stream(question, 'new.mp3')
+        with self.captureOnCommitCallbacks(execute=True):
+            question.delete()
+        self.assertFalse(os.path.exists(new_stream))
+
+    def test_broken_file_is_marked_failed(self):
+        with self.assertLogs('challenges.audio_processing', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            question = AudioQuestion.objects.create(
+                audio_challenge=self.challenge,
+                audio_file=SimpleUploadedFile('broken.mp3', b'not audio at all'),
+                correct_answer='шум',
+            )
+        question.refresh_from_db()
+        self.assertEqual(question.processing_status, AudioQuestion.STATUS_FAILED)
+        self.assertEqual(question.playback_file, question.audio_file)
+
+    def test_probe_mp3_reads_frame_headers(self):
+        path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'media', 'audio_challenges', 'secret3.mp3')
+        if not os.path.exists(path):
+            self.skipTest("Нет тестового MP3")
+        info = audio_processing.probe_mp3(path)
+        self.assertGreater(info['duration'], 0)
+        self.assertIn(info['bitrate'], range(8, 321))
+
+
+@override_settings(ATTEMPT_BUFFER_SIZE=1, ATTEMPT_JOURNAL_DIR=os.path.join(tempfile.gettempdir(), 'challenges-test-attempts'))
+class AudioAnswerMatchingTest(TestCase):
+    def test_normalize(self):
+        self.assertEqual(answer_matching.normalize('  Ёлка,  ЗЕЛЁНАЯ!! '), 'елка зеленая')
+        self.assertEqual(answer_matching.normalize('Rock-n-Roll'), 'rock n roll')
+        self.assertEqual(answer_matching.normalize('STRASSE'), answer_matching.normalize('Straße'))
+
+    def test_within_distance(self):
+        self.assertTrue(answer_matching.within_distance('бетховен', 'бетховен', 0))
+        self.assertTrue(answer_matching.within_distance('бетховен', 'бетховин', 1))
+        self.assertTrue(answer_matching.within_distance('бетховен', 'бетхвен', 1))
+        self.assertFalse(answer_matching.within_distance('бетховен', 'бтхвен', 1))
+        self.assertTrue(answer_matching.within_distance('бетховен', 'бтхвен', 2))
+        self.assertFalse(answer_matching.within_distance('моцарт', 'бетховен', 3))
+
+    def test_keys_are_normalized_on_save(self):
+        challenge = AudioChallenge.objects.create(title='Композиторы')
+        question = AudioQuestion.objects.create(
+            audio_challenge=challenge, correct_answer='Пётр Чайковский', alternate_answers='Чайковский\n\nЧАЙКОВСКИЙ'
+        )
+        self.assertEqual(question.normalized_answers, ['петр чайковский', 'чайковский'])
+        question.correct_answer = 'П. И. Чайковский'
+        question.save(update_fields=['correct_answer'])
+        question.refresh_from_db()
+        self.assertEqual(question.normalized_answers, ['п и чайковский', 'чайковский'])
+
+    def test_grading(self):
+        challenge = AudioChallenge.objects.create(title='Композиторы')
+        first = AudioQuestion.objects.create(audio_challenge=challenge, correct_answer='Бетховен', order=1)
+        second = AudioQuestion.objects.create(
+            audio_challenge=challenge, correct_answer='Да', answer_tolerance=3, order=2
+        )
+        strict = AudioQuestion.objects.create(
+            audio_challenge=challenge, correct_answer='Шопен', answer_tolerance=0, order=3
+        )
+        questions = [first, second, strict]
+        self.assertEqual(answer_matching.grade(questions, {first.id: 'бетховин!', second.id: 'ДА', strict.id: 'шопен.'}), 3)
+        # Короткий ответ опечаток не прощает, даже с большой терпимостью
+        self.assertEqual(answer_matching.grade(questions, {first.id: 'бтховин', second.id: 'до', strict.id: 'шопэн'}), 0)
+
+        user = User.objects.create_user(username='listener', password='pass')
+        self.client.login(username='listener', password='pass')
+        response = self.client.post(reverse('audio_challenge_detail', args=[challenge.id]), {
+            f'answer_{first.id}': 'Бетховен', f'answer_{second.id}': 'да', f'answer_{strict.id}': 'Шопен',
+        })
+        self.assertRedirects(response, reverse('audio_challenge_success', args=[challenge.id]), fetch_redirect_response=False)
+        self.assertEqual(self.client.session['audio_success'], {'correct': 3, 'total': 3})
+        attempts.buffer.flush()
+        self.assertTrue(challenge.attempts.filter(user=user, passed=True).exists())
+
+
+@override_settings(BOOK_PAGE_CHARS=200)
+class BookReaderTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='reader', password='pass')
+        self.challenge = Challenge.objects.create(
+            title='Чтение', description='', creator=user, start_date='2025-01-01', end_date='2025-02-01'
+        )
+        paragraph = 'Абзац <текста> для проверки нарезки. ' * 2
+        chapters = [f'Глава {number}\r\n\r\n' + '\r\n\r\n'.join([paragraph] * 6) for number in range(1, 4)]
+        self.text = 'Предисловие.\r\n\r\n' + '\r\n\r\n'.join(chapters)
+        self.book = Book.objects.create(
+            title='Роман', author='Автор', description='', challenge=self.challenge, full_text=self.text
+        )
+
+    def test_pages_cover_text_and_start_chapters(self):
+        pages = list(self.book.pages.all())
+        self.assertEqual(Book.objects.get(pk=self.book.pk).page_count, len(pages))
+        self.assertGreater(len(pages), 3)
+        self.assertTrue(all(page.end - page.start <= 200 for page in pages))
+        self.assertEqual([page.heading for page in pages if page.heading], ['Глава 1', 'Глава 2', 'Глава 3'])
+        for page in pages:
+            if page.heading:
+                self.assertTrue(self.text[page.start:].startswith(page.heading))
+        self.assertIn('&lt;текста&gt;', pages[1].html)
+        joined = ' '.join(self.text[page.start:page.end] for page in pages).split()
+        self.assertEqual(joined, self.text.split())
+
+    def test_long_paragraph_is_split(self):
+        pages = book_pages.split_pages('слово ' * 100, size=50)
+        self.assertTrue(all(page['end'] - page['start'] <= 50 for page in pages))
+        self.assertEqual(pages[-1]['end'], 600)
+
+    def test_reader_fetches_one_page(self):
+        last = self.book.pages.count()
+        book_pages.table_of_contents(self.book.id)
+        with self.assertNumQueries(2):  # книга без текста и страница; оглавление из кэша
+            response = self.client.get(reverse('book_page', args=[self.book.id, 2]))
+        self.assertNotContains(response, 'Предисловие')
+        self.assertContains(response, f'Страница 2 из {last}')
+        self.assertContains(response, 'rel="prefetch" href="%s"' % reverse('book_page', args=[self.book.id, 3]))
+        self.assertContains(response, reverse('book_page', args=[self.book.id, 1]))
+        self.assertContains(response, 'Глава 3')
+
+        response = self.client.get(reverse('book_detail', args=[self.book.id]))
+        self.assertContains(response, 'Предисловие')
+        self.assertEqual(self.client.get(reverse('book_page', args=[self.book.id, last + 1])).status_code, 404)
+        self.assertNotContains(self.client.get(reverse('book_page', args=[self.book.id, last])), 'rel="next"')
+
+    def test_text_change_rebuilds_pages_and_toc(self):
+        self.assertEqual(len(book_pages.table_of_contents(self.book.id)), 3)
+        self.book.full_text = 'Коротко.'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.save()
+        self.assertEqual(BookPage.objects.filter(book=self.book).count(), 1)
+        self.assertEqual(book_pages.table_of_contents(self.book.id), [])
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='pass')
+        self.challenge = Challenge.objects.create(
+            title='Зимнее чтение', description='Читаем классику вечерами', creator=self.admin,
+            start_date='2025-01-01', end_date='2025-02-01',
+        )
+        self.book = Book.objects.create(
+            title='Ёлка', author='Фёдор Достоевский', description='Рассказ',
+            full_text='Мальчик у Христа на ёлке. <script>alert(1)</script> Снег падал на город.',
+            challenge=self.challenge,
+        )
+        self.quiz = Quiz.objects.create(name='Проверка по рассказу', challenge=self.challenge)
+
+    def test_signals_keep_index_in_sync(self):
+        self.assertEqual(SearchEntry.objects.count(), 3)
+        self.assertEqual([hit.object_id for hit in search.search('снег', kinds=['book'])], [self.book.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Question.objects.create(quiz=self.quiz, text='Кто написал «Бесов»?')
+        hits = search.search('бесов')
+        self.assertEqual([(hit.kind, hit.object_id) for hit in hits], [('quiz', self.quiz.id)])
+
+        self.book.full_text = 'Другой текст'
+        self.book.save()
+        self.assertEqual(search.search('снег'), [])
+        self.book.delete()
+        self.assertFalse(SearchEntry.objects.filter(kind='book').exists())
+
+    def test_ranking_folding_and_snippets(self):
+        hits = search.search('ёлк')  # префикс, ё и е не различаются
+        self.assertEqual(hits[0].kind, 'book')
+        self.assertIn('<mark>елке</mark>', hits[0].snippet)
+        self.assertNotIn('<script>', hits[0].snippet)
+        self.assertIn('&lt;script&gt;', hits[0].snippet)
+        # Синтаксис FTS5 во вводе пользователя не ломает запрос
+        self.assertEqual([hit.object_id for hit in search.search('"снег (*')], [self.book.id])
+        self.assertEqual(search.search('***'), [])
+
+    def test_long_book_indexes_excerpt_and_vocabulary(self):
+        text = 'Снег падал на город. ' * 2000 + 'В конце пришла Оттепель.'
+        book = Book.objects.create(title='Зима', author='', description='', full_text=text, challenge=self.challenge)
+        body = SearchEntry.objects.get(kind='book', object_id=book.id).body
+        self.assertLess(len(body), search.BOOK_EXCERPT_CHARS + 100)
+        vocabulary = body.rsplit('\n', 1)[1]
+        self.assertEqual(sorted(vocabulary.split()), sorted(['снег', 'падал', 'на', 'город', 'в', 'конце', 'пришла', 'оттепель']))
+        self.assertEqual([hit.object_id for hit in search.search('оттеп', kinds=['book'])], [book.id])
+        self.assertIn('<mark>Снег</mark>', search.search('снег конце', kinds=['book'])[0].snippet)
+
+    def test_search_view(self):
+        response = self.client.get(reverse('search'), {'q': 'классику'})
+        self.assertContains(response, reverse('challenge_detail', args=[self.challenge.id]))
+        self.assertContains(response, '<mark>классику</mark>', html=False)
+        response = self.client.get(reverse('search'), {'q': 'классику', 'kind': 'book'})
+        self.assertContains(response, 'Ничего не найдено')
+
+    def test_admin_uses_index(self):
+        self.client.login(username='admin', password='pass')
+        response = self.client.get(reverse('admin:challenges_book_changelist'), {'q': 'падал'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.book])
+        response = self.client.get(reverse('admin:challenges_book_changelist'), {'q': 'нигде'})
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+    def test_question_saves_reindex_quiz_once_per_transaction(self):
+        def index_writes(queries):
+            return [query for query in queries if query['sql'].startswith('UPDATE "challenges_searchentry"')]
+
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            for i in range(5):
+                Question.objects.create(quiz=self.quiz, text=f'Вопрос {i} про метель')
+        self.assertEqual(len(index_writes(queries)), 1)
+        self.assertEqual([hit.object_id for hit in search.search('метель')], [self.quiz.id])
+
+        # Пачка откаченной транзакции не мешает следующей
+        with self.assertRaises(ValueError), transaction.atomic():
+            Question.objects.create(quiz=self.quiz, text='Пропавший вопрос')
+            raise ValueError
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            Question.objects.create(quiz=self.quiz, text='Вьюга')
+        self.assertEqual(len(index_writes(queries)), 1)
+        self.assertEqual(len(search.search('вьюга')), 1)
+
+    def test_admin_search_is_not_truncated(self):
+        Challenge.objects.bulk_create([
+            Challenge(title=f'Метель {i}', description='', creator=self.admin, start_date='2025-01-01', end_date='2025-02-01')
+            for i in range(1100)
+        ])
+        search.rebuild()
+        self.client.login(username='admin', password='pass')
+        response = self.client.get(reverse('admin:challenges_challenge_changelist'), {'q': 'метель'})
+        self.assertEqual(response.context['cl'].result_count, 1100)
+
+    def test_rebuild(self):
+        SearchEntry.objects.all().delete()
+        self.assertEqual(search.search('снег'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(search.search('снег')), 1)
+
+
+class CompressedBookTextTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='reader', password='pass')
+        self.challenge = Challenge.objects.create(
+            title='Чтение', description='', creator=user, start_date='2025-01-01', end_date='2025-02-01'
+        )
+        self.text = 'Длинный текст книги, который повторяется. ' * 2000
+        self.book = Book.objects.create(
+            title='Роман', author='Автор', description='', challenge=self.challenge, full_text=self.text
+        )
+
+    def test_stored_compressed_and_read_back(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT full_text FROM challenges_book WHERE id = %s', [self.book.id])
+            stored = bytes(cursor.fetchone()[0])
+        self.assertLess(len(stored), len(self.text.encode('utf-8')) // 10)
+        self.assertEqual(zlib.decompress(stored).decode('utf-8'), self.text)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).full_text, self.text)
+        self.assertEqual(Book.objects.filter(full_text=self.text).count(), 1)
+
+        default = Book.objects.create(title='Пустая', author='', description='', challenge=self.challenge)
+        self.assertEqual(Book.objects.get(pk=default.pk).full_text, 'Текст отсутствует')
+
+    def test_pages_stored_compressed(self):
+        page = BookPage.objects.filter(book=self.book).first()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT html FROM challenges_bookpage WHERE id = %s', [page.id])
+            stored = bytes(cursor.fetchone()[0])
+        self.assertEqual(zlib.decompress(stored).decode('utf-8'), page.html)
+        self.assertLess(len(stored), len(page.html.encode('utf-8')) // 10)
+
+    def test_lists_defer_full_text(self):
+        with CaptureQueriesContext(connection) as queries:
+            books = list(Book.objects.filter(challenge=self.challenge))
+        self.assertNotIn('full_text', queries[0]['sql'])
+        with self.assertNumQueries(1):
+            self.assertEqual(books[0].full_text, self.text)
+
+        self.client.login(username='reader', password='pass')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('book_selection', args=[self.challenge.id]))
+        self.assertFalse([query for query in queries if 'full_text' in query['sql']])
+
+    def test_admin_edits_text(self):
+        User.objects.create_superuser(username='admin', password='pass')
+        self.client.login(username='admin', password='pass')
+        url = reverse('admin:challenges_book_change', args=[self.book.id])
+        self.assertContains(self.client.get(url), 'Длинный текст книги')
+        response = self.client.post(url, {
+            'title': 'Роман', 'author': 'Автор', 'description': 'Описание',
+            'full_text': 'Новый текст', 'challenge': self.challenge.id,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).full_text, 'Новый текст')
+
+
+@override_settings(READING_FLUSH_INTERVAL=60)
+class ReadingProgressTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='pass')
+        challenge = Challenge.objects.create(
+            title='Чтение', description='', creator=self.user, start_date='2025-01-01', end_date='2025-02-01'
+        )
+        self.book = Book.objects.create(title='Роман', author='Автор', description='', challenge=challenge)
+        self.buffer = reading.HeartbeatBuffer()
+        self.addCleanup(self.buffer.flush)
+
+    def test_heartbeats_are_aggregated_and_upserted(self):
+        for _ in range(10):
+            self.buffer.add(self.user.id, self.book.id, 30, page=2)
+        self.buffer.add(self.user.id, self.book.id, 10_000, page=3)  # больше лимита не засчитывается
+        self.buffer.add(self.user.id, self.book.id + 100, 30)  # несуществующая книга
+        self.assertFalse(ReadingProgress.objects.exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            self.buffer.flush()
+        statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 2)  # проверка книг и один upsert на пачку
+        progress = ReadingProgress.objects.get()
+        self.assertEqual((progress.seconds, progress.last_page), (300 + reading.max_heartbeat_seconds(), 3))
+
+        self.buffer.add(self.user.id, self.book.id, 15)
+        self.buffer.flush()
+        progress.refresh_from_db()
+        self.assertEqual(progress.seconds, 315 + reading.max_heartbeat_seconds())
+        self.assertEqual(ReadingProgress.objects.count(), 1)
+
+    def test_heartbeat_view(self):
+        url = reverse('book_heartbeat', args=[self.book.id])
+        self.assertEqual(self.client.post(url, {'seconds': 5}).status_code, 302)  # только для вошедших
+        self.client.login(username='reader', password='pass')
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertEqual(self.client.post(url, {'seconds': 'x'}).status_code, 400)
+        with self.assertNumQueries(2):  # сессия и пользователь; в таблицы прогресса не пишем
+            response = self.client.post(url, {'seconds': 25, 'page': 1})
+        self.assertEqual(response.json(), {'status': 'ok'})
+        reading.buffer.flush()
+        self.assertEqual(ReadingProgress.objects.get(user=self.user, book=self.book).seconds, 25)
+
+    def test_expired_timers_finalized_in_one_update(self):
+        past = timezone.now() - timedelta(minutes=1)
+        BookTimer.objects.bulk_create(
+            [BookTimer(user=self.user, book=self.book, end_time=past) for _ in range(5)]
+            + [BookTimer(user=self.user, book=self.book)]
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(reading.finalize_expired_timers(), 5)
+        self.assertEqual(BookTimer.objects.filter(is_completed=False).count(), 1)
+
+        timer = BookTimer.objects.create(user=self.user, book=self.book, end_time=past)
+        with self.assertNumQueries(1):
+            self.assertTrue(timer.check_timer())
+        with self.assertNumQueries(0):
+            self.assertTrue(timer.check_timer())
+        out = StringIO()
+        call_command('finalize_book_timers', stdout=out)
+        self.assertIn('0', out.getvalue())
+
+    def test_expired_timers_found_by_partial_index(self):
+        plan = query_plan(BookTimer.objects.filter(is_completed=False, end_time__lte=timezone.now()))
+        self.assertIn('USING INDEX book_timer_open_idx (end_time<?)', plan)
+
+
+class ImageDerivativesTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(
+            MEDIA_ROOT=media_root.name, IMAGE_PROCESSING_SYNC=True, IMAGE_DERIVATIVE_WIDTHS=(100, 400, 2000)
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(cache.clear)
+        self.media_root = media_root.name
+        self.user = User.objects.create_user(username='artist', password='pass')
+
+    def png_upload(self, size=(800, 600), name='cover.png'):
+        from PIL import Image
+
+        output = tempfile.SpooledTemporaryFile()
+        Image.new('RGBA', size, (255, 0, 0, 128)).save(output, 'PNG')
+        output.seek(0)
+        return SimpleUploadedFile(name, output.read(), content_type='image/png')
+
+    def test_derivatives_generated_after_commit(self):
+        from PIL import Image
+
+        with self.captureOnCommitCallbacks(execute=True):
+            challenge = Challenge.objects.create(
+                title='Картинки', description='', creator=self.user, start_date='2025-01-01', end_date='2025-02-01',
+                image=self.png_upload(),
+            )
+        name = challenge.image.name
+        self.assertEqual(images.manifest(name), {'width': 800, 'height': 600, 'widths': [100, 400, 800]})
+        for width in (100, 400, 800):
+            with Image.open(os.path.join(self.media_root, images.derivative_name(name, width, 'webp'))) as webp:
+                self.assertEqual((webp.format, webp.width), ('WEBP', width))
+            with Image.open(os.path.join(self.media_root, images.derivative_name(name, width, 'jpg'))) as jpeg:
+                self.assertEqual((jpeg.format, jpeg.mode, jpeg.height), ('JPEG', 'RGB', width * 3 // 4))
+
+        html = Template(
+            '{% load responsive_images %}{% responsive_image challenge.image alt=challenge.title sizes="50vw" class="img-fluid" %}'
+        ).render(Context({'challenge': challenge}))
+        self.assertIn('<source type="image/webp" srcset="/media/derivatives/cas/', html)
+        self.assertIn('.400.webp 400w', html)
+        self.assertIn('.800.jpg 800w"', html)
+        self.assertIn('width="800" height="600"', html)
+        self.assertIn('class="img-fluid"', html)
+        self.assertIn('loading="lazy"', html)
+
+    def test_falls_back_to_original(self):
+        quiz = Quiz.objects.create(name='Без обработки', image=self.png_upload(name='quiz.png'))  # коммит не выполняется
+        html = Template('{% load responsive_images %}{% responsive_image quiz.image alt="x" %}').render(
+            Context({'quiz': quiz})
+        )
+        self.assertEqual(html, f'<img src="{quiz.image.url}" alt="x" decoding="async" loading="lazy">')
+        self.assertEqual(Template('{% load responsive_images %}{% responsive_image quiz.image %}').render(
+            Context({'quiz': Quiz(name='Пустой')})
+        ), '')
+
+    def test_only_new_files_are_scheduled(self):
+        import shutil
+
+        with self.captureOnCommitCallbacks(execute=True):
+            quiz = Quiz.objects.create(name='Один', image=self.png_upload(name='one.png'))
+        self.assertTrue(images.has_derivatives(quiz.image.name))
+        # Без производных на диске любое лишнее планирование сделало бы их заново
+        shutil.rmtree(os.path.join(self.media_root, images.DERIVATIVES_DIR))
+
+        quiz = Quiz.objects.get(pk=quiz.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            quiz.name = 'Переименован'
+            quiz.save()
+            quiz.save(update_fields=['name'])
+            Quiz.objects.only('name').get(pk=quiz.pk).save(update_fields=['name'])
+        self.assertFalse(images.has_derivatives(quiz.image.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            quiz.image = self.png_upload(size=(640, 480), name='two.png')
+            quiz.save()
+        self.assertTrue(images.has_derivatives(quiz.image.name))
+
+        os.makedirs(os.path.join(self.media_root, 'avatars'))
+        with open(os.path.join(self.media_root, 'avatars', 'default.png'), 'wb') as output:
+            output.write(self.png_upload(name='default.png').read())
+        with self.captureOnCommitCallbacks(execute=True):
+            Profile.objects.get(user=self.user).save()
+            User.objects.create_user(username='newcomer')
+        self.assertFalse(images.has_derivatives('avatars/default.png'))
+
+    def test_missing_file_is_skipped(self):
+        images.schedule('avatars/default.png')
+        self.assertFalse(images.has_derivatives('avatars/default.png'))
+        self.assertIsNone(cache.get(images.MANIFEST_KEY.format(name='avatars/default.png')))
+
+    def test_backfill_command(self):
+        Quiz.objects.create(name='Один', image=self.png_upload(name='one.png'))
+        small = Quiz.objects.create(name='Два', image=self.png_upload(size=(50, 50), name='two.png'))
+        out, err = StringIO(), StringIO()
+        call_command('generate_image_derivatives', workers=2, stdout=out, stderr=err)
+        # Аватар по умолчанию в пустом MEDIA_ROOT отсутствует и попадает в ошибки
+        self.assertIn('Обработано картинок: 2, с ошибками: 1', out.getvalue())
+        self.assertIn('avatars/default.png', err.getvalue())
+        self.assertEqual(images.manifest(small.image.name)['widths'], [50])
+
+    def test_audio_challenge_pages_use_derivatives(self):
+        challenge = Challenge.objects.create(
+            title='Звуки', description='', creator=self.user, start_date='2025-01-01', end_date='2025-02-01'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            audio = AudioChallenge.objects.create(title='Угадай', challenge=challenge, image=self.png_upload(name='audio.png'))
+            CouponImage.objects.create(challenge=challenge, image=self.png_upload(name='coupon.png'))
+        self.assertIsNotNone(images.manifest(audio.image.name))
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('audio_challenge_list', args=[challenge.id]))
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, 'class="cover-image"')
+
+        session = self.client.session
+        session['audio_success'] = {'correct': 1, 'total': 1}
+        session.save()
+        response = self.client.get(reverse('audio_challenge_success', args=[audio.id]))
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, 'class="coupon-image"')
+
+
+class ContentAddressedStorageTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.media_root = media_root.name
+        self.user = User.objects.create_user(username='keeper', password='pass')
+        self.challenge = Challenge.objects.create(
+            title='Купоны', description='', creator=self.user, start_date='2025-01-01', end_date='2025-02-01',
+        )
+        self.content = b'\x89PNG same bytes'
+
+    def cas_files(self):
+        return [name for _, _, files in os.walk(os.path.join(self.media_root, 'cas')) for name in files]
+
+    def test_identical_uploads_share_one_file(self):
+        quiz = Quiz.objects.create(name='Квиз', image=SimpleUploadedFile('Фон.PNG', self.content))
+        coupon = CouponImage.objects.create(challenge=self.challenge, image=SimpleUploadedFile('coupon.png', self.content))
+        self.user.profile.avatar = SimpleUploadedFile('me.png', self.content)
+        self.user.profile.save()
+
+        digest = hashlib.sha256(self.content).hexdigest()
+        self.assertEqual(quiz.image.name, f'cas/{digest[:2]}/{digest}.png')
+        self.assertEqual(coupon.image.name, quiz.image.name)
+        self.assertEqual(self.user.profile.avatar.name, quiz.image.name)
+        self.assertEqual(self.cas_files(), [f'{digest}.png'])
+        self.assertIn(digest, quiz.image.url)
+
+        other = Quiz.objects.create(name='Другой', image=SimpleUploadedFile('Фон.PNG', b'other bytes'))
+        self.assertNotEqual(other.image.name, quiz.image.name)
+
+    def test_cas_files_served_immutable(self):
+        quiz = Quiz.objects.create(name='Квиз', image=SimpleUploadedFile('a.png', self.content))
+        response = self.client.get(f'/media/{quiz.image.name}')
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+    def test_relink_command_deduplicates_legacy_files(self):
+        os.makedirs(os.path.join(self.media_root, 'quiz_images'))
+        os.makedirs(os.path.join(self.media_root, 'coupon_images'))
+        for name in ('quiz_images/one.png', 'quiz_images/one_SErx06c.png', 'coupon_images/one.png'):
+            with open(os.path.join(self.media_root, name), 'wb') as legacy:
+                legacy.write(self.content)
+        first = Quiz.objects.create(name='Первый', image='quiz_images/one.png')
+        second = Quiz.objects.create(name='Второй', image='quiz_images/one_SErx06c.png')
+        coupon = CouponImage.objects.create(challenge=self.challenge, image='coupon_images/one.png')
+
+        out = StringIO()
+        call_command('relink_media', dry_run=True, stdout=out)
+        self.assertIn('Файлов: 3, уникальных: 1', out.getvalue())
+        first.refresh_from_db()
+        self.assertEqual(first.image.name, 'quiz_images/one.png')
+
+        out = StringIO()
+        call_command('relink_media', delete_originals=True, stdout=out, stderr=StringIO())
+        self.assertIn('записей обновлено: 3', out.getvalue())
+        names = {item.image.name for item in (first, second, coupon) if not item.refresh_from_db()}
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names.pop().startswith('cas/'))
+        self.assertEqual(len(self.cas_files()), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'quiz_images/one.png')))
+
+
+class DailyCouponTest(TestCase):
+    def setUp(self):
+        coupons.forget()
+        self.addCleanup(coupons.forget)
+        self.now = timezone.now()
+
+    def test_cached_until_expiry(self):
+        coupon = coupons.current(self.now)
+        self.assertEqual(DailyCoupon.objects.get().code, coupon.code)
+        with self.assertNumQueries(0):
+            self.assertEqual(coupons.current(self.now + timedelta(hours=23)), coupon)
+        self.assertEqual(coupons.time_label(coupon, self.now + timedelta(hours=20)), 'Осталось 4 часов')
+        self.assertEqual(coupons.time_label(coupon, self.now + timedelta(hours=23, minutes=30)), 'Осталось 30 минут')
+
+    def test_rotates_once_per_period(self):
+        DailyCoupon.objects.create(id=1, code='OLDCODE', discount=5)
+        DailyCoupon.objects.filter(id=1).update(last_updated=self.now - timedelta(days=2))
+
+        with self.assertNumQueries(2):
+            rotated = coupons.current(self.now)
+        self.assertNotEqual(rotated.code, 'OLDCODE')
+        self.assertEqual(rotated.expires_at, self.now + timedelta(days=1))
+
+        # Другой процесс с устаревшим купоном: его UPDATE ничего не меняет, он читает код победителя
+        coupons.forget()
+        self.assertEqual(coupons.current(self.now + timedelta(seconds=1)), rotated)
+        self.assertEqual(DailyCoupon.objects.get().code, rotated.code)
+
+    def test_page_and_admin_edit(self):
+        user = User.objects.create_user(username='shopper', password='pass')
+        self.client.force_login(user)
+        with self.assertLogs('challenges.coupons', 'WARNING'):  # пул личных купонов пуст — показываем общий
+            code = self.client.get(reverse('get_daily_coupon')).context['coupon'].code
+            DailyCoupon.objects.filter(id=1).update(code='STALE')
+            self.assertContains(self.client.get(reverse('get_daily_coupon')), code)
+
+            coupon = DailyCoupon.objects.get()
+            coupon.code = 'MANUAL10'
+            coupon.save()
+            self.assertContains(self.client.get(reverse('get_daily_coupon')), 'MANUAL10')
+
+
+@override_settings(COUPON_POOL_SYNC=True, COUPON_POOL_SIZE=20, COUPON_POOL_LOW_WATER=5)
+class CouponPoolTest(TestCase):
+    def setUp(self):
+        coupons.forget()
+        self.addCleanup(coupons.forget)
+        self.users = [User.objects.create_user(username=f'buyer{i}', password='pass') for i in range(3)]
+
+    def test_fill_command_and_daily_claim(self):
+        out = StringIO()
+        call_command('fill_coupon_pool', size=10, stdout=out)
+        self.assertIn('Добавлено кодов: 10, свободных в пуле: 10', out.getvalue())
+        call_command('fill_coupon_pool', size=10, stdout=StringIO())
+        self.assertEqual(coupons.pool.depth(), 10)
+
+        today = timezone.localdate()
+        first = coupons.pool.claim(self.users[0])
+        self.assertEqual((first.user, first.issued_on), (self.users[0], today))
+        with self.assertNumQueries(1):
+            self.assertEqual(coupons.pool.claim(self.users[0]), first)
+        second = coupons.pool.claim(self.users[1])
+        self.assertNotEqual(second.code, first.code)
+        self.assertNotEqual(coupons.pool.claim(self.users[0], today + timedelta(days=1)).code, first.code)
+        self.assertEqual(coupons.pool.depth(), 7)
+
+    def test_refills_in_background_when_low(self):
+        coupons.pool.refill(6)
+        with self.captureOnCommitCallbacks(execute=True):
+            coupons.pool.claim(self.users[0])
+        self.assertEqual(coupons.pool.depth(), 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            coupons.pool.claim(self.users[1])
+        self.assertEqual(coupons.pool.depth(), 20)
+
+    def test_empty_pool_falls_back_to_daily_coupon(self):
+        self.client.force_login(self.users[2])
+        with self.assertLogs('challenges.coupons', 'WARNING'):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.get(reverse('get_daily_coupon'))
+        self.assertEqual(response.context['coupon'].code, DailyCoupon.objects.get().code)
+        self.assertEqual(coupons.pool.depth(), 20)
+
+        response = self.client.get(reverse('get_daily_coupon'))
+        personal = PersonalCoupon.objects.get(user=self.users[2])
+        self.assertContains(response, personal.code)
+
+
+@override_settings(CHALLENGE_PAGE_SIZE=2)
+class ChallengeCatalogTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='browser', password='pass')
+        self.today = timezone.localdate()
+        spans = {'Прошлый': (-20, -10), 'Идёт': (-5, 5), 'Идёт тоже': (-5, 1), 'Скоро': (3, 10), 'Потом': (30, 40)}
+        self.challenges = {
+            title: Challenge.objects.create(
+                title=title, description='Описание ' * 100, creator=self.user,
+                start_date=self.today + timedelta(days=start), end_date=self.today + timedelta(days=end),
+            )
+            for title, (start, end) in spans.items()
+        }
+
+    def test_keyset_pages_through_json_endpoint(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('challenge_list'))
+        self.assertContains(response, 'Потом')
+        self.assertContains(response, 'Скоро')
+        self.assertNotContains(response, 'Прошлый')
+        self.assertNotContains(response, 'Описание ' * 40)
+
+        titles, after = [], response.context['next_cursor']
+        while after:
+            page = self.client.get(reverse('challenge_list_page'), {'after': after}).json()
+            titles += [title for title in self.challenges if f'>{title}</a>' in page['html']]
+            after = page['next']
+        self.assertEqual(titles, ['Идёт', 'Идёт тоже', 'Прошлый'])
+
+    def test_status_filters(self):
+        def titles(status):
+            return [challenge.title for challenge in catalog.page(status, size=10)[0]]
+
+        self.assertEqual(titles(catalog.STATUS_ACTIVE), ['Идёт тоже', 'Идёт'])
+        self.assertEqual(titles(catalog.STATUS_UPCOMING), ['Потом', 'Скоро'])
+        self.assertEqual(titles(catalog.STATUS_FINISHED), ['Прошлый'])
+        self.assertEqual(len(titles('')), 5)
+        self.assertEqual(catalog.page(after='мусор', size=10)[0][0].title, 'Потом')
+
+    def test_cards_cached_until_challenge_saved(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('challenge_list'))
+        Challenge.objects.filter(pk=self.challenges['Потом'].pk).update(title='Без сигнала')
+        self.assertNotContains(self.client.get(reverse('challenge_list')), 'Без сигнала')
+
+        challenge = Challenge.objects.get(pk=self.challenges['Потом'].pk)
+        challenge.title = 'Переименован'
+        challenge.save()
+        self.assertContains(self.client.get(reverse('challenge_list')), 'Переименован')
+
+        # Тёплый кэш: сессия, пользователь, страница челленджей и прогресс по ней, без профиля
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('challenge_list'))
+        self.assertEqual(len(queries), 4)
+        self.assertFalse(any('challenges_profile' in query['sql'] for query in queries))
+
+    def test_anonymous_redirected_to_login(self):
+        for name in ('challenge_list', 'challenge_list_page'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 302)
+            self.assertIn('login', response['Location'])
+
+
+class ChallengeJoinTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='joiner', password='pass')
+        self.challenge = Challenge.objects.create(
+            title='Запуск', description='', creator=self.user, start_date='2025-01-01', end_date='2025-02-01'
+        )
+        self.client.force_login(self.user)
+
+    def kind(self):
+        self.challenge.refresh_from_db()
+        return self.challenge.kind
+
+    def test_kind_follows_content(self):
+        self.assertEqual(self.kind(), Challenge.KIND_BOOK)
+        quiz = Quiz.objects.create(name='Квиз', challenge=self.challenge)
+        self.assertEqual(self.kind(), Challenge.KIND_QUIZ)
+        audio = AudioChallenge.objects.create(title='Аудио', challenge=self.challenge)
+        self.assertEqual(self.kind(), Challenge.KIND_AUDIO)
+        audio.delete()
+        self.assertEqual(self.kind(), Challenge.KIND_QUIZ)
+        quiz.delete()
+        self.assertEqual(self.kind(), Challenge.KIND_BOOK)
+
+    def test_join_is_one_insert_and_idempotent(self):
+        Quiz.objects.create(name='Квиз', challenge=self.challenge)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(participation.join(self.user.id, self.challenge.id))
+        self.assertEqual(len(queries), 2)  # вставка участника и счётчик в ChallengeStats
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(participation.join(self.user.id, self.challenge.id))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(Participant.objects.filter(user=self.user, challenge=self.challenge).count(), 1)
+
+        response = self.client.get(reverse('join_challenge', args=[self.challenge.id]))
+        self.assertRedirects(response, reverse('quiz_list', args=[self.challenge.id]), fetch_redirect_response=False)
+        self.assertEqual(Participant.objects.count(), 1)
+        self.assertEqual(self.client.get(reverse('join_challenge', args=[0])).status_code, 404)
+
+
+class ParticipantProgressTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='progress', password='pass')
+        self.challenge = Challenge.objects.create(
+            title='Прогресс', description='', creator=self.user, start_date='2025-01-01', end_date='2025-02-01'
+        )
+        self.tasks = [ChallengeTask.objects.create(challenge=self.challenge, title=f'Задание {i}') for i in range(2)]
+        self.quiz = Quiz.objects.create(name='Квиз', challenge=self.challenge)
+        self.audio = AudioChallenge.objects.create(title='Аудио', challenge=self.challenge)
+        self.client.force_login(self.user)
+
+    def participant(self):
+        return Participant.objects.get(user=self.user, challenge=self.challenge)
+
+    def test_incremental_completion(self):
+        self.challenge.refresh_from_db()
+        self.assertEqual(self.challenge.unit_count, 4)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(participation.complete(self.user.id, self.challenge.id, CompletedItem.KIND_TASK, self.tasks[0].id))
+        # выполнение, участник, счётчик участников в ChallengeStats, прогресс, проверка завершения
+        self.assertEqual(len([query for query in queries if 'SAVEPOINT' not in query['sql']]), 5)
+        self.assertFalse(participation.complete(self.user.id, self.challenge.id, CompletedItem.KIND_TASK, self.tasks[0].id))
+        self.assertEqual((self.participant().completed_units, self.participant().progress), (1, 25.0))
+
+        response = self.client.post(reverse('complete_task', args=[self.tasks[1].id]))
+        self.assertRedirects(response, reverse('challenge_detail', args=[self.challenge.id]), fetch_redirect_response=False)
+        self.assertEqual(self.participant().progress, 50.0)
+        response = self.client.get(reverse('challenge_detail', args=[self.challenge.id]))
+        self.assertContains(response, 'Выполнено 2 из 4')
+
+    def test_attempts_and_recompute_on_content_change(self):
+        attempts.save_attempts([
+            QuizAttempt(user_id=self.user.id, quiz_id=self.quiz.id, passed=True, correct_questions=1, total_questions=1),
+            QuizAttempt(user_id=self.user.id, quiz_id=self.quiz.id, passed=True, correct_questions=1, total_questions=1),
+            AudioAttempt(user_id=self.user.id, audio_challenge_id=self.audio.id, passed=False, correct=0, total=1),
+        ])
+        self.assertEqual((self.participant().completed_units, self.participant().progress), (1, 25.0))
+
+        # Новое задание меняет знаменатель, удалённый квиз перестаёт считаться
+        ChallengeTask.objects.create(challenge=self.challenge, title='Ещё')
+        self.assertEqual(self.participant().progress, 20.0)
+        self.quiz.delete()
+        self.assertEqual((self.participant().completed_units, self.participant().progress), (0, 0.0))
+        self.assertFalse(CompletedItem.objects.exists())
+
+    def test_challenge_completed_only_at_full_progress(self):
+        attempts.save_attempts([
+            QuizAttempt(user_id=self.user.id, quiz_id=self.quiz.id, passed=True, correct_questions=1, total_questions=1),
+            AudioAttempt(user_id=self.user.id, audio_challenge_id=self.audio.id, passed=True, correct=1, total=1),
+        ])
+        participation.complete(self.user.id, self.challenge.id, CompletedItem.KIND_TASK, self.tasks[0].id)
+        self.assertEqual(self.participant().progress, 75.0)
+        self.assertFalse(CompletedChallenge.objects.exists())
+        self.assertFalse(LeaderboardEntry.objects.filter(challenge_count__gt=0).exists())
+
+        participation.complete(self.user.id, self.challenge.id, CompletedItem.KIND_TASK, self.tasks[1].id)
+        self.assertEqual(self.participant().progress, 100.0)
+        self.assertTrue(CompletedChallenge.objects.filter(user=self.user, challenge=self.challenge).exists())
+        self.assertEqual(ChallengeStats.objects.get(challenge=self.challenge).completions, 1)
+
+    def test_progress_bars_on_list_in_one_query(self):
+        participation.complete(self.user.id, self.challenge.id, CompletedItem.KIND_QUIZ, self.quiz.id)
+        other = Challenge.objects.create(
+            title='Другой', description='', creator=self.user, start_date='2025-01-01', end_date='2025-02-01'
+        )
+        participation.join(self.user.id, other.id)
+        self.client.get(reverse('challenge_list'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('challenge_list'))
+        self.assertEqual(len(queries), 4)  # сессия, пользователь, страница челленджей, прогресс
+        self.assertContains(response, 'aria-valuenow="25"')
+        self.assertContains(response, 'aria-valuenow="0"')
+
+
+class ChallengeStatsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='stats', password='pass')
+        self.challenge = Challenge.objects.create(
+            title='Статистика', description='', creator=self.user, start_date='2025-01-01', end_date='2025-02-01'
+        )
+        self.quiz = Quiz.objects.create(name='Квиз', challenge=self.challenge)
+
+    def stats(self):
+        return ChallengeStats.objects.get(challenge=self.challenge)
+
+    def test_counters_follow_events(self):
+        other = User.objects.create_user(username='other', password='pass')
+        participation.join(self.user.id, self.challenge.id)
+        participation.join(self.user.id, self.challenge.id)
+        participation.join(other.id, self.challenge.id)
+        attempts.save_attempts([
+            QuizAttempt(user=self.user, quiz=self.quiz, passed=True),
+            QuizAttempt(user=other, quiz=self.quiz, passed=False),
+            QuizAttempt(user=other, quiz=self.quiz, passed=False),
+            QuizAttempt(user=other, quiz=self.quiz, passed=False),
+        ])
+        row = self.stats()
+        self.assertEqual((row.participants, row.completions), (2, 1))
+        self.assertEqual(row.completion_rate, 50.0)
+        self.assertEqual((row.quiz_attempts, row.quiz_passes, row.quiz_pass_rate), (4, 1, 25.0))
+
+        CompletedChallenge.objects.filter(user=self.user).delete()
+        Participant.objects.filter(user=other).delete()
+        row = self.stats()
+        self.assertEqual((row.participants, row.completions, row.completion_rate), (1, 0, 0.0))
+
+    def test_refresh_fixes_drift_and_computes_median(self):
+        joined = timezone.now() - timedelta(hours=3)
+        Participant.objects.create(user=self.user, challenge=self.challenge, joined_at=joined)
+        CompletedChallenge.objects.create(user=self.user, challenge=self.challenge)
+        ChallengeStats.objects.filter(challenge=self.challenge).update(participants=10, quiz_attempts=7)
+
+        self.assertEqual(stats.refresh(), 1)
+        row = self.stats()
+        self.assertEqual((row.participants, row.completions, row.completion_rate), (1, 1, 100.0))
+        self.assertEqual((row.quiz_attempts, row.quiz_pass_rate), (0, 0.0))
+        self.assertAlmostEqual(row.median_completion_seconds, 3 * 3600, delta=60)
+        self.assertIsNotNone(row.refreshed_at)
+
+    def test_refresh_command_creates_missing_rows(self):
+        ChallengeStats.objects.all().delete()
+        out = StringIO()
+        call_command('refresh_challenge_stats', stdout=out)
+        self.assertIn('1', out.getvalue())
+        self.assertTrue(ChallengeStats.objects.filter(challenge=self.challenge).exists())
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse('admin:challenges_challenge_changelist')).status_code, 200)
+        return len([query for query in queries if 'SAVEPOINT' not in query['sql']])
+
+    def test_admin_and_page_read_rollup_in_constant_queries(self):
+        admin_user = User.objects.create_superuser(username='admin', password='pass')
+        self.client.force_login(admin_user)
+        for i in range(5):
+            Challenge.objects.create(title=f'Ч{i}', description='', creator=self.user, start_date='2025-01-01', end_date='2025-02-01')
+        few = self.changelist_queries()
+        for i in range(25):
+            Challenge.objects.create(title=f'Ещё {i}', description='', creator=self.user, start_date='2025-01-01', end_date='2025-02-01')
+        self.assertEqual(self.changelist_queries(), few)
+
+        with self.assertNumQueries(1):  # статистика вместе с челленджами одним JOIN
+            response = self.client.get(reverse('challenge_stats'))
+        self.assertContains(response, 'Статистика')
+        self.assertEqual(len(response.context['rows']), 31)
+
+
+class SupportStreamTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='asker', password='pass')
+        self.admin = User.objects.create_superuser(username='helper', password='pass')
+        self.message = SupportMessage.objects.create(user=self.user, message='Не открывается квиз')
+        self.async_client.force_login(self.user)
+
+    def reply(self, text):
+        with self.captureOnCommitCallbacks(execute=True):
+            return SupportResponse.objects.create(message=self.message, admin=self.admin, response=text)
+
+    async def open_stream(self, headers=None):
+        response = await self.async_client.get(reverse('support_stream'), headers=headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = response.streaming_content
+        self.assertEqual(await anext(content), b'retry: 3000\n\n')  # подписка уже оформлена
+        return content
+
+    async def test_new_response_is_pushed(self):
+        content = await self.open_stream()
+        pending = asyncio.ensure_future(anext(content))
+        response = await sync_to_async(self.reply)('Уже починили')
+        chunk = (await asyncio.wait_for(pending, 5)).decode()
+        self.assertIn(f'id: {response.id}\nevent: response\n', chunk)
+        self.assertEqual(json.loads(chunk.split('data: ', 1)[1])['response'], 'Уже починили')
+        await content.aclose()
+
+    async def test_catch_up_from_last_event_id(self):
+        first = await sync_to_async(self.reply)('Первый')
+        second = await sync_to_async(self.reply)('Второй')
+        content = await self.open_stream({'Last-Event-ID': str(first.id)})
+        self.assertIn(f'id: {second.id}\n', (await anext(content)).decode())
+        await content.aclose()
+
+    @override_settings(SUPPORT_STREAM_HEARTBEAT=0.01, SUPPORT_STREAM_MAX_AGE=0.05)
+    async def test_keepalive_and_max_age(self):
+        content = await self.open_stream()
+        chunks = [chunk async for chunk in content]
+        self.assertIn(b': keepalive\n\n', chunks)
+
+    def test_anonymous_is_rejected(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('support_stream')).status_code, 401)
+
+    def test_chat_page_shows_thread(self):
+        self.reply('Ответ в истории')
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('support_chat'))
+        self.assertContains(response, 'Ответ в истории')
+        self.assertEqual(response.context['last_response_id'], self.message.responses.get().id)
+
+    async def test_local_broker_routes_by_channel(self):
+        broker = support_events.LocalBroker()
+        mine = await broker.subscribe(support_events.channel(1))
+        other = await broker.subscribe(support_events.channel(2))
+        await sync_to_async(broker.publish, thread_sensitive=False)(support_events.channel(1), {'response': 5})
+        self.assertEqual(await mine.get(1), {'response': 5})
+        self.assertIsNone(await other.get(0.01))
+        mine.close()
+        other.close()
+        self.assertEqual(broker.subscriber_count(), 0)
+
+
+class SupportQueueTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='helper', password='pass')
+        self.user = User.objects.create_user(username='asker', password='pass')
+        start = timezone.now() - timedelta(days=1)
+        self.messages = [
+            SupportMessage.objects.create(user=self.user, message=f'Вопрос {i}', created_at=start + timedelta(minutes=i // 2))
+            for i in range(7)
+        ]
+        self.client.force_login(self.admin)
+
+    def test_response_marks_message_answered(self):
+        message = self.messages[0]
+        SupportResponse.objects.create(message=message, admin=self.admin, response='Ответ')
+        message.refresh_from_db()
+        self.assertTrue(message.is_answered)
+        self.assertFalse(support_queue.mark_answered(message.id))
+
+    def test_queue_walks_oldest_first_by_cursor(self):
+        SupportResponse.objects.create(message=self.messages[2], admin=self.admin, response='Ответ')
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                rows, cursor = support_queue.unanswered(after=cursor, size=2)
+            seen.extend(message.id for message in rows)
+            if cursor is None:
+                break
+        expected = [message.id for message in self.messages if message.id != self.messages[2].id]
+        self.assertEqual(seen, expected)
+        self.assertIsNone(support_queue.decode_cursor('испорчен'))
+
+    def test_estimated_count_is_capped(self):
+        queryset = SupportMessage.objects.filter(is_answered=False)
+        self.assertEqual(support_queue.estimated_count(queryset), (7, True))
+        self.assertEqual(support_queue.estimated_count(queryset, cap=5), (5, False))
+
+    def test_queue_uses_partial_index(self):
+        cursor = support_queue.encode_cursor(self.messages[3])
+        plan = query_plan(support_queue.unanswered_queryset(after=cursor)[:51])
+        self.assertIn('support_unanswered_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertIn('support_unanswered_idx', query_plan(SupportMessage.objects.filter(is_answered=False)[:1001]))
+        self.assertEqual(len(support_queue.unanswered(after=cursor)[0]), 3)
+
+    def test_admin_pages(self):
+        with self.settings(SUPPORT_QUEUE_PAGE_SIZE=5):
+            response = self.client.get(reverse('admin:challenges_supportmessage_queue'))
+        self.assertContains(response, 'Без ответа: 7')
+        self.assertEqual([message.id for message in response.context['rows']], [m.id for m in self.messages[:5]])
+        self.assertContains(response, 'Дальше')
+
+        response = self.client.get(reverse('admin:challenges_supportmessage_changelist'))
+        self.assertContains(response, 'Очередь без ответа')
+        self.assertEqual(response.context['cl'].result_count, 7)
+
+
+class ProfileBackfillTest(TestCase):
+    def make_users(self, count):
+        users = User.objects.bulk_create([User(username=f'bulk{User.objects.count()}_{i}') for i in range(count)])
+        return users  # bulk_create не шлёт post_save, профилей у них нет
+
+    def migrate_queries(self):
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries, redirect_stdout(out):
+            emit_post_migrate_signal(verbosity=1, interactive=False, db='default')
+        return len([query for query in queries if 'SAVEPOINT' not in query['sql']]), out.getvalue()
+
+    def test_backfill_creates_only_missing_profiles(self):
+        existing = User.objects.create_user(username='has_profile')
+        self.make_users(3)
+        with CaptureQueriesContext(connection) as queries:
+            created, _ = profiles.backfill(django_apps)
+        self.assertEqual(created, 3)
+        self.assertEqual(len(queries), 2)  # анти-джойн и одна пачка вставки
+        self.assertEqual(Profile.objects.filter(user=existing).count(), 1)
+        self.assertFalse(User.objects.filter(profile__isnull=True).exists())
+        self.assertEqual(profiles.backfill(django_apps)[0], 0)
+
+    def test_post_migrate_query_count_does_not_grow_with_users(self):
+        self.make_users(5)
+        few, output = self.migrate_queries()
+        self.assertEqual(output.count('Создано профилей: 5'), 1)  # один раз за migrate, а не на приложение
+        self.make_users(50)
+        self.assertEqual(self.migrate_queries()[0], few)
+        self.assertEqual(self.migrate_queries()[1], '')  # без недостающих профилей — тишина
+
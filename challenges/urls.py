@@ -1,12 +1,15 @@
-from django.urls import path
-from . import views
+from django.urls import path, re_path
+from . import media, views
 from .views import support_chat
 
 urlpatterns = [
     path('profile/', views.profile, name='profile'),
     path('support/', support_chat, name='support_chat'),
+    path('support/stream/', views.support_stream, name='support_stream'),
     path('', views.challenge_list, name='challenge_list'),
+    path('page/', views.challenge_list_page, name='challenge_list_page'),
     path('<int:challenge_id>/', views.challenge_detail, name='challenge_detail'),
+    path('task/<int:task_id>/complete/', views.complete_task, name='complete_task'),
     path('change-password/', views.change_password, name='change_password'),
     path('password-change-done/', views.password_change_done, name='password_change_done'),
     # Ежедневный купон
@@ -16,6 +19,8 @@ urlpatterns = [
     path('<int:challenge_id>/join/', views.join_challenge, name='join_challenge'),
 
     path('leaderboard/', views.leaderboard, name='leaderboard'),
+    path('search/', views.search_view, name='search'),
+    path('stats/', views.challenge_stats, name='challenge_stats'),
     
     # Список книг и квизов для конкретного челленджа
     path('<int:challenge_id>/books/', views.book_selection, name='book_selection'), 
@@ -23,6 +28,8 @@ urlpatterns = [
     
     # Страница для деталей книги
     path('<int:book_id>/detail/', views.book_detail, name='book_detail'),
+    path('book/<int:book_id>/page/<int:number>/', views.book_page, name='book_page'),
+    path('book/<int:book_id>/heartbeat/', views.book_heartbeat, name='book_heartbeat'),
     
     # Страница для прохождения квиза
     path("quiz/<int:quiz_id>/", views.quiz_view, name="quiz_view"),
@@ -30,5 +37,7 @@ urlpatterns = [
     path('<int:challenge_id>/audio-challenges/', views.audio_challenge_list, name='audio_challenge_list'), 
     path('audio-challenge/<int:audiochallenge_id>/', views.audio_challenge_detail, name='audio_challenge_detail'),
     path('audio-challenge/<int:audiochallenge_id>/success/', views.audio_challenge_success, name='audio_challenge_success'),
-]
 
+    # Аудио отдаётся своим view с поддержкой Range и кэширования, в том числе при DEBUG = False
+    re_path(r'^media/(?P<path>(?:audio_questions|audio_challenges|cas|derivatives/cas)/.+)$', media.serve_media, name='serve_media'),
+]
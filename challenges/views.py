@@ -1,17 +1,20 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import PasswordChangeForm
-from .models import Challenge, Book, Participant, Quiz, Question, Answer, CompletedChallenge, DailyCoupon
+from .models import Challenge, Book, Participant, Quiz, Question
 from .forms import CustomUserCreationForm, BookSelectionForm, QuizAnswerForm
-from django.db.models import Count
-from django.contrib.auth.models import User
 from .models import AudioChallenge, Profile, AudioQuestion, SupportMessage
 from .forms import AudioChallengeForm, ProfileForm, SupportMessageForm
-import random
-import string
-from django.utils import timezone
+from .models import LeaderboardBucket
+from .leaderboard import WINDOWS, period_key, top_entries, user_rank, with_ranks
+from .models import QuizAttempt, AudioAttempt, BookPage, ChallengeStats, ChallengeTask, CompletedItem, CouponImage
+from . import answer_matching, attempts, book_pages, catalog, coupons, participation, quiz_keys, reading, search
+from . import support_events
 
 
 # Регистрация пользователя
@@ -68,24 +71,77 @@ def profile(request):
     return render(request, 'profile.html', {'form': form})
 
 # Список челленджей
+def _challenge_page_context(request):
+    status = request.GET.get('status', '')
+    challenges, next_cursor = catalog.page(status, request.GET.get('after'))
+    # Прогресс пользователя по всем карточкам страницы одним запросом (вне кэша карточек)
+    progress = participation.progress_by_challenge(request.user, [challenge.id for challenge in challenges])
+    for challenge in challenges:
+        challenge.user_progress = progress.get(challenge.id)
+    return {
+        'challenges': challenges,
+        'next_cursor': next_cursor,
+        'status': status,
+        'card_timeout': catalog.CARD_TIMEOUT,
+    }
+
 @login_required
 def challenge_list(request):
-    """Список всех челленджей"""
-    challenges = Challenge.objects.all()
-    return render(request, 'challenges/list.html', {'challenges': challenges})
+    """Список челленджей постранично, с фильтром по статусу"""
+    context = _challenge_page_context(request)
+    context['status_choices'] = catalog.STATUS_CHOICES
+    context['avatar_timeout'] = catalog.AVATAR_TIMEOUT
+    return render(request, 'challenges/list.html', context)
 
-def leaderboard(request):
-    leaderboard = CompletedChallenge.objects.values('user') \
-        .annotate(challenge_count=Count('challenge')) \
-        .order_by('-challenge_count')[:10] 
-    
-    leaderboard_data = []
-    for entry in leaderboard:
-        user = entry['user']
-        user_name = User.objects.get(id=user).username 
-        leaderboard_data.append({'user': user_name, 'challenge_count': entry['challenge_count']})
+@login_required
+def challenge_list_page(request):
+    """Следующая страница карточек для бесконечной прокрутки: HTML карточек и курсор"""
+    context = _challenge_page_context(request)
+    html = render_to_string('challenges/challenge_cards.html', context, request=request)
+    return JsonResponse({'html': html, 'next': context['next_cursor']})
+
+def search_view(request):
+    """Поиск по книгам, челленджам и квизам с подсветкой совпадений"""
+    query = request.GET.get('q', '').strip()
+    kind = request.GET.get('kind', '')
+    kinds = [kind] if kind in dict(search.KIND_CHOICES) else None
+    results = search.search(query, kinds=kinds) if query else []
+    return render(request, 'challenges/search.html', {
+        'query': query,
+        'kind': kind,
+        'kind_choices': search.KIND_CHOICES,
+        'results': results,
+    })
 
-    return render(request, 'leaderboard.html', {'leaderboard': leaderboard_data})
+def challenge_stats(request):
+    """Статистика челленджей из готовой сводки ChallengeStats: один запрос на страницу"""
+    rows = ChallengeStats.objects.select_related('challenge').order_by('-participants', 'challenge_id')[:100]
+    return render(request, 'challenges/stats.html', {'rows': rows})
+
+def leaderboard(request):
+    # Счёт хранится в LeaderboardEntry/LeaderboardBucket и обновляется сигналами,
+    # поэтому чтение не зависит от размера CompletedChallenge
+    window = request.GET.get('window', LeaderboardBucket.SCOPE_ALL)
+    challenge_id = request.GET.get('challenge', '')
+    challenge = None
+    if window == LeaderboardBucket.SCOPE_CHALLENGE and challenge_id.isdigit():
+        challenge = get_object_or_404(Challenge, id=challenge_id)
+    elif window not in WINDOWS or window == LeaderboardBucket.SCOPE_CHALLENGE:
+        window = LeaderboardBucket.SCOPE_ALL
+
+    period = period_key(window, challenge_id=challenge_id)
+    leaderboard_data = with_ranks(top_entries(scope=window, period=period))
+    my_rank = None
+    if request.user.is_authenticated:
+        my_rank = user_rank(request.user.id, scope=window, period=period)
+
+    return render(request, 'leaderboard.html', {
+        'leaderboard': leaderboard_data,
+        'window': window,
+        'windows': LeaderboardBucket.SCOPE_CHOICES,
+        'challenge': challenge,
+        'my_rank': my_rank,
+    })
 
 # Детали челленджа
 @login_required
@@ -93,63 +149,47 @@ def challenge_detail(request, challenge_id):
     """Детали конкретного челленджа"""
     challenge = get_object_or_404(Challenge, id=challenge_id)
     tasks = challenge.tasks.all()
-    return render(request, 'challenges/detail.html', {'challenge': challenge, 'tasks': tasks})
+    participant = None
+    completed_tasks = set()
+    if request.user.is_authenticated:
+        participant = Participant.objects.filter(user=request.user, challenge=challenge).first()
+        completed_tasks = set(CompletedItem.objects.filter(
+            user=request.user, challenge=challenge, kind=CompletedItem.KIND_TASK
+        ).values_list('object_id', flat=True))
+    return render(request, 'challenges/detail.html', {
+        'challenge': challenge,
+        'tasks': tasks,
+        'participant': participant,
+        'completed_tasks': completed_tasks,
+    })
+
+@login_required
+@require_POST
+def complete_task(request, task_id):
+    """Отметка задания челленджа выполненным для текущего пользователя"""
+    task = get_object_or_404(ChallengeTask.objects.only('id', 'challenge_id'), id=task_id)
+    participation.complete(request.user.id, task.challenge_id, CompletedItem.KIND_TASK, task.id)
+    return redirect('challenge_detail', challenge_id=task.challenge_id)
 
 # Присоединение к челленджу
 @login_required
 def join_challenge(request, challenge_id):
     """Присоединение пользователя к челленджу"""
-    challenge = get_object_or_404(Challenge, id=challenge_id)
-
-    participant, created = Participant.objects.get_or_create(user=request.user, challenge=challenge)
+    challenge = get_object_or_404(Challenge.objects.only('id', 'title', 'kind'), id=challenge_id)
 
-    # Проверка, если это аудиочеллендж
-    if AudioChallenge.objects.filter(challenge=challenge).exists():
-        # Если это аудиочеллендж, редиректим на его страницу
-        redirect_url = 'audio_challenge_list'
-    elif challenge.quizzes.exists():
-        # Если есть квизы, редиректим на список квизов
-        redirect_url = 'quiz_list'  
-    else:
-        redirect_url = 'book_selection'
-
-    if created:
+    if participation.join(request.user.id, challenge.id):
         messages.success(request, f'Вы успешно присоединились к челленджу: {challenge.title}')
     else:
         messages.info(request, f'Вы уже участвуете в челлендже: {challenge.title}')
 
-    return redirect(redirect_url, challenge_id=challenge.id)
+    # Аудиочеллендж -> список аудио, есть квизы -> список квизов, иначе выбор книги
+    return redirect(participation.JOIN_REDIRECTS[challenge.kind], challenge_id=challenge.id)
 
 @login_required
 def get_daily_coupon(request):
-    coupon, created = DailyCoupon.objects.get_or_create(id=1)
-
-    if created or coupon.last_updated is None:
-        coupon.last_updated = timezone.now()
-        coupon.save()
-
-    # Если прошло больше 24 часов, обновляем купон
-    if coupon.is_new_day():
-        coupon.code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
-
-        # Генерация случайной скидки (например, 5%, 10%, 15% или 20%)
-        coupon.discount = random.choice([5.0, 10.0, 15.0, 20.0])
-
-        # Обновляем время последнего обновления
-        coupon.last_updated = timezone.now()
-        coupon.save()
-
-    time_since_last_update = timezone.now() - coupon.last_updated
-    time_until_next_update_seconds = 24 * 3600 - time_since_last_update.total_seconds()
-
-    if time_until_next_update_seconds < 3600:
-        time_until_next_update = int(time_until_next_update_seconds // 60) 
-        time_label = f"Осталось {time_until_next_update} минут"
-    else:
-        time_until_next_update = int(time_until_next_update_seconds // 3600) 
-        time_label = f"Осталось {time_until_next_update} часов"
-
-    return render(request, 'coupon_page.html', {'coupon': coupon, 'time_label': time_label})
+    # Личный код из пула; если пул пуст — общий купон дня
+    coupon = coupons.pool.claim(request.user) or coupons.current()
+    return render(request, 'coupon_page.html', {'coupon': coupon, 'time_label': coupons.time_label(coupon)})
 
 
 # Выбор книг для челленджа
@@ -161,7 +201,12 @@ def book_selection(request, challenge_id):
 
     # Обработка нескольких форм на одной странице
     form_book = BookSelectionForm(request.POST or None)
-    form_quiz = QuizAnswerForm(request.POST or None)
+    quiz = None
+    quiz_id = request.POST.get('quiz_id', '')
+    if 'submit_quiz' in request.POST and quiz_id.isdigit():
+        quiz = get_object_or_404(Quiz, id=quiz_id, challenge=challenge)
+    answer_key = quiz_keys.get_answer_key(quiz.id) if quiz else None
+    form_quiz = QuizAnswerForm(request.POST or None, answer_key=answer_key)
 
     if request.method == 'POST':
         if 'submit_book' in request.POST and form_book.is_valid():
@@ -169,10 +214,16 @@ def book_selection(request, challenge_id):
             return redirect('book_detail', book_id=book.id)
 
         elif 'submit_quiz' in request.POST and form_quiz.is_valid():
-            user_answers = form_quiz.cleaned_data['answers']
-            correct_answers = Answer.objects.filter(question__quiz=quiz, is_correct=True)
-            correct_ids = [str(answer.id) for answer in correct_answers]
-            success = set(user_answers) == set(correct_ids)
+            # Попытка записывается так же, как в quiz_view: по ней засчитывается квиз и считается статистика
+            success = answer_key.is_correct(form_quiz.cleaned_data['answers'])
+            results = answer_key.question_results(form_quiz.cleaned_data['answers'])
+            attempts.record(QuizAttempt(
+                user_id=request.user.id,
+                quiz_id=quiz.id,
+                passed=success,
+                correct_questions=sum(results.values()),
+                total_questions=len(results),
+            ))
 
             return render(request, "quiz/quiz_complete.html", {"quiz": quiz, "success": success})
 
@@ -183,16 +234,40 @@ def book_selection(request, challenge_id):
         'form_quiz': form_quiz,
     })
 
-# Детали книги
+# Детали книги: первая страница читалки
 def book_detail(request, book_id):
-    book = get_object_or_404(Book, id=book_id)
-    coupon_images = book.challenge.coupon_images.all()  
+    return book_page(request, book_id, 1)
+
+
+def book_page(request, book_id, number):
+    """Страница книги: читается только её фрагмент, полный текст из базы не загружается"""
+    book = get_object_or_404(Book.objects.defer('full_text', 'description'), id=book_id)
+    page = get_object_or_404(BookPage.objects.only('number', 'heading', 'html'), book_id=book.id, number=number)
+    coupon_images = CouponImage.objects.filter(challenge_id=book.challenge_id)
     return render(request, 'challenges/book_detail.html', {
         'book': book,
-        'coupon_images': coupon_images  
+        'page': page,
+        'previous_number': number - 1 if number > 1 else None,
+        'next_number': number + 1 if number < book.page_count else None,
+        'toc': book_pages.table_of_contents(book.id),
+        'coupon_images': coupon_images,
+        'heartbeat_interval': reading.HEARTBEAT_INTERVAL,
     })
 
 
+@login_required
+@require_POST
+def book_heartbeat(request, book_id):
+    """Пульс читалки: сколько секунд пользователь читал с прошлого пульса. В базу не пишет"""
+    try:
+        seconds = int(request.POST.get('seconds', 0))
+        page = max(int(request.POST.get('page', 1)), 1)
+    except ValueError:
+        return JsonResponse({'status': 'error'}, status=400)
+    reading.heartbeat(request.user.id, book_id, seconds, page)
+    return JsonResponse({'status': 'ok'})
+
+
 # Список квизов
 @login_required
 def quiz_list(request, challenge_id):
@@ -205,23 +280,36 @@ def quiz_list(request, challenge_id):
 @login_required
 def quiz_view(request, quiz_id):
     """Прохождение квиза"""
-    quiz = get_object_or_404(Quiz, id=quiz_id)
+    quiz = get_object_or_404(Quiz.objects.select_related('challenge'), id=quiz_id)
+    # Ленивые querysets: выполняются, только если фрагмент с вопросами не найден в кэше
+    questions = quiz.questions.prefetch_related('answers')
     coupon_images = quiz.challenge.coupon_images.all()
-    form = QuizAnswerForm(request.POST or None)
+    answer_key = quiz_keys.get_answer_key(quiz.id) if request.method == "POST" else None
+    form = QuizAnswerForm(request.POST or None, answer_key=answer_key)
     success = None
 
     if request.method == "POST" and form.is_valid():
-        user_answers = form.cleaned_data['answers']
-        user_answer_ids = [str(answer.id) for answer in user_answers]
-
-        correct_answers = Answer.objects.filter(question__quiz=quiz, is_correct=True)
-        correct_ids = [str(answer.id) for answer in correct_answers]
-
-        success = set(user_answer_ids) == set(correct_ids)
+        # И проверка формы, и правильные ответы берутся из закэшированного ключа квиза, а не из базы
+        success = answer_key.is_correct(form.cleaned_data['answers'])
+        results = answer_key.question_results(form.cleaned_data['answers'])
+        attempts.record(QuizAttempt(
+            user_id=request.user.id,
+            quiz_id=quiz.id,
+            passed=success,
+            correct_questions=sum(results.values()),
+            total_questions=len(results),
+        ))
 
         return render(request, "quiz/quiz_complete.html", {"quiz": quiz, "success": success})
 
-    return render(request, "quiz/quiz.html", {"quiz": quiz, 'form': form, "success": success, "coupon_images": coupon_images})
+    return render(request, "quiz/quiz.html", {
+        "quiz": quiz,
+        "questions": questions,
+        "quiz_version": quiz_keys.current_version(quiz.id),
+        'form': form,
+        "success": success,
+        "coupon_images": coupon_images,
+    })
 
 # Универсальная обработка ошибок
 def handle_404(request, exception):
@@ -246,15 +334,20 @@ def audio_challenge_detail(request, audiochallenge_id):
 
     if request.method == 'POST':
         form = AudioChallengeForm(request.POST, questions=questions)
-        correct = 0
-        total = questions.count()
+        total = len(questions)
 
         if form.is_valid():
-            for question in questions:
-                user_answer = form.cleaned_data.get(f'answer_{question.id}', '').strip().lower()
-                if user_answer == question.correct_answer.lower():
-                    correct += 1
-
+            correct = answer_matching.grade(questions, {
+                question.id: form.cleaned_data.get(f'answer_{question.id}', '') for question in questions
+            })
+
+            attempts.record(AudioAttempt(
+                user_id=request.user.id,
+                audio_challenge_id=challenge.id,
+                passed=total > 0 and correct == total,
+                correct=correct,
+                total=total,
+            ))
             request.session['audio_success'] = {'correct': correct, 'total': total}
             return redirect('audio_challenge_success', audiochallenge_id=challenge.id)
     else:
@@ -269,9 +362,11 @@ def audio_challenge_detail(request, audiochallenge_id):
 @login_required
 def audio_challenge_success(request, audiochallenge_id):
     results = request.session.get('audio_success', {'correct': 0, 'total': 0})
+    challenge = get_object_or_404(AudioChallenge.objects.only('id', 'challenge_id'), id=audiochallenge_id)
     return render(request, 'audio_challenge/audio_challenge_success.html', {
         'correct': results['correct'],
-        'total': results['total']
+        'total': results['total'],
+        'coupon': CouponImage.objects.filter(challenge_id=challenge.challenge_id).order_by('id').first(),
     })
 
 @login_required
@@ -285,4 +380,34 @@ def support_chat(request):
             message.save()
             form = SupportMessageForm() 
 
-    return render(request, 'support/chat_modal.html', {'form': form})
+    support_messages = []
+    if request.user.is_authenticated:
+        support_messages = (
+            SupportMessage.objects.filter(user=request.user).prefetch_related('responses').order_by('-created_at')[:20]
+        )
+    last_response_id = max(
+        (response.id for message in support_messages for response in message.responses.all()), default=0
+    )
+    return render(request, 'support/chat_modal.html', {
+        'form': form, 'support_messages': support_messages, 'last_response_id': last_response_id,
+    })
+
+
+async def support_stream(request):
+    """SSE с ответами поддержки для владельца сообщений; под ASGI соединение не занимает поток.
+
+    Продолжаем с Last-Event-ID (переподключение EventSource), иначе с ?after= со страницы чата,
+    иначе только новые ответы.
+    """
+    user_id = await sync_to_async(lambda: request.user.pk if request.user.is_authenticated else None)()
+    if user_id is None:
+        return HttpResponse(status=401)
+    after = request.headers.get('Last-Event-ID') or request.GET.get('after')
+    try:
+        after = int(after)
+    except (TypeError, ValueError):
+        after = await support_events.last_response_id(user_id)
+    response = StreamingHttpResponse(support_events.stream(user_id, after), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx не должен копить поток в буфере
+    return response
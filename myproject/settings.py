@@ -90,6 +90,20 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Кэш должен быть общим для всех процессов: по версиям в нём воркеры узнают, что ключ проверки
+# квиза, фрагмент каталога или манифест картинки устарели (challenges.quiz_keys, catalog, images).
+# Локальный LocMemCache по умолчанию у каждого процесса свой. Для нескольких машин — Redis/Memcached.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'var' / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},  # По умолчанию 300: ключи квизов и карточки вытесняли бы друг друга
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators